@@ -1,14 +1,63 @@
 import os
 import json
-from crewai import Task, Agent, Crew, Process
-from crewai_tools import SerperDevTool
-from models import google_model
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pydantic import BaseModel, Field, ValidationError
+from typing import Type
+from load_shedding import CAPPED_ITERATIONS, LEVELS, LITE_MODEL, NO_REVIEWER, shedder_from_env
+import metrics
+from models import create_llms, google_model, stream_completion, take_prompt_tokens
+from response_cache import ResponseCache
+from search_cache import SearchCache
+from single_flight import SingleFlight
+from stage_outputs import (
+    BatchSentiment, BatchSentimentItem, FastReply, SentimentAnalysis,
+    parse_json_output, repair_stage_output, structured_output,
+)
+from sentiment_service import get_sentiment_service
 
 # Hardcode Serper API key
 os.environ["SERPER_API_KEY"] = "7142a72718b003f3142427769de226076a5429ff"
 
-# Assign serper tool to a variable
-web_search = SerperDevTool()
+# Web search results are cached per product (see search_cache.py)
+search_cache = SearchCache.from_env()
+metrics.register(metrics.CallbackMetric(
+    "search_cache_events_total", "Product search cache lookups and backend fetches", "counter", ("result",),
+    lambda: {(name,): value for name, value in search_cache.stats().items() if name != "entries"},
+))
+
+
+class ProductSearchSchema(BaseModel):
+    search_query: str = Field(..., description="Mandatory search query you want to use to search the internet")
+
+
+_product_search_tool_class = None
+
+
+def product_search_tool():
+    """A new ProductSearchTool: web search bound to the current review's product, answered from search_cache"""
+    global _product_search_tool_class
+    if _product_search_tool_class is None:
+        # crewai_tools takes seconds to import, so the class is defined with the first crew
+        from crewai_tools import BaseTool
+
+        class ProductSearchTool(BaseTool):
+            name: str = SEARCH_TOOL_NAME
+            description: str = SEARCH_TOOL_DESCRIPTION
+            args_schema: Type[BaseModel] = ProductSearchSchema
+            product: str = ""
+
+            def _run(self, search_query: str, **kwargs) -> str:
+                try:
+                    return search_cache.get(self.product or search_query)
+                except Exception as e:
+                    return f"Search is unavailable right now: {e}"
+
+        _product_search_tool_class = ProductSearchTool
+    return _product_search_tool_class()
+
 
 # Customer service information
 customer_service_contact = {
@@ -69,180 +118,1048 @@ common_response_guidelines = [
     "End with a positive, open note: 'Let us know if you need anything!'",
 ]
 
-def run_agent(agent_input):
-    # Defining Agents
-    name = agent_input.get("cust_name", "")
-    purch_date = agent_input.get("purch_date", "")
-    product = agent_input.get("product", "")
-    review = agent_input.get("review", "")
 
-    sentiment_agent = Agent(
-        role="Sentiment Analysis Agent",
-        goal=(
+def _escape_braces(text):
+    # Crew.kickoff(inputs=...) formats task and agent text with str.format
+    return text.replace("{", "{{").replace("}", "}}")
+
+
+# Prompt text shared by the single-review and batch crews
+SENTIMENT_OUTPUT = json.dumps({
+    "sentiment": "Positive, Negative, or Neutral",
+    "emotion": "e.g., happy, sad, angry, excited"
+}, indent=2)
+
+SENTIMENT_REVIEW_OUTPUT = json.dumps({
+    "sentiment": "Positive, Negative, or Neutral",
+    "emotion": "e.g., happy, sad, angry, excited",
+    "review": "Explanation of validation or adjustments"
+}, indent=2)
+
+SENTIMENT_GUIDELINES = (
+    "Follow sentiment-specific guidelines:\n"
+    f"- Positive: {', '.join(positive_considerations)}\n"
+    f"- Negative: {', '.join(negative_considerations)}\n"
+    f"- Neutral: {', '.join(neutral_considerations)}\n"
+    f"Expectations:\n"
+    f"- Positive: {', '.join(positive_expectations)}\n"
+    f"- Negative: {', '.join(negative_expectations)}\n"
+    f"- Neutral: {', '.join(neutral_expectations)}"
+)
+
+# Once the sentiment is known the response prompt carries only its own block
+GUIDELINE_BLOCKS = {
+    sentiment: (
+        f"Follow the {sentiment.lower()} sentiment guidelines: {', '.join(considerations)}\n"
+        f"Expectations: {', '.join(expectations)}"
+    )
+    for sentiment, considerations, expectations in (
+        ("Positive", positive_considerations, positive_expectations),
+        ("Negative", negative_considerations, negative_expectations),
+        ("Neutral", neutral_considerations, neutral_expectations),
+    )
+}
+
+RESPONSE_DESCRIPTION = (
+    "Customer information provided: name:'{cust_name}', product:'{product}', purchasedate:'{purch_date}'. "
+    "Generate a tailored response for the review: '{review}'. "
+    "Sentiment analysis of the review: {sentiment_analysis}\n"
+    "{guidelines}"
+)
+
+RESPONSE_OUTPUT = (
+    "A response string with the following characteristics:\n"
+    f"- {', '.join(common_response_guidelines)}\n"
+    "- Reflects the sentiment (Positive, Negative, or Neutral).\n"
+    "- Incorporates empathy and solutions (if negative).\n"
+    "- If necessary, search Amazon for product details."
+)
+
+REVIEWER_DESCRIPTION = (
+    "Customer information provided: name:'{cust_name}', product:'{product}', purchasedate:'{purch_date}'. "
+    "Represent the Amazon Customer Service Team to refine the response. "
+    "Review the response for the input: '{review}'. "
+    "Ensure empathy, clarity, and alignment with Amazon standards. "
+    "Sentiment analysis of the review: {sentiment_analysis}"
+)
+
+REVIEWER_OUTPUT = (
+    "A polished empathetic response string with the following characteristics:\n"
+    f"- {', '.join(common_response_guidelines)}\n"
+    "- Addresses sentiment and emotion, within 30-50 words.\n"
+    "- For negative sentiment, includes solutions (e.g., new product for faulty items, delivery review for delays).\n"
+    "- For positive sentiment, invites repeat shopping with light humor.\n"
+    f"- Includes contact details: {customer_service_contact['name']}, "
+    f"{customer_service_contact['email']}, {customer_service_contact['phone']}.\n"
+    "- If needed, includes a link to product recommendations or solutions from Amazon or web searches."
+    " Ends with a warm, positive thank-you note"
+)
+
+# "standard" profile: sentiment analysis and its review in one task
+STANDARD_SENTIMENT_DESCRIPTION = (
+    "Analyze the sentiment of the text: '{review}'. "
+    "Classify as Positive, Negative, or Neutral. "
+    "Identify the dominant emotion expressed. "
+    "Validate the classification and emotion against the text’s tone before answering."
+)
+
+# "fast" profile: one call returns sentiment, emotion and the final reply
+FAST_DESCRIPTION = (
+    "Customer information provided: name:'{cust_name}', product:'{product}', purchasedate:'{purch_date}'. "
+    "Classify the sentiment of the review: '{review}' as Positive, Negative, or Neutral, "
+    "identify the dominant emotion, then write the final reply to the customer. "
+    + SENTIMENT_GUIDELINES
+    + "\nThe reply must have the following characteristics:\n"
+    f"- {', '.join(common_response_guidelines)}\n"
+    "- For negative sentiment, includes solutions (e.g., new product for faulty items, delivery review for delays).\n"
+    f"- Includes contact details: {customer_service_contact['name']}, "
+    f"{customer_service_contact['email']}, {customer_service_contact['phone']}.\n"
+    "- Ends with a warm, positive thank-you note"
+)
+
+FAST_OUTPUT = json.dumps({
+    "sentiment": "Positive, Negative, or Neutral",
+    "emotion": "e.g., happy, sad, angry, excited",
+    "reply": "The final reply to the customer"
+}, indent=2)
+
+BATCH_SENTIMENT_OUTPUT = json.dumps([{
+    "index": "index of the review in the input list",
+    "sentiment": "Positive, Negative, or Neutral",
+    "emotion": "e.g., happy, sad, angry, excited"
+}], indent=2)
+
+BATCH_SENTIMENT_REVIEW_OUTPUT = json.dumps([{
+    "index": "index of the review in the input list",
+    "sentiment": "Positive, Negative, or Neutral",
+    "emotion": "e.g., happy, sad, angry, excited",
+    "review": "Explanation of validation or adjustments"
+}], indent=2)
+
+SENTIMENT_DESCRIPTION = (
+    "Analyze the sentiment of the text: '{review}'. "
+    "Classify as Positive, Negative, or Neutral. "
+    "Identify the dominant emotion expressed."
+)
+
+SENTIMENT_REVIEW_DESCRIPTION = (
+    "Review the sentiment analysis for accuracy and contextual relevance. "
+    "Validate the emotion to ensure it reflects the text’s tone. "
+    "Adjust classifications if discrepancies are found."
+)
+
+BATCH_SENTIMENT_DESCRIPTION = (
+    "Analyze the sentiment of each review in this JSON list: {reviews}. "
+    "Classify each as Positive, Negative, or Neutral. "
+    "Identify the dominant emotion expressed in each. "
+    "Return exactly one entry per review, keeping its index."
+)
+
+BATCH_SENTIMENT_REVIEW_DESCRIPTION = (
+    "Review the sentiment analysis of every review for accuracy and contextual relevance. "
+    "Validate each emotion to ensure it reflects the text’s tone. "
+    "Adjust classifications if discrepancies are found. "
+    "Return exactly one entry per review, keeping its index."
+)
+
+SEARCH_TOOL_NAME = "Search the internet"
+SEARCH_TOOL_DESCRIPTION = (
+    "Searches the internet for information about the customer's product. "
+    "Results are about the product of the review being answered."
+)
+
+# Role, goal and backstory of each agent; <subject> is filled in by _sentiment_review_agent
+AGENT_PROMPTS = {
+    "sentiment": {
+        "role": "Sentiment Analysis Agent",
+        "goal": (
             "Accurately classify text sentiment as Positive, Negative, or Neutral. "
             "Identify the dominant emotion to guide tailored responses. "
             "Deliver clear and reliable sentiment analysis."
         ),
-        backstory=(
+        "backstory": (
             "Trained on vast datasets of human expression, you excel at nuanced text understanding. "
             "You transform raw feedback into empathetic, actionable insights."
         ),
-        llm=google_model.gemini_2_flash_lite(),
-        verbose=False
-    )
-
-    sentiment_review_agent = Agent(
-        role="Sentiment Review Agent",
-        goal=(
-            f"Review the sentiment and emotion analysis from the review: '{review}'. "
+    },
+    "sentiment_review": {
+        "role": "Sentiment Review Agent",
+        "goal": (
+            "Review the sentiment and emotion analysis from <subject>. "
             "Ensure sentiment analysis is precise and contextually appropriate. "
             "Confirm sentiment as Positive, Negative, or Neutral. "
             "Capture the dominant emotion for response relevance."
         ),
-        backstory=(
+        "backstory": (
             "With years of scrutinizing text analysis, your deep understanding of linguistic nuances "
             "ensures reliable evaluations for meaningful customer interactions."
         ),
-        llm=google_model.gemini_2_flash(),
-        verbose=True,
-        max_iterations=10
-    )
-
-    response_agent = Agent(
-        role="Response Generation Agent",
-        goal=(
+    },
+    "response": {
+        "role": "Response Generation Agent",
+        "goal": (
             "Generate tailored responses for customer reviews based on sentiment and the same language as the review. "
             "Generate empathetic, helpful responses based on sentiment and emotion analysis. "
             "Address concerns appropriately, offering solutions for negative feedback. "
             "Strengthen customer trust and satisfaction."
         ),
-        backstory=(
+        "backstory": (
             "Experienced in customer interactions, you craft meaningful responses reflecting emotions like joy or frustration. "
             "You uphold business values through compassionate replies."
         ),
-        llm=google_model.gemini_2_flash_lite(),
-        max_iterations=25
-    )
-
-    reviewer_agent = Agent(
-        role="Response Reviewer Agent",
-        goal=(
+    },
+    "reviewer": {
+        "role": "Response Reviewer Agent",
+        "goal": (
             "Generate final tailored responses for customer reviews based on sentiment and the same language as the review. "
             "Review and adjust responses for empathy, politeness, and conciseness. "
             "Ensure responses address concerns with effective solutions. "
             "Deliver polished replies within 200-350 words."
         ),
-        backstory=(
+        "backstory": (
             "Your expertise in evaluating customer communications ensures every response meets high standards of empathy and clarity. "
             "You foster trust through thoughtful refinements."
         ),
-        llm=google_model.gemini_2_flash(),
+    },
+    "fast_reply": {
+        "role": "Customer Reply Agent",
+        "goal": (
+            "Classify the sentiment and emotion of a customer review and reply to it in one pass, "
+            "in the same language as the review. "
+            "Deliver empathetic, concise replies that address concerns with effective solutions."
+        ),
+        "backstory": (
+            "You have answered thousands of Amazon reviews and know at a glance how a customer feels. "
+            "You write warm, polished replies that are ready to send."
+        ),
+    },
+}
+
+# Every string that goes into a crew prompt, whatever the profile or degradation level
+PROMPT_TEXTS = [
+    SENTIMENT_OUTPUT, SENTIMENT_REVIEW_OUTPUT, SENTIMENT_GUIDELINES, *GUIDELINE_BLOCKS.values(),
+    RESPONSE_DESCRIPTION, RESPONSE_OUTPUT, REVIEWER_DESCRIPTION, REVIEWER_OUTPUT, STANDARD_SENTIMENT_DESCRIPTION,
+    FAST_DESCRIPTION, FAST_OUTPUT, SENTIMENT_DESCRIPTION, SENTIMENT_REVIEW_DESCRIPTION, BATCH_SENTIMENT_DESCRIPTION,
+    BATCH_SENTIMENT_OUTPUT, BATCH_SENTIMENT_REVIEW_DESCRIPTION, BATCH_SENTIMENT_REVIEW_OUTPUT,
+    SEARCH_TOOL_NAME, SEARCH_TOOL_DESCRIPTION, ProductSearchSchema.model_fields["search_query"].description,
+    *(text for agent in AGENT_PROMPTS.values() for text in agent.values()),
+]
+
+# Fingerprint of the prompt text; cached replies are dropped whenever it changes
+PROMPT_VERSION = hashlib.sha256("\x1f".join(PROMPT_TEXTS).encode("utf-8")).hexdigest()[:16]
+
+# Customer names found in the prompt wording can't be told apart from it in a reply
+response_cache = ResponseCache.from_env(PROMPT_VERSION, fixed_text="\n".join(PROMPT_TEXTS))
+# Crew runs in progress, by response cache key; identical reviews wait for the run already going
+agent_runs = SingleFlight()
+metrics.register(metrics.CallbackMetric(
+    "response_cache_events_total", "Response cache lookups by result", "counter", ("result",),
+    lambda: {(name,): value for name, value in response_cache.stats().items() if name != "entries"},
+))
+
+
+# Picks how much of the pipeline a review can afford before its deadline (see load_shedding.py)
+load_shedder = shedder_from_env()
+# Reasoning iterations per agent once runs are degraded
+DEGRADED_MAX_ITER = int(os.getenv("DEGRADED_MAX_ITER", "3"))
+
+
+def _iteration_cap(level):
+    return {"max_iter": DEGRADED_MAX_ITER} if level >= CAPPED_ITERATIONS else {}
+
+
+def _review_llm(level):
+    # The stages that normally use gemini-2.0-flash
+    return google_model.gemini_2_flash_lite() if level >= LITE_MODEL else google_model.gemini_2_flash()
+
+
+# Agent builders, so every template gets its own agent objects
+def _sentiment_agent(level=0):
+    from crewai import Agent
+
+    return Agent(
+        **AGENT_PROMPTS["sentiment"],
+        llm=google_model.gemini_2_flash_lite(),
+        verbose=False,
+        **_iteration_cap(level)
+    )
+
+
+def _sentiment_review_agent(subject="the review: '{review}'", level=0):
+    from crewai import Agent
+
+    return Agent(
+        role=AGENT_PROMPTS["sentiment_review"]["role"],
+        goal=AGENT_PROMPTS["sentiment_review"]["goal"].replace("<subject>", subject),
+        backstory=AGENT_PROMPTS["sentiment_review"]["backstory"],
+        llm=_review_llm(level),
         verbose=True,
-        tools=[web_search]
+        max_iterations=10,
+        **_iteration_cap(level)
     )
 
-    # Defining Tasks
-    sentiment_task = Task(
-        description=(
-            f"Analyze the sentiment of the text: '{review}'. "
-            "Classify as Positive, Negative, or Neutral. "
-            "Identify the dominant emotion expressed."
-        ),
-        expected_output=json.dumps({
-            "sentiment": "Positive, Negative, or Neutral",
-            "emotion": "e.g., happy, sad, angry, excited"
-        }, indent=2),
-        agent=sentiment_agent
+
+def _response_agent(level=0):
+    from crewai import Agent
+
+    return Agent(
+        **AGENT_PROMPTS["response"],
+        llm=google_model.gemini_2_flash_lite(),
+        max_iterations=25,
+        **_iteration_cap(level)
     )
 
-    sentiment_review_task = Task(
-        description=(
-            "Review the sentiment analysis for accuracy and contextual relevance. "
-            "Validate the emotion to ensure it reflects the text’s tone. "
-            "Adjust classifications if discrepancies are found."
-        ),
-        expected_output=json.dumps({
-            "sentiment": "Positive, Negative, or Neutral",
-            "emotion": "e.g., happy, sad, angry, excited",
-            "review": "Explanation of validation or adjustments"
-        }, indent=2),
-        agent=sentiment_review_agent,
-        context=[sentiment_task]
+
+def _reviewer_agent(search_tool, level=0):
+    from crewai import Agent
+
+    return Agent(
+        **AGENT_PROMPTS["reviewer"],
+        llm=_review_llm(level),
+        verbose=True,
+        tools=[search_tool],
+        **_iteration_cap(level)
     )
 
-    response_task = Task(
-        description=(
-            f"Customer information provided: name:'{name}', product:'{product}', purchasedate:'{purch_date}'. "
-            f"Generate a tailored response for the review: '{review}'. "
-            "Follow sentiment-specific guidelines:\n"
-            f"- Positive: {', '.join(positive_considerations)}\n"
-            f"- Negative: {', '.join(negative_considerations)}\n"
-            f"- Neutral: {', '.join(neutral_considerations)}\n"
-            f"Expectations:\n"
-            f"- Positive: {', '.join(positive_expectations)}\n"
-            f"- Negative: {', '.join(negative_expectations)}\n"
-            f"- Neutral: {', '.join(neutral_expectations)}"
-        ),
-        expected_output=(
-            "A response string with the following characteristics:\n"
-            f"- {', '.join(common_response_guidelines)}\n"
-            "- Reflects the sentiment (Positive, Negative, or Neutral).\n"
-            "- Incorporates empathy and solutions (if negative).\n"
-            "- If necessary, search Amazon for product details."
-        ),
-        agent=response_agent,
-        context=[sentiment_task, sentiment_review_task]
+
+def _fast_reply_agent():
+    from crewai import Agent
+
+    return Agent(
+        **AGENT_PROMPTS["fast_reply"],
+        llm=google_model.gemini_2_flash_lite(),
+        verbose=False
     )
 
-    reviewer_task = Task(
-        description=(
-            f"Customer information provided: name:'{name}', product:'{product}', purchasedate:'{purch_date}'. "
-            "Represent the Amazon Customer Service Team to refine the response. "
-            f"Review the response for the input: '{review}'. "
-            "Ensure empathy, clarity, and alignment with Amazon standards."
-        ),
-        expected_output=(
-            "A polished empathetic response string with the following characteristics:\n"
-            f"- {', '.join(common_response_guidelines)}\n"
-            "- Addresses sentiment and emotion, within 30-50 words.\n"
-            "- For negative sentiment, includes solutions (e.g., new product for faulty items, delivery review for delays).\n"
-            "- For positive sentiment, invites repeat shopping with light humor.\n"
-            f"- Includes contact details: {customer_service_contact['name']}, "
-            f"{customer_service_contact['email']}, {customer_service_contact['phone']}.\n"
-            "- If needed, includes a link to product recommendations or solutions from Amazon or web searches."
-            " Ends with a warm, positive thank-you note"
+
+class SentimentCrewTemplate:
+    """
+    Sentiment stages built once and reused for every review. Per-request fields are left
+    as {placeholders} that crewai fills in on kickoff. The response stages run afterwards
+    in a ResponseCrewTemplate, so their prompt can be cut down to the detected sentiment.
+    merged=True is the "standard" profile: sentiment analysis and its review in one task.
+    level is the load_shedding degradation level the agents are built for.
+    """
+
+    def __init__(self, merged=False, level=0):
+        from crewai import Crew, Process, Task
+
+        self.degradation = level
+        self.sentiment_agent = _sentiment_agent(level)
+
+        # Defining Tasks
+        if merged:
+            self.sentiment_task = Task(
+                description=STANDARD_SENTIMENT_DESCRIPTION,
+                expected_output=_escape_braces(SENTIMENT_REVIEW_OUTPUT),
+                agent=self.sentiment_agent
+            )
+            # The merged task doubles as the sentiment review
+            self.sentiment_review_task = self.sentiment_task
+            self.stages = {"sentiment_task": self.sentiment_task}
+        else:
+            self.sentiment_review_agent = _sentiment_review_agent(level=level)
+            self.sentiment_task = Task(
+                description=SENTIMENT_DESCRIPTION,
+                expected_output=_escape_braces(SENTIMENT_OUTPUT),
+                agent=self.sentiment_agent
+            )
+            self.sentiment_review_task = Task(
+                description=SENTIMENT_REVIEW_DESCRIPTION,
+                expected_output=_escape_braces(SENTIMENT_REVIEW_OUTPUT),
+                agent=self.sentiment_review_agent,
+                context=[self.sentiment_task]
+            )
+            self.stages = {
+                "sentiment_task": self.sentiment_task,
+                "sentiment_review_task": self.sentiment_review_task,
+            }
+
+        # Crew Setup
+        self.crew = Crew(
+            agents=[task.agent for task in self.stages.values()],
+            tasks=list(self.stages.values()),
+            verbose=not merged,
+            process=Process.sequential
+        )
+
+
+class BatchSentimentTemplate:
+    """Sentiment and sentiment-review stages for a whole list of reviews in two calls"""
+
+    def __init__(self):
+        from crewai import Crew, Process, Task
+
+        self.sentiment_agent = _sentiment_agent()
+        self.sentiment_review_agent = _sentiment_review_agent("every review in the batch")
+
+        self.sentiment_task = Task(
+            description=BATCH_SENTIMENT_DESCRIPTION,
+            expected_output=_escape_braces(BATCH_SENTIMENT_OUTPUT),
+            agent=self.sentiment_agent
+        )
+
+        self.sentiment_review_task = Task(
+            description=BATCH_SENTIMENT_REVIEW_DESCRIPTION,
+            expected_output=_escape_braces(BATCH_SENTIMENT_REVIEW_OUTPUT),
+            agent=self.sentiment_review_agent,
+            context=[self.sentiment_task]
+        )
+
+        self.stages = {
+            "sentiment_task": self.sentiment_task,
+            "sentiment_review_task": self.sentiment_review_task,
+        }
+        self.crew = Crew(
+            agents=[self.sentiment_agent, self.sentiment_review_agent],
+            tasks=[self.sentiment_task, self.sentiment_review_task],
+            verbose=False,
+            process=Process.sequential
+        )
+
+
+class ResponseCrewTemplate:
+    """
+    Response and reviewer stages for one review whose sentiment is already known.
+    They get the sentiment as compact {sentiment_analysis} fields and only the matching
+    {guidelines} block; the reviewer sees the drafted response, not the whole transcript.
+    From the no_reviewer degradation level on, the reviewer stage is left out.
+    """
+
+    def __init__(self, include_reviewer=True, level=0):
+        from crewai import Crew, Process, Task
+
+        self.degradation = level
+        self.response_agent = _response_agent(level)
+        self.search_tool = product_search_tool()
+        self.reviewer_agent = _reviewer_agent(self.search_tool, level)
+
+        self.response_task = Task(
+            description=RESPONSE_DESCRIPTION,
+            expected_output=RESPONSE_OUTPUT,
+            agent=self.response_agent
+        )
+
+        self.reviewer_task = Task(
+            description=REVIEWER_DESCRIPTION,
+            expected_output=REVIEWER_OUTPUT,
+            agent=self.reviewer_agent,
+            context=[self.response_task],
+            tools=[self.search_tool]
+        )
+
+        self.stages = {"response_task": self.response_task}
+        if include_reviewer and level < NO_REVIEWER:
+            self.stages["reviewer_task"] = self.reviewer_task
+        self.crew = Crew(
+            agents=[task.agent for task in self.stages.values()],
+            tasks=list(self.stages.values()),
+            verbose=False,
+            process=Process.sequential
+        )
+
+
+class FastCrewTemplate:
+    """"fast" profile: a single structured call for sentiment, emotion and the final reply"""
+
+    def __init__(self):
+        from crewai import Crew, Process, Task
+
+        self.reply_agent = _fast_reply_agent()
+        self.fast_task = Task(
+            description=FAST_DESCRIPTION,
+            expected_output=_escape_braces(FAST_OUTPUT),
+            agent=self.reply_agent
+        )
+        self.stages = {"fast_task": self.fast_task}
+        self.crew = Crew(
+            agents=[self.reply_agent],
+            tasks=[self.fast_task],
+            verbose=False,
+            process=Process.sequential
+        )
+
+
+# Pipeline profiles, chosen per request or with PIPELINE_PROFILE
+# Each maps to the template (and its arguments) that works out the sentiment;
+# "fast" does everything in that one template.
+PIPELINE_PROFILES = {
+    "full": (SentimentCrewTemplate, False),
+    "standard": (SentimentCrewTemplate, True),
+    "fast": (FastCrewTemplate,),
+}
+DEFAULT_PROFILE = os.getenv("PIPELINE_PROFILE", "full")
+
+# Human-readable stage names for Used_Model
+STAGE_NAMES = {
+    "sentiment_task": "sentiment analysis",
+    "sentiment_review_task": "sentiment review",
+    "response_task": "response generation",
+    "reviewer_task": "reviewer agent",
+    "fast_task": "single-call reply",
+}
+
+LOCAL_SENTIMENT_MODELS = [("sentiment analysis", "local EmotionClassifier")]
+
+# Minimum calibrated confidence for the local classifier to stand in for the LLM sentiment stages
+FAST_SENTIMENT_THRESHOLD = float(os.getenv("FAST_SENTIMENT_THRESHOLD", "0.9"))
+
+
+# Task outputs live on the task objects, so each thread keeps its own templates
+_thread_templates = threading.local()
+
+
+def _get_template(cls, *args):
+    key = cls.__name__ + "".join(f"_{arg}" for arg in args)
+    template = getattr(_thread_templates, key, None)
+    if template is None:
+        template = cls(*args)
+        setattr(_thread_templates, key, template)
+    return template
+
+
+def resolve_profile(profile=None):
+    """Return the pipeline profile to use, falling back to the server default"""
+    profile = (profile or DEFAULT_PROFILE).strip().lower()
+    if profile not in PIPELINE_PROFILES:
+        raise ValueError(
+            f"Unknown pipeline profile '{profile}', expected one of: {', '.join(PIPELINE_PROFILES)}"
+        )
+    return profile
+
+
+def get_crew_template(profile="full", level=0):
+    if profile == "fast":
+        return _get_template(*PIPELINE_PROFILES[profile])
+    return _get_template(*PIPELINE_PROFILES[profile], level)
+
+
+def _build_templates():
+    # Crews are kept per thread, so this builds throwaway ones; what it saves the first
+    # reviews is importing crewai and crewai_tools and setting up their classes
+    for profile in PIPELINE_PROFILES:
+        get_crew_template(profile)
+    _get_template(ResponseCrewTemplate, True, 0)
+
+
+def warm_up_steps():
+    """Steps for warmup.WarmUp, in the order the first review would need them"""
+    return [
+        ("llm_clients", create_llms),
+        ("crew_templates", _build_templates),
+        # Creates SerperDevTool, when that is the search backend
+        ("search_backend", lambda: getattr(search_cache.backend, "tool", None)),
+        ("sentiment_classifier", get_sentiment_service),
+    ]
+
+
+def local_sentiment(review, timings=None):
+    """Sentiment from the in-process classifier, or None when it is missing or not confident enough"""
+    service = get_sentiment_service()
+    if service is None:
+        metrics.fast_path_total.inc(outcome="unavailable")
+        return None
+    start = time.monotonic()
+    analysis = service.classify(review)
+    elapsed = time.monotonic() - start
+    metrics.stage_seconds.observe(elapsed, stage="local_sentiment", profile="")
+    if timings is not None:
+        timings["local_sentiment"] = round(elapsed, 4)
+    if analysis is None or analysis["confidence"] < FAST_SENTIMENT_THRESHOLD:
+        metrics.fast_path_total.inc(outcome="escalated")
+        return None
+    metrics.fast_path_total.inc(outcome="hit")
+    return analysis
+
+
+def guidelines_for(sentiment):
+    """The guideline block for the detected sentiment, or all of them when it is unknown"""
+    return GUIDELINE_BLOCKS.get(str(sentiment or "").strip().capitalize(), SENTIMENT_GUIDELINES)
+
+
+def compact_analysis(analysis):
+    """Just the fields the response stages need, instead of the upstream transcripts"""
+    if analysis.get("sentiment") is None and "raw" in analysis:
+        return analysis["raw"]
+    return json.dumps({"sentiment": analysis.get("sentiment"), "emotion": analysis.get("emotion")}, ensure_ascii=False)
+
+
+def _typed_analysis(analysis):
+    """analysis as a validated SentimentAnalysis dict, or None when the LLM output could not be parsed"""
+    try:
+        return SentimentAnalysis.model_validate(analysis).model_dump(exclude_none=True)
+    except ValidationError:
+        return None
+
+
+def _record_prompt_tokens(timings, stage, profile):
+    tokens = take_prompt_tokens()
+    metrics.stage_prompt_tokens.observe(tokens, stage=stage, profile=profile)
+    timings.setdefault("prompt_tokens", {})[stage] = tokens
+
+
+def _kickoff(template, inputs, profile, timings, emit=None):
+    """
+    Run the template's crew, recording each task's wall time and prompt tokens in timings
+    and in /metrics. With emit, a "stage" event is sent as each task finishes.
+    """
+    last = [time.monotonic()]
+    take_prompt_tokens()
+
+    def finished(stage, output):
+        now = time.monotonic()
+        metrics.stage_seconds.observe(now - last[0], stage=stage, profile=profile)
+        if hasattr(template, "degradation"):
+            load_shedder.observe(stage, template.degradation, now - last[0])
+        timings[stage] = round(now - last[0], 3)
+        _record_prompt_tokens(timings, stage, profile)
+        last[0] = now
+        if emit is not None:
+            emit("stage", {"stage": stage, "output": output.raw})
+
+    for stage_name, task in template.stages.items():
+        task.callback = lambda output, stage=stage_name: finished(stage, output)
+    try:
+        template.crew.kickoff(inputs=inputs)
+    finally:
+        for task in template.stages.values():
+            task.callback = None
+
+
+def _crew_inputs(agent_input):
+    return {
+        "cust_name": agent_input.get("cust_name", ""),
+        "purch_date": agent_input.get("purch_date", ""),
+        "product": agent_input.get("product", ""),
+        "review": agent_input.get("review", ""),
+    }
+
+
+def _bind_search(template, agent_input):
+    """Point the template's search tool at this review's product and start fetching it early"""
+    product = agent_input.get("product", "")
+    template.search_tool.product = product
+    search_cache.prefetch(product)
+
+
+def _stage_models(stages):
+    return [(STAGE_NAMES[name], task.agent.llm.model) for name, task in stages.items()]
+
+
+def _result(agent_input, sentiment, sentiment_review, response, reviewed_response, profile, models, timings,
+            analysis=None, degradation=0):
+    timings = dict(timings)
+    prompt_tokens = timings.pop("prompt_tokens", {})
+    return {
+        "name": agent_input.get("cust_name", ""),
+        "purchase_date": agent_input.get("purch_date", ""),
+        "product": agent_input.get("product", ""),
+        "review": agent_input.get("review", ""),
+        "sentiment": sentiment,
+        "sentiment_review": sentiment_review,
+        "analysis": analysis,
+        "response": response,
+        "reviewed_response": reviewed_response,
+        "Used_Model": ", ".join(
+            [f"profile: {profile}"] + [f"for {stage}: {model}" for stage, model in models]
         ),
-        agent=reviewer_agent,
-        context=[sentiment_task, sentiment_review_task, response_task],
-        tools=[web_search]
+        "degradation": LEVELS[degradation],
+        "timings": timings,
+        "prompt_tokens": prompt_tokens
+    }
+
+
+def _response_inputs(agent_input, analysis):
+    inputs = _crew_inputs(agent_input)
+    inputs["sentiment_analysis"] = compact_analysis(analysis)
+    inputs["guidelines"] = guidelines_for(analysis.get("sentiment"))
+    return inputs
+
+
+def _llm_sentiment(agent_input, profile, timings, emit=None, level=0):
+    """
+    Run the profile's LLM sentiment stages.
+    Returns (analysis, sentiment output, sentiment review output, models used).
+    """
+    template = get_crew_template(profile, level)
+    _kickoff(template, _crew_inputs(agent_input), profile, timings, emit)
+    sentiment = template.sentiment_task.output.raw
+    sentiment_review = template.sentiment_review_task.output.raw
+    # Prefer the reviewed classification; output that can't be repaired is passed on as text
+    parsed = structured_output(
+        [sentiment_review, sentiment], SentimentAnalysis,
+        template.sentiment_review_task.agent.llm, "sentiment_review_task",
     )
+    if parsed is None:
+        analysis = {"sentiment": None, "emotion": None, "raw": sentiment_review}
+    else:
+        analysis = parsed.model_dump(exclude_none=True)
+    return analysis, sentiment, sentiment_review, _stage_models(template.stages)
 
-    # Crew Setup and Execution
-    crew = Crew(
-        agents=[sentiment_agent, sentiment_review_agent, response_agent, reviewer_agent],
-        tasks=[sentiment_task, sentiment_review_task, response_task, reviewer_task],
-        verbose=True,
-        process=Process.sequential
+
+def _respond(agent_input, analysis, sentiment_models, profile, timings=None, sentiment=None, sentiment_review=None,
+             level=0):
+    """
+    Run only the response and reviewer stages for a review whose sentiment is known.
+    sentiment and sentiment_review are the upstream stage outputs to report, if any.
+    """
+    timings = {} if timings is None else timings
+    template = _get_template(ResponseCrewTemplate, True, level)
+    inputs = _response_inputs(agent_input, analysis)
+    _bind_search(template, agent_input)
+    _kickoff(template, inputs, profile, timings)
+
+    response = template.response_task.output.raw
+    return _result(
+        agent_input,
+        sentiment or compact_analysis(analysis),
+        sentiment_review or json.dumps(analysis, ensure_ascii=False),
+        response,
+        template.reviewer_task.output.raw if "reviewer_task" in template.stages else response,
+        profile,
+        sentiment_models + _stage_models(template.stages),
+        timings,
+        _typed_analysis(analysis),
+        level,
+    )
+
+
+def _run_fast(agent_input, timings=None):
+    """"fast" profile: one call that returns sentiment, emotion and the reply together"""
+    timings = {} if timings is None else timings
+    template = get_crew_template("fast")
+    _kickoff(template, _crew_inputs(agent_input), "fast", timings)
+    raw = template.fast_task.output.raw
+    parsed = structured_output([raw], FastReply, template.fast_task.agent.llm, "fast_task")
+    if parsed is None:
+        reply = sentiment = raw
+        analysis = None
+    else:
+        reply = parsed.reply
+        analysis = parsed.model_dump(include={"sentiment", "emotion"})
+        sentiment = json.dumps(analysis, ensure_ascii=False)
+    return _result(
+        agent_input, sentiment, sentiment, reply, reply, "fast", _stage_models(template.stages), timings, analysis
     )
 
-    crew.kickoff()
-
-    # Output results
-    result = {
-        "name": name,
-        "purchase_date": purch_date,
-        "product": product,
-        "review": review,
-        "sentiment": sentiment_task.output.raw,
-        "sentiment_review": sentiment_review_task.output.raw,
-        "response": response_task.output.raw,
-        "reviewed_response": reviewer_task.output.raw,
-        "Used_Model": (
-            f"for sentiment analysis: {sentiment_agent.llm.model}, "
-            f"for sentiment review: {sentiment_review_agent.llm.model}, "
-            f"for response generation: {response_agent.llm.model}, "
-            f"for reviewer agent: {reviewer_agent.llm.model}"
+
+RESPONSE_STAGES = ("response_task", "reviewer_task")
+
+
+def run_agent(agent_input):
+    """
+    Reply to one review. agent_input may carry a time.monotonic() "deadline"; the pipeline
+    is degraded as far as needed to meet it, and the result's "degradation" says how far.
+    """
+    profile = resolve_profile(agent_input.get("profile"))
+    timings = {}
+    if profile == "fast":
+        return _run_fast(agent_input, timings)
+    deadline = agent_input.get("deadline")
+
+    # Confident local classification replaces the LLM sentiment stages
+    analysis = local_sentiment(agent_input.get("review", ""), timings)
+    if analysis is not None:
+        level = load_shedder.choose(RESPONSE_STAGES, deadline)
+        result = _respond(agent_input, analysis, LOCAL_SENTIMENT_MODELS, profile, timings, level=level)
+    else:
+        sentiment_stages = list(get_crew_template(profile).stages)
+        level = load_shedder.choose(sentiment_stages + list(RESPONSE_STAGES), deadline)
+        # Start the product search while the sentiment stages run
+        search_cache.prefetch(agent_input.get("product", ""))
+        analysis, sentiment, sentiment_review, sentiment_models = _llm_sentiment(
+            agent_input, profile, timings, level=level
         )
-    }
+        # Check again with what the sentiment stages left of the budget
+        level = load_shedder.choose(RESPONSE_STAGES, deadline, minimum=level)
+        result = _respond(
+            agent_input, analysis, sentiment_models, profile, timings, sentiment, sentiment_review, level=level
+        )
+    metrics.degraded_total.inc(level=LEVELS[level])
+    return result
+
+
+def run_agent_cached(agent_input, lookup=True):
+    """run_agent behind the exact-match response cache; lookup=False when the caller already missed"""
+    agent_input = dict(agent_input, profile=resolve_profile(agent_input.get("profile")))
+    if lookup:
+        start = time.monotonic()
+        cached = response_cache.get(agent_input)
+        if cached is not None:
+            cached["timings"] = {"cache": round(time.monotonic() - start, 4)}
+            cached["prompt_tokens"] = {}
+            return cached
+    start = time.monotonic()
+    result, shared = agent_runs.run(response_cache.key(agent_input), _run_and_cache, agent_input)
+    if shared:
+        coalesced = coalesced_result(result, agent_input, time.monotonic() - start)
+        if coalesced is not None:
+            return coalesced
+        # The shared reply can't be re-addressed to this customer, so they get a run of their own
+        return _run_and_cache(agent_input)
+    return result
+
+
+def _run_and_cache(agent_input):
+    result = run_agent(agent_input)
+    # A reply cut down to meet a deadline isn't kept for later requests
+    if result.get("degradation", "none") == "none":
+        response_cache.put(agent_input, result)
+    return result
+
+
+def coalesced_result(result, agent_input, waited):
+    """
+    Another caller's result for the same review, addressed to this caller's customer;
+    None when its reply mentions the other customer in a way that can't be swapped out.
+    """
+    source_input = dict(agent_input, cust_name=result.get("name", ""), purch_date=result.get("purchase_date", ""))
+    result = response_cache.adapt(result, source_input, agent_input)
+    if result is None:
+        return None
+    metrics.coalesced_total.inc()
+    result["timings"] = {"coalesced": round(waited, 4)}
+    result["prompt_tokens"] = {}
+    return result
+
 
-    return result
\ No newline at end of file
+# Batch processing
+BATCH_CHUNK_SIZE = int(os.getenv("BATCH_CHUNK_SIZE", "25"))
+BATCH_FANOUT_WORKERS = int(os.getenv("BATCH_FANOUT_WORKERS", "8"))
+
+_fanout_pool = None
+_fanout_lock = threading.Lock()
+
+
+def _get_fanout_pool():
+    global _fanout_pool
+    if _fanout_pool is None:
+        with _fanout_lock:
+            if _fanout_pool is None:
+                _fanout_pool = ThreadPoolExecutor(
+                    max_workers=BATCH_FANOUT_WORKERS, thread_name_prefix="batch-response"
+                )
+    return _fanout_pool
+
+
+def _classify_batch(reviews, timings):
+    """Run the batch sentiment crew and return {index: analysis} for the reviews it covered"""
+    template = _get_template(BatchSentimentTemplate)
+    payload = json.dumps([{"index": i, "review": r} for i, r in enumerate(reviews)], ensure_ascii=False)
+    _kickoff(template, {"reviews": payload}, "batch", timings)
+
+    # Prefer the reviewed classification, fall back to the first pass if it is unusable.
+    # Items are validated one by one so a single bad entry doesn't cost the whole chunk.
+    for task in (template.sentiment_review_task, template.sentiment_task):
+        try:
+            items = parse_json_output(task.output.raw)
+        except (ValueError, AttributeError):
+            continue
+        if isinstance(items, dict):
+            items = items.get("items", [items])
+        analyses = {}
+        for item in items if isinstance(items, list) else []:
+            try:
+                parsed = BatchSentimentItem.model_validate(item)
+            except ValidationError:
+                continue
+            analyses[parsed.index] = parsed.model_dump(exclude_none=True)
+        if analyses:
+            metrics.stage_output_total.inc(stage="batch_sentiment_review_task", outcome="valid")
+            return analyses
+
+    repaired = repair_stage_output(
+        template.sentiment_review_task.output.raw, BatchSentiment,
+        template.sentiment_review_task.agent.llm, "batch_sentiment_review_task",
+    )
+    if repaired is None:
+        return {}
+    return {item.index: item.model_dump(exclude_none=True) for item in repaired.items}
+
+
+def run_agent_batch(agent_inputs):
+    """
+    Reply to many reviews at once. Sentiment and sentiment review run once per chunk of
+    BATCH_CHUNK_SIZE reviews, then the response stages run concurrently per review.
+    Reviews on the "fast" profile skip the shared sentiment prompt and make their single call.
+    Returns one result per input in input order; failed items carry an "error" key.
+    """
+    agent_inputs = list(agent_inputs)
+    results = [None] * len(agent_inputs)
+    pool = _get_fanout_pool()
+    futures = {}
+    pending = []
+    for index, agent_input in enumerate(agent_inputs):
+        try:
+            agent_inputs[index] = agent_input = dict(
+                agent_input, profile=resolve_profile(agent_input.get("profile"))
+            )
+        except ValueError as e:
+            results[index] = {"error": str(e)}
+            continue
+        results[index] = response_cache.get(agent_input)
+        if results[index] is not None:
+            continue
+        if agent_input["profile"] == "fast":
+            futures[index] = pool.submit(_run_fast, agent_input)
+            continue
+        timings = {}
+        analysis = local_sentiment(agent_input.get("review", ""), timings)
+        if analysis is not None:
+            futures[index] = pool.submit(
+                _respond, agent_input, analysis, LOCAL_SENTIMENT_MODELS, agent_input["profile"], timings
+            )
+        else:
+            pending.append(index)
+
+    batch_models = [
+        ("batch sentiment analysis", google_model.gemini_2_flash_lite().model),
+        ("batch sentiment review", google_model.gemini_2_flash().model),
+    ]
+
+    for start in range(0, len(pending), BATCH_CHUNK_SIZE):
+        chunk = pending[start:start + BATCH_CHUNK_SIZE]
+        batch_timings = {}
+        try:
+            analyses = _classify_batch([agent_inputs[index].get("review", "") for index in chunk], batch_timings)
+        except Exception as e:
+            for index in chunk:
+                results[index] = {"error": f"Sentiment analysis failed: {e}"}
+            continue
+
+        for offset, index in enumerate(chunk):
+            analysis = analyses.get(offset)
+            if analysis is None:
+                results[index] = {"error": "No sentiment returned for this review."}
+                continue
+            timings = {f"batch_{stage}": seconds for stage, seconds in batch_timings.items() if stage != "prompt_tokens"}
+            # The chunk's prompt is shared by all its reviews
+            timings["prompt_tokens"] = {
+                f"batch_{stage}": tokens for stage, tokens in batch_timings.get("prompt_tokens", {}).items()
+            }
+            futures[index] = pool.submit(
+                _respond, agent_inputs[index], analysis, batch_models, agent_inputs[index]["profile"], timings
+            )
+
+    for index, future in futures.items():
+        try:
+            results[index] = future.result()
+        except Exception as e:
+            results[index] = {"error": str(e)}
+        else:
+            response_cache.put(agent_inputs[index], results[index])
+
+    return results
+
+
+# Streaming
+def _reviewer_messages(template, inputs):
+    """Chat messages for the reviewer stage, built from the same agent and task text the crew uses"""
+    agent = template.reviewer_agent
+    task = template.reviewer_task
+    agent.interpolate_inputs(inputs)
+    task.interpolate_inputs(inputs)
+    context = "\n\n".join(
+        stage.output.raw for name, stage in template.stages.items() if stage.output is not None
+    )
+    # Use product search results if the prefetch already has them, never wait for them
+    search_results = search_cache.peek(inputs.get("product", ""))
+    if search_results:
+        context += f"\n\nWeb search results about the product:\n{search_results}"
+    return [
+        {
+            "role": "system",
+            "content": f"You are {agent.role}. {agent.backstory}\nYour personal goal is: {agent.goal}",
+        },
+        {
+            "role": "user",
+            "content": (
+                f"{task.description}\n\n"
+                f"This is the expected criteria for your final answer: {task.expected_output}\n\n"
+                f"This is the context you're working with:\n{context}\n\n"
+                "Reply with the final response only."
+            ),
+        },
+    ]
+
+
+def run_agent_stream(agent_input, emit):
+    """
+    run_agent that reports progress as it goes: emit("stage", ...) after each crew task,
+    emit("token", ...) for every chunk of the reviewer reply and emit("done", ...) at the end.
+    The reviewer stage is a direct streaming LLM call, so it does not use the search tool.
+    The "fast" profile has a single structured call and only emits "stage" and "done".
+    """
+    agent_input = dict(agent_input, profile=resolve_profile(agent_input.get("profile")))
+    profile = agent_input["profile"]
+    cached = response_cache.get(agent_input)
+    if cached is not None:
+        cached["timings"], cached["prompt_tokens"] = {}, {}
+        emit("stage", {"stage": "cache", "output": cached["sentiment"]})
+        emit("done", {
+            "reviewed_response": cached["reviewed_response"],
+            "timings": {},
+            "prompt_tokens": {},
+            "analysis": cached.get("analysis"),
+        })
+        return cached
+
+    timings = {}
+    if profile == "fast":
+        result = _run_fast(agent_input, timings)
+        emit("stage", {"stage": "fast_task", "output": result["sentiment"]})
+        response_cache.put(agent_input, result)
+        emit("done", {
+            "reviewed_response": result["reviewed_response"],
+            "timings": result["timings"],
+            "prompt_tokens": result["prompt_tokens"],
+            "analysis": result["analysis"],
+        })
+        return result
+
+    search_cache.prefetch(agent_input.get("product", ""))
+    analysis = local_sentiment(agent_input.get("review", ""), timings)
+    if analysis is not None:
+        emit("stage", {"stage": "sentiment_task", "output": json.dumps(analysis, ensure_ascii=False)})
+        sentiment = sentiment_review = None
+        sentiment_models = LOCAL_SENTIMENT_MODELS
+    else:
+        analysis, sentiment, sentiment_review, sentiment_models = _llm_sentiment(agent_input, profile, timings, emit)
+
+    template = _get_template(ResponseCrewTemplate, False)
+    inputs = _response_inputs(agent_input, analysis)
+    _bind_search(template, agent_input)
+    _kickoff(template, inputs, profile, timings, emit)
+
+    chunks = []
+    start = time.monotonic()
+    for text in stream_completion(template.reviewer_agent.llm, _reviewer_messages(template, inputs)):
+        if not chunks:
+            timings["reviewer_first_token"] = round(time.monotonic() - start, 3)
+        chunks.append(text)
+        emit("token", {"text": text})
+    elapsed = time.monotonic() - start
+    metrics.stage_seconds.observe(elapsed, stage="reviewer_task", profile=profile)
+    timings["reviewer_task"] = round(elapsed, 3)
+    _record_prompt_tokens(timings, "reviewer_task", profile)
+
+    result = _result(
+        agent_input,
+        sentiment or compact_analysis(analysis),
+        sentiment_review or json.dumps(analysis, ensure_ascii=False),
+        template.response_task.output.raw,
+        "".join(chunks),
+        profile,
+        sentiment_models + _stage_models(template.stages)
+        + [(STAGE_NAMES["reviewer_task"], template.reviewer_agent.llm.model)],
+        timings,
+        _typed_analysis(analysis),
+    )
+    response_cache.put(agent_input, result)
+    emit("done", {
+        "reviewed_response": result["reviewed_response"],
+        "timings": result["timings"],
+        "prompt_tokens": result["prompt_tokens"],
+        "analysis": result["analysis"],
+    })
+    return result
@@ -1,13 +1,60 @@
-from fastapi import FastAPI
+import os
+
+# Several workers started by `python app.py` share state, and every module must see that before it is imported
+if __name__ == "__main__" and int(os.getenv("APP_WORKERS", "1")) > 1:
+    os.environ.setdefault("SHARED_STATE_DB", "shared_state.db")
+
+from fastapi import FastAPI, Header
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import RedirectResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, RedirectResponse, StreamingResponse
 from pydantic import BaseModel
-from agent_checkpoint import run_agent
+from typing import List, Optional, Union
+from agent_checkpoint import coalesced_result, load_shedder, resolve_profile, response_cache, search_cache, run_agent_batch, run_agent_cached, run_agent_stream, warm_up_steps
+from sentiment_service import close_sentiment_service, get_sentiment_service
+from executor import AgentExecutor, ExecutorClosedError, QueueFullError
+from job_queue import JobQueue
+from single_flight import AsyncSingleFlight
+from warmup import WarmUp
+import metrics
+import asyncio
+import json
+import time
 import uvicorn
 
 app = FastAPI()
 
+# Worker pool that keeps the blocking crew runs off the event loop
+agent_executor = AgentExecutor.from_env()
+metrics.register(metrics.CallbackMetric(
+    "agent_queue_pending", "Admitted crew runs, running or waiting", "gauge", (),
+    lambda: {(): agent_executor.pending},
+))
+# Runs get a smaller share of REQUEST_DEADLINE while reviews queue behind them
+load_shedder.pressure = lambda: (max(0, agent_executor.pending - agent_executor.workers), agent_executor.workers)
+
+# Slow one-off setup, run in the background once the server is up (see warmup.py)
+warm_up = WarmUp(warm_up_steps())
+metrics.register(metrics.CallbackMetric(
+    "warm_up_step_seconds", "Time each start-up warm-up step took", "gauge", ("step",),
+    lambda: {(step,): seconds for step, seconds in warm_up.timings.items()},
+))
+
+# /chat runs in progress by review; duplicates wait for the first instead of taking a worker slot
+chat_runs = AsyncSingleFlight()
+
+# Limits for /chat/batch
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "200"))
+BATCH_TIMEOUT = float(os.getenv("BATCH_TIMEOUT", "600"))
+
+# Reviews queued through /jobs and run by job_worker.py processes
+job_queue = JobQueue.from_env()
+JOBS_MAX_SIZE = int(os.getenv("JOBS_MAX_SIZE", "1000"))
+metrics.register(metrics.CallbackMetric(
+    "review_jobs", "Queued review jobs by status", "gauge", ("status",),
+    lambda: {(status,): count for status, count in job_queue.counts().items()},
+))
+
 # Mount the static directory to serve index.html
 app.mount("/static", StaticFiles(directory="static", html=True), name="static")
 
@@ -26,20 +73,288 @@ class ReviewRequest(BaseModel):
     date: str
     product: str
     review: str
+    profile: Optional[str] = None  # "full", "standard" or "fast"; server default when omitted
+    debug: bool = False  # include a per-stage timing breakdown in the response
 
-@app.post("/chat")
-async def analyze_review(data: ReviewRequest):
-    input_data = {
+class BatchReviewRequest(BaseModel):
+    reviews: List[ReviewRequest]
+    profile: Optional[str] = None  # applies to reviews that don't set their own
+    debug: bool = False
+
+class SentimentRequest(BaseModel):
+    texts: List[str]
+
+class JobStatusRequest(BaseModel):
+    ids: List[str]
+    debug: bool = False
+
+def to_agent_input(data: ReviewRequest, profile: Optional[str] = None) -> dict:
+    # Raises ValueError for an unknown profile
+    return {
         "cust_name": data.name,
         "purch_date": data.date,
         "product": data.product,
-        "review": data.review
+        "review": data.review,
+        "profile": resolve_profile(data.profile or profile)
     }
+
+def record_request(endpoint: str, outcome: str, started: float):
+    metrics.requests_total.inc(endpoint=endpoint, outcome=outcome)
+    metrics.request_seconds.observe(time.monotonic() - started, endpoint=endpoint)
+
+def failure_outcome(e: Exception) -> str:
+    return "timeout" if isinstance(e, asyncio.TimeoutError) else "rejected"
+
+def review_reply(result: dict, debug: bool, timing: Optional[dict] = None, started: Optional[float] = None) -> dict:
+    reply = {
+        "reviewed_response": result["reviewed_response"],
+        "analysis": result.get("analysis"),
+        "degradation": result.get("degradation", "none"),
+    }
+    if debug:
+        reply["timings"] = {**result.get("timings", {}), **(timing or {})}
+        if started is not None:
+            reply["timings"]["total"] = round(time.monotonic() - started, 3)
+        reply["prompt_tokens"] = result.get("prompt_tokens", {})
+        reply["Used_Model"] = result.get("Used_Model")
+    return reply
+
+def overloaded_response(e: Exception):
+    if isinstance(e, QueueFullError):
+        return JSONResponse(
+            status_code=429,
+            content={"error": str(e)},
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    if isinstance(e, ExecutorClosedError):
+        return JSONResponse(status_code=503, content={"error": str(e)}, headers={"Retry-After": "5"})
+    return JSONResponse(status_code=504, content={"error": "Review analysis timed out."})
+
+@app.post("/chat")
+async def analyze_review(data: ReviewRequest, x_deadline_ms: Optional[str] = Header(None)):
+    started = time.monotonic()
+    try:
+        input_data = to_agent_input(data)
+    except ValueError as e:
+        record_request("/chat", "invalid", started)
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    # Time budget for the crew run, from X-Deadline-Ms or REQUEST_DEADLINE; not part of the cache key
+    input_data["deadline"] = load_shedder.deadline(x_deadline_ms)
+    # Cache hits are answered straight away without taking a worker slot; the SQLite tier blocks
+    cached = await asyncio.to_thread(response_cache.get, input_data)
+    if cached is not None:
+        record_request("/chat", "cache_hit", started)
+        return review_reply(cached, data.debug, {"cache": round(time.monotonic() - started, 4)})
+    timing = {}
+    try:
+        pending, shared = chat_runs.join(
+            response_cache.key(input_data),
+            lambda: agent_executor.start(run_agent_cached, input_data, lookup=False, timing=timing),
+        )
+        result = await asyncio.wait_for(pending, timeout=agent_executor.timeout)
+        if shared:
+            coalesced = coalesced_result(result, input_data, time.monotonic() - started)
+            if coalesced is None:
+                # The shared reply can't be re-addressed to this customer, so they get a run of their own
+                shared = False
+                result = await asyncio.wait_for(
+                    agent_executor.start(run_agent_cached, input_data, lookup=False, timing=timing),
+                    timeout=agent_executor.timeout,
+                )
+            else:
+                result = coalesced
+    except (QueueFullError, ExecutorClosedError, asyncio.TimeoutError) as e:
+        record_request("/chat", failure_outcome(e), started)
+        return overloaded_response(e)
+    except Exception as e:
+        record_request("/chat", "error", started)
+        return {"error": str(e)}
+    if shared:
+        record_request("/chat", "coalesced", started)
+        return review_reply(result, data.debug)
+    record_request("/chat", "ok", started)
+    return review_reply(result, data.debug, timing, started)
+
+@app.post("/chat/batch")
+async def analyze_reviews(data: BatchReviewRequest):
+    started = time.monotonic()
+    if len(data.reviews) > BATCH_MAX_SIZE:
+        record_request("/chat/batch", "invalid", started)
+        return JSONResponse(
+            status_code=413,
+            content={"error": f"At most {BATCH_MAX_SIZE} reviews per batch."}
+        )
     try:
-        result = run_agent(input_data)
-        return {"reviewed_response": result["reviewed_response"]}
+        input_data = [to_agent_input(review, data.profile) for review in data.reviews]
+    except ValueError as e:
+        record_request("/chat/batch", "invalid", started)
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    timing = {}
+    try:
+        results = await agent_executor.submit(run_agent_batch, input_data, timeout=BATCH_TIMEOUT, timing=timing)
+    except (QueueFullError, ExecutorClosedError, asyncio.TimeoutError) as e:
+        record_request("/chat/batch", failure_outcome(e), started)
+        return overloaded_response(e)
     except Exception as e:
+        record_request("/chat/batch", "error", started)
         return {"error": str(e)}
+    record_request("/chat/batch", "ok", started)
+    reply = {"results": [
+        {"error": result["error"]} if "error" in result else review_reply(result, data.debug)
+        for result in results
+    ]}
+    if data.debug:
+        reply["timings"] = {**timing, "total": round(time.monotonic() - started, 3)}
+    return reply
+
+# Local classifier only: sentiment and emotion with confidences, no LLM calls
+@app.post("/sentiment")
+async def classify_sentiment(data: SentimentRequest):
+    started = time.monotonic()
+    if len(data.texts) > BATCH_MAX_SIZE:
+        record_request("/sentiment", "invalid", started)
+        return JSONResponse(status_code=413, content={"error": f"At most {BATCH_MAX_SIZE} texts per request."})
+    # Off the event loop, as the first call may still be loading the model
+    service = await asyncio.to_thread(get_sentiment_service)
+    if service is None:
+        record_request("/sentiment", "rejected", started)
+        return JSONResponse(status_code=503, content={"error": "The local sentiment classifier is not available."})
+    # Texts from concurrent requests share the classifier's micro-batches
+    results = await asyncio.gather(*(service.classify_async(text) for text in data.texts))
+    record_request("/sentiment", "ok", started)
+    return {"results": results}
+
+def job_reply(job: dict, debug: bool) -> dict:
+    reply = {key: job[key] for key in ("id", "status", "attempts", "created", "updated")}
+    if "result" in job:
+        reply["result"] = review_reply(job["result"], debug)
+    if "error" in job:
+        reply["error"] = job["error"]
+    return reply
+
+# Queue one review, or {"reviews": [...]}, for job_worker.py; answers with the job ids straight away
+@app.post("/jobs", status_code=202)
+async def enqueue_jobs(data: Union[BatchReviewRequest, ReviewRequest]):
+    started = time.monotonic()
+    reviews = data.reviews if isinstance(data, BatchReviewRequest) else [data]
+    if len(reviews) > JOBS_MAX_SIZE:
+        record_request("/jobs", "invalid", started)
+        return JSONResponse(status_code=413, content={"error": f"At most {JOBS_MAX_SIZE} reviews per request."})
+    try:
+        input_data = [to_agent_input(review, getattr(data, "profile", None)) for review in reviews]
+    except ValueError as e:
+        record_request("/jobs", "invalid", started)
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    ids = await asyncio.to_thread(job_queue.enqueue, input_data)
+    record_request("/jobs", "ok", started)
+    return {"ids": ids}
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str, debug: bool = False):
+    job = await asyncio.to_thread(job_queue.get, job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": f"Unknown job '{job_id}'."})
+    return job_reply(job, debug)
+
+# Status of many jobs at once, in the order asked for
+@app.post("/jobs/status")
+async def jobs_status(data: JobStatusRequest):
+    if len(data.ids) > JOBS_MAX_SIZE:
+        return JSONResponse(status_code=413, content={"error": f"At most {JOBS_MAX_SIZE} ids per request."})
+    jobs = await asyncio.to_thread(job_queue.get_many, data.ids)
+    return {"jobs": [
+        job_reply(jobs[job_id], data.debug) if job_id in jobs else {"id": job_id, "status": "unknown"}
+        for job_id in data.ids
+    ]}
+
+def sse_event(event: str, payload: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+def stream_worker(input_data: dict, emit):
+    try:
+        run_agent_stream(input_data, emit)
+    except Exception as e:
+        emit("error", {"error": str(e)})
+
+# Server-sent events: a "stage" event per finished crew task, "token" events for the reply, then "done"
+@app.post("/chat/stream")
+async def stream_review(data: ReviewRequest):
+    started = time.monotonic()
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+
+    def emit(event, payload):
+        loop.call_soon_threadsafe(queue.put_nowait, (event, payload))
+
+    try:
+        input_data = to_agent_input(data)
+    except ValueError as e:
+        record_request("/chat/stream", "invalid", started)
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    timing = {}
+    try:
+        agent_executor.start(stream_worker, input_data, emit, timing=timing)
+    except (QueueFullError, ExecutorClosedError) as e:
+        record_request("/chat/stream", "rejected", started)
+        return overloaded_response(e)
+
+    async def events():
+        deadline = loop.time() + agent_executor.timeout
+        while True:
+            try:
+                event, payload = await asyncio.wait_for(queue.get(), timeout=max(0, deadline - loop.time()))
+            except asyncio.TimeoutError:
+                record_request("/chat/stream", "timeout", started)
+                yield sse_event("error", {"error": "Review analysis timed out."})
+                return
+            if event == "done":
+                if data.debug:
+                    payload["timings"] = {
+                        **payload.get("timings", {}), **timing, "total": round(time.monotonic() - started, 3)
+                    }
+                else:
+                    payload.pop("timings", None)
+                    payload.pop("prompt_tokens", None)
+            yield sse_event(event, payload)
+            if event in ("done", "error"):
+                record_request("/chat/stream", "ok" if event == "done" else "error", started)
+                return
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Prometheus scrape endpoint
+@app.get("/metrics")
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# Liveness: the process is up and serving
+@app.get("/health/live")
+async def liveness():
+    return {"status": "alive"}
+
+# Readiness: warm-up has finished and the worker pool is accepting reviews
+@app.get("/health/ready")
+async def readiness():
+    status = warm_up.status()
+    if not warm_up.ready or agent_executor.closed:
+        return JSONResponse(status_code=503, content=status)
+    return status
+
+@app.on_event("startup")
+async def start_background_services():
+    # Doesn't wait for the warm-up, so connections are accepted straight away
+    warm_up.start()
+    # Keep search results for recently reviewed products fresh
+    search_cache.start_refresher()
+
+@app.on_event("shutdown")
+def shutdown_executor():
+    agent_executor.shutdown()
+    close_sentiment_service()
 
 # Redirect root to static index.html
 @app.get("/")
@@ -47,4 +362,9 @@ async def serve_index():
     return RedirectResponse(url="/static/index.html")
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    workers = int(os.getenv("APP_WORKERS", "1"))
+    if workers > 1:
+        # Worker processes import the app themselves; SHARED_STATE_DB was defaulted at the top
+        uvicorn.run("app:app", host="0.0.0.0", port=8000, workers=workers)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,406 @@
+"""
+Offline load test for the review pipeline, using mock_llm_server.py instead of Gemini/Ollama.
+
+Replays reviews from the gift-card TSV used in the notebooks (or synthetic ones) at a fixed
+concurrency and reports p50/p95/p99 latency, reviews/sec and a per-stage breakdown:
+
+    python benchmark.py --reviews amazon_reviews_us_Gift_Card_v1_00.tsv --limit 200 --concurrency 8
+    python benchmark.py --synthetic 100 --profile fast --latency-ms 150
+
+By default run_agent is called in this process with every model pointed at a mock server
+started on a background thread. With --url the reviews are posted to a running app.py
+instead (start it with MOCK_LLM_URL set to a mock_llm_server.py to keep it offline).
+
+--import-profile adds how long a fresh interpreter takes to import app.py (python -X
+importtime), with the slowest imports, since that is paid by every new server process.
+
+Record a baseline once, then compare later runs against it; a run that is slower or has
+more errors than the baseline allows exits with status 1:
+
+    python benchmark.py --synthetic 200 --save-baseline benchmark_baseline.json
+    python benchmark.py --synthetic 200 --baseline benchmark_baseline.json
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+# Allowed slowdown before a run counts as a regression, as a fraction of the baseline
+DEFAULT_TOLERANCE = 0.15
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SYNTHETIC_REVIEWS = [
+    "Great gift card, my niece loved it!",
+    "The card arrived late and the code did not work. Very disappointed.",
+    "It's a gift card. It works.",
+    "Easy to order and the recipient was happy. Thank you!",
+    "Worst experience ever, I want a refund for this broken card.",
+    "Nice design, fast delivery, would buy again.",
+    "The balance was lower than what I paid for. Terrible.",
+    "Perfect last minute present.",
+]
+SYNTHETIC_PRODUCTS = ["Amazon.com Gift Card", "Amazon eGift Card - Birthday", "Amazon Gift Card in a Greeting Card"]
+
+
+def read_reviews(path: str, limit: Optional[int] = None) -> List[Dict]:
+    """Requests built from the gift-card review TSV (review_body, product_title, review_date)"""
+    csv.field_size_limit(sys.maxsize)
+    reviews = []
+    with open(path, newline="", encoding="utf-8", errors="replace") as file:
+        for row in csv.DictReader(file, delimiter="\t", quoting=csv.QUOTE_NONE):
+            review = (row.get("review_body") or "").replace("<br />", " ").strip()
+            if not review:
+                continue
+            reviews.append({
+                "name": f"Customer {row.get('customer_id') or len(reviews)}",
+                "date": row.get("review_date") or "",
+                "product": row.get("product_title") or "Gift Card",
+                "review": review,
+            })
+            if limit and len(reviews) >= limit:
+                break
+    return reviews
+
+
+def synthetic_reviews(count: int, seed: int = 0) -> List[Dict]:
+    """Deterministic reviews for runs without the dataset; texts repeat, like real traffic"""
+    rng = random.Random(seed)
+    return [
+        {
+            "name": f"Customer {index}",
+            "date": f"2015-08-{index % 28 + 1:02d}",
+            "product": rng.choice(SYNTHETIC_PRODUCTS),
+            "review": rng.choice(SYNTHETIC_REVIEWS),
+        }
+        for index in range(count)
+    ]
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile, q in [0, 100]"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(q / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def import_profile(module: str = "app", top: int = 10) -> Dict:
+    """
+    Import module in a fresh interpreter with -X importtime. Returns the import time, the
+    process wall time (interpreter start-up included) and the slowest direct imports.
+    """
+    # Run from the current directory, like the server, with this checkout importable
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [BASE_DIR, os.getenv("PYTHONPATH")])))
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"], env=env, capture_output=True, text=True
+    )
+    wall = time.perf_counter() - started
+    if completed.returncode != 0:
+        lines = completed.stderr.strip().splitlines()
+        raise RuntimeError(f"import {module} failed: {lines[-1] if lines else completed.returncode}")
+    seconds, imports = 0.0, []
+    for line in completed.stderr.splitlines():
+        # "import time:  self [us] | cumulative | imported package", indented two spaces per level
+        _, _, fields = line.partition("import time:")
+        parts = fields.split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].rstrip()
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        cumulative = int(parts[1]) / 1e6
+        if name.strip() == module and depth == 0:
+            seconds = cumulative
+        elif depth == 1:
+            imports.append((cumulative, name.strip()))
+    imports.sort(reverse=True)
+    return {
+        "module": module,
+        "seconds": round(seconds, 4),
+        "wall_seconds": round(wall, 4),
+        "slowest": [{"module": name, "seconds": round(value, 4)} for value, name in imports[:top]],
+    }
+
+
+class InProcessTarget:
+    """
+    Calls the pipeline directly, with every model pointed at a mock LLM server. Without the
+    cache that is run_agent, so identical reviews in flight aren't coalesced into one run either.
+    """
+
+    def __init__(self, llm_url: Optional[str], mock_kwargs: Dict, use_cache: bool):
+        self.mock = None
+        if llm_url is None:
+            import mock_llm_server
+
+            self.mock = mock_llm_server.start_in_thread(**mock_kwargs)
+            llm_url = f"http://127.0.0.1:{self.mock.server_address[1]}/v1"
+        # Read at import time by models.py, search_cache.py and response_cache.py
+        os.environ["MOCK_LLM_URL"] = llm_url
+        if os.getenv("SEARCH_BACKEND", "serper").lower() != "file":
+            search_file = os.path.join(tempfile.mkdtemp(prefix="benchmark-"), "search_results.json")
+            with open(search_file, "w", encoding="utf-8") as file:
+                json.dump({}, file)
+            os.environ["SEARCH_BACKEND"] = "file"
+            os.environ["SEARCH_FILE"] = search_file
+
+        from agent_checkpoint import run_agent, run_agent_cached
+
+        self._run = run_agent_cached if use_cache else run_agent
+
+    def __call__(self, review: Dict, profile: Optional[str]) -> Dict:
+        result = self._run({
+            "cust_name": review["name"],
+            "purch_date": review["date"],
+            "product": review["product"],
+            "review": review["review"],
+            "profile": profile,
+        })
+        return {"timings": result.get("timings", {}), "prompt_tokens": result.get("prompt_tokens", {})}
+
+    def close(self):
+        if self.mock is not None:
+            self.mock.shutdown()
+
+
+class HttpTarget:
+    """Posts reviews to a running app.py with debug timings switched on"""
+
+    def __init__(self, url: str, timeout: float = 300.0):
+        self.url = url.rstrip("/") + "/chat"
+        self.timeout = timeout
+
+    def __call__(self, review: Dict, profile: Optional[str]) -> Dict:
+        payload = dict(review, debug=True)
+        if profile:
+            payload["profile"] = profile
+        request = urllib.request.Request(
+            self.url, data=json.dumps(payload).encode("utf-8"), headers={"Content-Type": "application/json"}
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                body = json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            raise RuntimeError(f"HTTP {e.code}") from e
+        if "error" in body:
+            raise RuntimeError(body["error"])
+        return {"timings": body.get("timings", {}), "prompt_tokens": body.get("prompt_tokens", {})}
+
+    def close(self):
+        pass
+
+
+def replay(target, reviews: List[Dict], concurrency: int, profile: Optional[str] = None,
+           warmup: int = 0) -> Dict:
+    """Send every review through target with `concurrency` in flight; the first `warmup` are not counted"""
+    for review in reviews[:warmup]:
+        try:
+            target(review, profile)
+        except Exception:
+            pass
+
+    samples = []
+    lock = threading.Lock()
+
+    def one(review):
+        started = time.perf_counter()
+        try:
+            response = target(review, profile)
+            error = None
+        except Exception as e:
+            response, error = {}, str(e)
+        sample = {
+            "latency": time.perf_counter() - started,
+            "timings": response.get("timings", {}),
+            "prompt_tokens": response.get("prompt_tokens", {}),
+            "error": error,
+        }
+        with lock:
+            samples.append(sample)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, reviews[warmup:]))
+    return summarize(samples, time.perf_counter() - started)
+
+
+def summarize(samples: List[Dict], wall: float) -> Dict:
+    ok = [sample for sample in samples if sample["error"] is None]
+    latencies = [sample["latency"] for sample in ok]
+    stages, tokens = {}, {}
+    for sample in ok:
+        for stage, seconds in sample["timings"].items():
+            if isinstance(seconds, (int, float)):
+                stages.setdefault(stage, []).append(seconds)
+        for stage, count in sample["prompt_tokens"].items():
+            tokens.setdefault(stage, []).append(count)
+    errors = [sample["error"] for sample in samples if sample["error"] is not None]
+    return {
+        "requests": len(samples),
+        "errors": len(errors),
+        # Answered from another request's run, so their latency isn't a crew run's
+        "coalesced": sum(1 for sample in ok if "coalesced" in sample["timings"]),
+        "error_examples": sorted(set(errors))[:5],
+        "wall_seconds": round(wall, 3),
+        "reviews_per_second": round(len(ok) / wall, 3) if wall > 0 else 0.0,
+        "latency": {
+            "mean": round(sum(latencies) / len(latencies), 4) if latencies else 0.0,
+            "p50": round(percentile(latencies, 50), 4),
+            "p95": round(percentile(latencies, 95), 4),
+            "p99": round(percentile(latencies, 99), 4),
+        },
+        "stages": {
+            stage: {
+                "count": len(values),
+                "mean": round(sum(values) / len(values), 4),
+                "p95": round(percentile(values, 95), 4),
+                "prompt_tokens": round(sum(tokens[stage]) / len(tokens[stage]), 1) if stage in tokens else None,
+            }
+            for stage, values in sorted(stages.items())
+        },
+    }
+
+
+def print_report(summary: Dict):
+    latency = summary["latency"]
+    print(f"requests: {summary['requests']}  errors: {summary['errors']}  coalesced: {summary.get('coalesced', 0)}  "
+          f"wall: {summary['wall_seconds']}s  throughput: {summary['reviews_per_second']} reviews/s")
+    print(f"latency (s): mean {latency['mean']}  p50 {latency['p50']}  p95 {latency['p95']}  p99 {latency['p99']}")
+    if summary["stages"]:
+        print(f"{'stage':<32}{'count':>8}{'mean (s)':>12}{'p95 (s)':>12}{'prompt tokens':>16}")
+        for stage, values in summary["stages"].items():
+            prompt_tokens = "" if values["prompt_tokens"] is None else values["prompt_tokens"]
+            print(f"{stage:<32}{values['count']:>8}{values['mean']:>12}{values['p95']:>12}{prompt_tokens:>16}")
+    for error in summary["error_examples"]:
+        print(f"error: {error}")
+    profile = summary.get("import")
+    if profile:
+        print(f"import {profile['module']}: {profile['seconds']}s "
+              f"({profile['wall_seconds']}s with interpreter start-up)")
+        for entry in profile["slowest"]:
+            print(f"  {entry['module']:<30}{entry['seconds']:>10}")
+
+
+def compare(summary: Dict, baseline: Dict, config: Dict, tolerance: Optional[float] = None) -> List[str]:
+    """
+    Regressions of summary against a saved baseline, as human-readable lines. tolerance
+    defaults to the one saved with the baseline.
+    """
+    if tolerance is None:
+        tolerance = baseline.get("tolerance", DEFAULT_TOLERANCE)
+    expected = baseline["summary"]
+    problems = []
+    for key in ("p50", "p95", "p99"):
+        limit = expected["latency"][key] * (1 + tolerance)
+        if summary["latency"][key] > limit:
+            problems.append(f"{key} latency {summary['latency'][key]}s > {round(limit, 4)}s "
+                            f"(baseline {expected['latency'][key]}s)")
+    floor = expected["reviews_per_second"] * (1 - tolerance)
+    if summary["reviews_per_second"] < floor:
+        problems.append(f"throughput {summary['reviews_per_second']} reviews/s < {round(floor, 3)} "
+                        f"(baseline {expected['reviews_per_second']})")
+    if summary.get("import") and expected.get("import"):
+        limit = expected["import"]["seconds"] * (1 + tolerance)
+        if summary["import"]["seconds"] > limit:
+            problems.append(f"import time {summary['import']['seconds']}s > {round(limit, 4)}s "
+                            f"(baseline {expected['import']['seconds']}s)")
+    if summary["errors"] > expected["errors"]:
+        problems.append(f"{summary['errors']} errors (baseline {expected['errors']})")
+    if baseline.get("config") != config:
+        print(f"warning: run settings differ from the baseline's: {baseline.get('config')}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline latency and throughput benchmark for the review pipeline")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--reviews", help="amazon_reviews_us_Gift_Card_v1_00.tsv")
+    source.add_argument("--synthetic", type=int, help="Number of generated reviews to send")
+    parser.add_argument("--limit", type=int, default=100, help="Reviews to read from --reviews")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--warmup", type=int, default=0, help="Leading reviews sent but not measured")
+    parser.add_argument("--profile", default=None, help="Pipeline profile: full, standard or fast")
+    parser.add_argument("--url", default=None, help="Benchmark a running app.py instead of run_agent in-process")
+    parser.add_argument("--llm-url", default=None, help="Use an already running mock server (OpenAI base URL)")
+    parser.add_argument("--cache", action="store_true", help="Keep the response cache on (off by default)")
+    parser.add_argument("--latency-ms", type=float, default=300.0)
+    parser.add_argument("--jitter", type=float, default=0.25)
+    parser.add_argument("--tokens-per-second", type=float, default=100.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--import-profile", action="store_true",
+                        help="Also measure the cold import time of app.py in a fresh interpreter")
+    parser.add_argument("--out", default=None, help="Write the JSON report here")
+    parser.add_argument("--baseline", default=None, help="Fail if this run regresses against the baseline file")
+    parser.add_argument("--save-baseline", default=None, help="Write this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=None,
+                        help=f"Allowed regression, e.g. 0.15; defaults to the baseline's, or {DEFAULT_TOLERANCE}")
+    args = parser.parse_args()
+
+    if args.reviews:
+        reviews = read_reviews(args.reviews, args.limit)
+    else:
+        reviews = synthetic_reviews(args.synthetic, args.seed)
+    if not reviews:
+        parser.error("no reviews to send")
+
+    config = {
+        "source": os.path.basename(args.reviews) if args.reviews else "synthetic",
+        "reviews": len(reviews),
+        "concurrency": args.concurrency,
+        "warmup": args.warmup,
+        "profile": args.profile,
+        "target": "http" if args.url else "in-process",
+        "cache": args.cache,
+        "mock": None if (args.url or args.llm_url) else {
+            "latency_ms": args.latency_ms,
+            "jitter": args.jitter,
+            "tokens_per_second": args.tokens_per_second,
+            "seed": args.seed,
+        },
+    }
+
+    if args.url:
+        target = HttpTarget(args.url)
+    else:
+        target = InProcessTarget(args.llm_url, config["mock"] or {}, use_cache=args.cache)
+    try:
+        summary = replay(target, reviews, args.concurrency, args.profile, args.warmup)
+    finally:
+        target.close()
+
+    if args.import_profile:
+        summary["import"] = import_profile()
+    print_report(summary)
+    report = {"config": config, "summary": summary}
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as file:
+            json.dump(dict(report, tolerance=DEFAULT_TOLERANCE if args.tolerance is None else args.tolerance),
+                      file, indent=2)
+        print(f"baseline saved to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            problems = compare(summary, json.load(file), config, args.tolerance)
+        if problems:
+            for problem in problems:
+                print(f"REGRESSION: {problem}")
+            sys.exit(1)
+        print("no regression against baseline")
+
+
+if __name__ == "__main__":
+    main()
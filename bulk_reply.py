@@ -0,0 +1,256 @@
+"""
+Draft replies for a whole file of reviews with run_agent, without the HTTP API.
+
+    python bulk_reply.py amazon_reviews_us_Gift_Card_v1_00.tsv --out replies.jsonl --workers 8
+    python bulk_reply.py reviews.jsonl --out replies.parquet --pool process --workers 4 \
+        --rate-limit gemini/gemini-2.0-flash=1000 --rate-limit gemini/gemini-2.0-flash-lite=4000
+
+Rows are streamed from TSV (the gift-card format), CSV or JSONL and at most a few per
+worker are in flight, so memory stays flat however large the file is. Each finished reply
+is appended to the JSONL output straight away; rows that failed go to <out>.errors.jsonl.
+Running the same command again skips every row that already has a reply, so a crashed or
+interrupted run resumes where it stopped and only failed rows are retried.
+
+With an output ending in .parquet, replies are checkpointed to <out>.jsonl and converted
+to Parquet (needs pyarrow) once every row is done.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Dict, Iterator, List, Optional, Set
+
+from rate_limit import parse_limits
+from shared_state import shared_state_path
+
+# Accepted column names for each request field, gift-card TSV names first
+FIELD_COLUMNS = {
+    "id": ("review_id", "id"),
+    "cust_name": ("customer_name", "name"),
+    "purch_date": ("review_date", "purchase_date", "date"),
+    "product": ("product_title", "product"),
+    "review": ("review_body", "review", "text"),
+}
+
+# Result fields written for every reply
+OUTPUT_FIELDS = ("id", "name", "purchase_date", "product", "review", "sentiment",
+                 "sentiment_review", "reviewed_response", "Used_Model")
+
+
+def _pick(row: Dict, names) -> str:
+    for name in names:
+        value = row.get(name)
+        if value not in (None, ""):
+            return str(value)
+    return ""
+
+
+def read_rows(path: str) -> Iterator[Dict]:
+    """Yield agent inputs one at a time from a .tsv, .csv or .jsonl file"""
+    extension = os.path.splitext(path)[1].lower()
+    csv.field_size_limit(sys.maxsize)
+    with open(path, newline="", encoding="utf-8", errors="replace") as file:
+        if extension in (".jsonl", ".json"):
+            rows = (json.loads(line) for line in file if line.strip())
+        elif extension == ".tsv":
+            rows = csv.DictReader(file, delimiter="\t", quoting=csv.QUOTE_NONE)
+        else:
+            rows = csv.DictReader(file)
+        for number, row in enumerate(rows, start=1):
+            agent_input = {field: _pick(row, names) for field, names in FIELD_COLUMNS.items()}
+            if not agent_input["review"]:
+                continue
+            agent_input["id"] = agent_input["id"] or f"row-{number}"
+            agent_input["review"] = agent_input["review"].replace("<br />", " ")
+            agent_input["cust_name"] = agent_input["cust_name"] or "Customer"
+            yield agent_input
+
+
+def completed_ids(path: str) -> Set[str]:
+    """Ids already written to a JSONL output, after dropping a half-written last line"""
+    if not os.path.exists(path):
+        return set()
+    with open(path, "rb+") as file:
+        data = file.read()
+        end = data.rfind(b"\n") + 1
+        if end != len(data):
+            # The previous run died mid-write
+            file.truncate(end)
+    done = set()
+    for line in data[:end].splitlines():
+        try:
+            done.add(str(json.loads(line)["id"]))
+        except (ValueError, KeyError, TypeError):
+            continue
+    return done
+
+
+def _init_worker(rate_limits: Dict[str, float]):
+    # Runs once per worker process (or once in this process for the thread pool)
+    import models
+
+    for model, per_minute in rate_limits.items():
+        models.llm_rate_limiter.set_limit(model, per_minute)
+
+
+def process_chunk(rows: List[Dict], profile: Optional[str] = None) -> List[Dict]:
+    """Reply to one chunk of rows; failures come back as {"id", "error"} records"""
+    from agent_checkpoint import run_agent_batch, run_agent_cached
+
+    inputs = [dict(row, profile=row.get("profile") or profile) for row in rows]
+    if len(inputs) == 1:
+        try:
+            results = [run_agent_cached(inputs[0])]
+        except Exception as e:
+            results = [{"error": str(e)}]
+    else:
+        results = run_agent_batch(inputs)
+
+    records = []
+    for row, result in zip(rows, results):
+        if "error" in result:
+            records.append({"id": row["id"], "error": result["error"]})
+        else:
+            record = {field: result.get(field) for field in OUTPUT_FIELDS}
+            record["id"] = row["id"]
+            records.append(record)
+    return records
+
+
+def _chunks(rows: Iterator[Dict], size: int) -> Iterator[List[Dict]]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def run(path: str, out: str, workers: int = 4, pool: str = "thread", chunk_size: int = 1,
+        rate_limits: Optional[Dict[str, float]] = None, profile: Optional[str] = None,
+        limit: Optional[int] = None, progress_every: int = 100) -> Dict:
+    """Reply to every row of path not yet in out; returns counts of done, failed and skipped rows"""
+    rate_limits = rate_limits or {}
+    checkpoint = out if out.endswith(".jsonl") else out + ".jsonl"
+    errors_path = os.path.splitext(checkpoint)[0] + ".errors.jsonl"
+    done = completed_ids(checkpoint)
+
+    skipped = 0
+
+    def pending_rows():
+        nonlocal skipped
+        sent = 0
+        for row in read_rows(path):
+            if row["id"] in done:
+                skipped += 1
+                continue
+            if limit and sent >= limit:
+                return
+            sent += 1
+            yield row
+
+    if pool == "process":
+        # Every process gets its share of each model's limit, unless they share one bucket
+        split = workers if shared_state_path() is None else 1
+        shares = {model: per_minute / split for model, per_minute in rate_limits.items()}
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(shares,))
+    else:
+        _init_worker(rate_limits)
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bulk-reply")
+
+    counts = {"done": 0, "failed": 0}
+    started = time.monotonic()
+    with executor, open(checkpoint, "a", encoding="utf-8") as output, \
+            open(errors_path, "a", encoding="utf-8") as errors:
+
+        def write(records):
+            for record in records:
+                target = errors if "error" in record else output
+                target.write(json.dumps(record, ensure_ascii=False) + "\n")
+                counts["failed" if "error" in record else "done"] += 1
+            output.flush()
+            errors.flush()
+            finished = counts["done"] + counts["failed"]
+            if progress_every and finished // progress_every != (finished - len(records)) // progress_every:
+                rate = finished / max(time.monotonic() - started, 1e-9)
+                print(f"{counts['done']} replied, {counts['failed']} failed, {rate:.2f} rows/s", file=sys.stderr)
+
+        def collect(future):
+            chunk = in_flight.pop(future)
+            try:
+                records = future.result()
+            except Exception as e:
+                # e.g. a worker process that died
+                records = [{"id": row["id"], "error": str(e)} for row in chunk]
+            write(records)
+
+        # Two chunks per worker in flight keeps workers busy without reading ahead
+        in_flight = {}
+        for chunk in _chunks(pending_rows(), chunk_size):
+            if len(in_flight) >= workers * 2:
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    collect(future)
+            in_flight[executor.submit(process_chunk, chunk, profile)] = chunk
+        for future in list(in_flight):
+            collect(future)
+
+    counts["skipped"] = skipped
+    if not out.endswith(".jsonl"):
+        jsonl_to_parquet(checkpoint, out)
+    return counts
+
+
+def jsonl_to_parquet(source: str, destination: str, rows_per_group: int = 5000):
+    """Convert the JSONL checkpoint to Parquet a row group at a time"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SystemExit("Parquet output needs pyarrow (pip install pyarrow); replies are in " + source)
+
+    schema = pa.schema([(field, pa.string()) for field in OUTPUT_FIELDS])
+    with pq.ParquetWriter(destination, schema) as writer, open(source, encoding="utf-8") as file:
+        batch = []
+        for line in file:
+            record = json.loads(line)
+            batch.append({field: None if record.get(field) is None else str(record[field]) for field in OUTPUT_FIELDS})
+            if len(batch) >= rows_per_group:
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                batch = []
+        if batch:
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Draft replies for a file of reviews, resumably")
+    parser.add_argument("input", help="Reviews as .tsv (gift-card format), .csv or .jsonl")
+    parser.add_argument("--out", required=True, help="Output .jsonl, or .parquet to convert at the end")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--pool", choices=("thread", "process"), default="thread")
+    parser.add_argument("--chunk-size", type=int, default=1,
+                        help="Rows per run_agent_batch call; 1 runs each review on its own")
+    parser.add_argument("--rate-limit", action="append", default=[],
+                        help="model=requests_per_minute, repeatable; shared by all workers")
+    parser.add_argument("--profile", default=None, help="Pipeline profile: full, standard or fast")
+    parser.add_argument("--limit", type=int, default=None, help="Stop after this many new rows")
+    args = parser.parse_args()
+
+    try:
+        rate_limits = parse_limits(",".join(args.rate_limit))
+    except ValueError as e:
+        parser.error(str(e))
+    counts = run(
+        args.input, args.out, workers=args.workers, pool=args.pool, chunk_size=args.chunk_size,
+        rate_limits=rate_limits, profile=args.profile, limit=args.limit,
+    )
+    print(f"{counts['done']} replied, {counts['failed']} failed, {counts['skipped']} already done")
+
+
+if __name__ == "__main__":
+    main()
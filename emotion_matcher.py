@@ -0,0 +1,108 @@
+"""
+Keyword and phrase matching for emotion detection, shared by the chat scripts under models/.
+
+All phrases are compiled into one regex built from a character trie, so a text is scanned
+once however many phrases there are. Matching is case-insensitive on whole words.
+"""
+import bisect
+import re
+import threading
+from typing import Dict, Iterable, List, Optional
+
+
+def _trie_pattern(phrases: Iterable[str]) -> str:
+    """Regex source matching any of phrases, sharing common prefixes; longer phrases win"""
+    trie: Dict = {}
+    for phrase in phrases:
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node: Dict) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # A phrase ends here but a longer one may continue; the greedy ? tries the longer one first
+        return "(?:" + body + ")?" if "" in node else body
+
+    return build(trie)
+
+
+class PhraseMatcher:
+    """
+    Maps phrases to labels (e.g. emotions) and finds every label present in a text in one pass.
+    Phrases can be added at any time; the regex is rebuilt on the next match.
+    """
+
+    def __init__(self, phrases: Optional[Dict[str, Iterable[str]]] = None):
+        self._labels: Dict[str, List[str]] = {}
+        # Labels in the order they were first added, for tie-breaking
+        self._order: Dict[str, int] = {}
+        # (regex, phrase -> labels) as of the last rebuild, None when phrases were added since
+        self._snapshot = None
+        self._lock = threading.Lock()
+        for label, label_phrases in (phrases or {}).items():
+            self.add_many(label, label_phrases)
+
+    def add(self, label: str, phrase: str):
+        """Match phrase (case-insensitively, as whole words) as evidence for label"""
+        phrase = " ".join(phrase.lower().split())
+        if not phrase:
+            return
+        with self._lock:
+            self._order.setdefault(label, len(self._order))
+            labels = self._labels.setdefault(phrase, [])
+            if label not in labels:
+                labels.append(label)
+                self._snapshot = None
+
+    def add_many(self, label: str, phrases: Iterable[str]):
+        for phrase in phrases:
+            self.add(label, phrase)
+
+    def scores(self, text: str) -> Dict[str, int]:
+        """Number of phrase matches per label found in text"""
+        return self.scores_batch([text])[0]
+
+    def match(self, text: str) -> Optional[str]:
+        """The label with the most matches in text, None if nothing matched"""
+        return self.best(self.scores(text))
+
+    def match_batch(self, texts: List[str]) -> List[Optional[str]]:
+        return [self.best(scores) for scores in self.scores_batch(texts)]
+
+    def scores_batch(self, texts: List[str]) -> List[Dict[str, int]]:
+        """scores() for many texts, scanned together in a single regex pass"""
+        regex, labels = self._compiled()
+        results = [{} for _ in texts]
+        if regex is None or not texts:
+            return results
+        # Texts are joined with newlines, which never occur inside a phrase and count as a word boundary
+        lowered = [" ".join((text or "").lower().split()) for text in texts]
+        starts = []
+        offset = 0
+        for text in lowered:
+            starts.append(offset)
+            offset += len(text) + 1
+        for found in regex.finditer("\n".join(lowered)):
+            scores = results[bisect.bisect_right(starts, found.start()) - 1]
+            for label in labels[found.group(0)]:
+                scores[label] = scores.get(label, 0) + 1
+        return results
+
+    def best(self, scores: Dict[str, int]) -> Optional[str]:
+        if not scores:
+            return None
+        return min(scores, key=lambda label: (-scores[label], self._order.get(label, 0)))
+
+    def _compiled(self):
+        with self._lock:
+            if self._snapshot is None:
+                if not self._labels:
+                    return None, {}
+                regex = re.compile(r"(?<!\w)" + _trie_pattern(self._labels) + r"(?!\w)")
+                # Copied once per rebuild, so phrases added during a scan don't change it midway
+                self._snapshot = (regex, {phrase: tuple(labels) for phrase, labels in self._labels.items()})
+            return self._snapshot
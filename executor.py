@@ -0,0 +1,116 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+
+class QueueFullError(Exception):
+    """Raised when the admission queue has no free slot for a new request"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Too many reviews in progress, please retry later.")
+        self.retry_after = retry_after
+
+
+class ExecutorClosedError(Exception):
+    """Raised when a request is submitted after the executor was shut down"""
+
+
+class AgentExecutor:
+    """
+    Runs blocking crew pipelines on a worker thread pool so the event loop stays free.
+    At most `workers` jobs run at once and at most `queue_size` more wait for a worker;
+    anything beyond that is rejected straight away instead of piling up.
+    """
+
+    def __init__(self, workers: int = 4, queue_size: int = 16, timeout: float = 120.0):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="agent-worker")
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._avg_runtime = 30.0  # seconds, refined from observed runs
+        self._closed = False
+
+    @classmethod
+    def from_env(cls) -> "AgentExecutor":
+        """Build an executor configured by AGENT_WORKERS, AGENT_QUEUE_SIZE and AGENT_TIMEOUT"""
+        return cls(
+            workers=int(os.getenv("AGENT_WORKERS", "4")),
+            queue_size=int(os.getenv("AGENT_QUEUE_SIZE", "16")),
+            timeout=float(os.getenv("AGENT_TIMEOUT", "120")),
+        )
+
+    @property
+    def pending(self) -> int:
+        """Number of admitted jobs, running or waiting"""
+        return self._pending
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def retry_after(self) -> int:
+        """Rough number of seconds until a slot frees up"""
+        waves = max(1, self._pending // self.workers)
+        return max(1, int(self._avg_runtime * waves / 2))
+
+    def _run(self, fn, args, kwargs, submitted, timing):
+        start = time.monotonic()
+        metrics.queue_wait_seconds.observe(start - submitted)
+        if timing is not None:
+            timing["queue_wait"] = round(start - submitted, 3)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            elapsed = time.monotonic() - start
+            with self._lock:
+                self._avg_runtime = 0.8 * self._avg_runtime + 0.2 * elapsed
+
+    def _release(self, _future):
+        with self._lock:
+            self._pending -= 1
+        self._slots.release()
+
+    def start(self, fn, *args, timing: dict = None, **kwargs) -> asyncio.Future:
+        """
+        Admit fn(*args, **kwargs) and schedule it on the pool, returning an asyncio future.
+        Raises QueueFullError straight away when no slot is free. Must be called from the
+        event loop thread. If a timing dict is given, the queue wait is recorded in it.
+        """
+        if self._closed:
+            raise ExecutorClosedError("Executor is shut down")
+        if not self._slots.acquire(blocking=False):
+            raise QueueFullError(self.retry_after())
+        with self._lock:
+            self._pending += 1
+        try:
+            future = self._pool.submit(self._run, fn, args, kwargs, time.monotonic(), timing)
+        except Exception:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        return asyncio.wrap_future(future)
+
+    async def submit(self, fn, *args, timeout: float = None, timing: dict = None, **kwargs):
+        """
+        Run fn(*args, **kwargs) on the pool and await its result.
+        Raises QueueFullError when no slot is free and asyncio.TimeoutError when the
+        job takes longer than the timeout. A timed-out job keeps its slot until the
+        worker actually finishes, so the pool is never oversubscribed.
+        """
+        future = self.start(fn, *args, timing=timing, **kwargs)
+        return await asyncio.wait_for(
+            asyncio.shield(future),
+            timeout=timeout if timeout is not None else self.timeout,
+        )
+
+    def shutdown(self, wait: bool = False):
+        """Stop accepting work and release the worker threads"""
+        self._closed = True
+        self._pool.shutdown(wait=wait, cancel_futures=True)
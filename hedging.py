@@ -0,0 +1,228 @@
+"""
+Hedged and fallback LLM calls.
+
+    LLM_FALLBACKS="gemini/gemini-2.0-flash=gemini/gemini-2.0-flash-lite|ollama/llama3.2:latest"
+
+A call that hasn't answered after the LLM_HEDGE_PERCENTILE latency of its model's recent calls
+gets a hedged duplicate: on the same model, or with LLM_HEDGE_TO=fallback on the first model of
+its fallback chain. Whichever answers first is used. A call that fails, rate limit responses
+included, is retried on the next model of the chain. Each model has a circuit breaker: after
+LLM_BREAKER_FAILURES failures in a row it is skipped for LLM_BREAKER_RESET seconds, then a
+single trial call decides whether it is used again.
+"""
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional
+
+import metrics
+
+
+class LatencyWindow:
+    """Latencies of the last `size` successful calls"""
+
+    def __init__(self, size: int = 200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float, min_samples: int = 1) -> Optional[float]:
+        """The q-th percentile, or None with fewer than min_samples samples"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples or len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * q / 100.0))]
+
+
+class CircuitBreaker:
+    """Closed until `failure_threshold` failures in a row, then open for `reset_after` seconds"""
+
+    def __init__(self, failure_threshold: int = 5, reset_after: float = 30.0):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_after = reset_after
+        self.failures = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        return "half_open" if self._trial or time.monotonic() - self._opened_at >= self.reset_after else "open"
+
+    def allow(self) -> bool:
+        """Whether a call may go ahead; once open, lets one trial call through after reset_after"""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if not self._trial and time.monotonic() - self._opened_at >= self.reset_after:
+                self._trial = True
+                return True
+            return False
+
+    def record(self, ok: bool):
+        with self._lock:
+            if ok:
+                self.failures = 0
+                self._opened_at = None
+            else:
+                self.failures += 1
+                if self._trial or self.failures >= self.failure_threshold:
+                    self._opened_at = time.monotonic()
+            self._trial = False
+
+
+def is_rate_limited(error: Exception) -> bool:
+    return "RateLimit" in type(error).__name__ or getattr(error, "status_code", None) == 429
+
+
+class HedgedCaller:
+    """
+    Runs calls keyed by model name with hedging, fallback and per-model circuit breakers.
+    Attempts run on a thread pool; a duplicate that loses the race is not interrupted, but its
+    result is discarded, and one that hasn't started yet is cancelled.
+    """
+
+    def __init__(self, fallbacks: Optional[Dict[str, List[str]]] = None, percentile: float = 95.0,
+                 min_samples: int = 20, min_delay: float = 0.05, hedge_to: str = "same",
+                 failure_threshold: int = 5, reset_after: float = 30.0, threads: int = 64):
+        if hedge_to not in ("same", "fallback"):
+            raise ValueError(f"hedge_to must be 'same' or 'fallback', got '{hedge_to}'")
+        self.fallbacks = fallbacks or {}
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.hedge_to = hedge_to
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self._latencies: Dict[str, LatencyWindow] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="llm-call")
+
+    def chain(self, model: str) -> List[str]:
+        """model followed by its fallbacks, without repeats"""
+        return list(dict.fromkeys([model] + self.fallbacks.get(model, [])))
+
+    def breaker(self, model: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(model)
+            if breaker is None:
+                breaker = self._breakers[model] = CircuitBreaker(self.failure_threshold, self.reset_after)
+            return breaker
+
+    def breaker_states(self) -> Dict[str, str]:
+        with self._lock:
+            return {model: breaker.state for model, breaker in self._breakers.items()}
+
+    def _window(self, model: str) -> LatencyWindow:
+        with self._lock:
+            window = self._latencies.get(model)
+            if window is None:
+                window = self._latencies[model] = LatencyWindow()
+            return window
+
+    def hedge_delay(self, model: str) -> Optional[float]:
+        """Seconds to wait before hedging a call to model; None while hedging is off or unwarmed"""
+        if self.percentile <= 0:
+            return None
+        delay = self._window(model).percentile(self.percentile, self.min_samples)
+        return None if delay is None else max(self.min_delay, delay)
+
+    def _attempt(self, model: str, attempt: Callable[[str], Any]):
+        started = time.monotonic()
+        try:
+            result = attempt(model)
+        except Exception:
+            self.breaker(model).record(False)
+            raise
+        self._window(model).add(time.monotonic() - started)
+        self.breaker(model).record(True)
+        return result
+
+    def _next(self, candidates: List[str]) -> Optional[str]:
+        # Pops candidates until one whose breaker lets the call through
+        while candidates:
+            model = candidates.pop(0)
+            if self.breaker(model).allow():
+                return model
+            metrics.llm_fallbacks_total.inc(model=model, reason="circuit_open")
+        return None
+
+    def call(self, model: str, attempt: Callable[[str], Any]):
+        """
+        attempt(model_name) makes one call to the named model. Returns the first result of the
+        primary, hedged and fallback attempts; raises the last error if every model failed.
+        """
+        chain = self.chain(model)
+        candidates = list(chain)
+        # When every breaker is open, the primary model is tried anyway rather than failing outright
+        first = self._next(candidates) or chain[0]
+        if self.percentile <= 0 and len(chain) == 1:
+            return self._attempt(first, attempt)
+
+        pending = {self._pool.submit(self._attempt, first, attempt): first}
+        started = time.monotonic()
+        delay = self.hedge_delay(first)
+        hedge = None
+        error = None
+        while pending:
+            timeout = None if hedge is not None or delay is None else max(0.0, started + delay - time.monotonic())
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                backup = (self._next(candidates) if self.hedge_to == "fallback" else None) or first
+                hedge = self._pool.submit(self._attempt, backup, attempt)
+                pending[hedge] = backup
+                metrics.llm_hedges_total.inc(model=first, outcome="started")
+                continue
+            for future in done:
+                backend = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    error = e
+                    # Fall back only when no other attempt is still running
+                    if not pending:
+                        fallback = self._next(candidates)
+                        if fallback is not None:
+                            reason = "rate_limited" if is_rate_limited(e) else "error"
+                            metrics.llm_fallbacks_total.inc(model=backend, reason=reason)
+                            pending[self._pool.submit(self._attempt, fallback, attempt)] = fallback
+                    continue
+                if hedge is not None:
+                    metrics.llm_hedges_total.inc(model=first, outcome="won" if future is hedge else "lost")
+                for loser in pending:
+                    loser.cancel()
+                return result
+        raise error
+
+
+def parse_fallbacks(value: str) -> Dict[str, List[str]]:
+    """Parse "model=fallback|fallback,model2=fallback" as used by LLM_FALLBACKS"""
+    chains = {}
+    for item in (value or "").split(","):
+        if not item.strip():
+            continue
+        model, _, fallbacks = item.partition("=")
+        if not fallbacks:
+            raise ValueError(f"Expected model=fallback|fallback, got '{item.strip()}'")
+        chains[model.strip()] = [fallback.strip() for fallback in fallbacks.split("|") if fallback.strip()]
+    return chains
+
+
+def caller_from_env() -> HedgedCaller:
+    return HedgedCaller(
+        fallbacks=parse_fallbacks(os.getenv("LLM_FALLBACKS", "")),
+        percentile=float(os.getenv("LLM_HEDGE_PERCENTILE", "95")),
+        min_samples=int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20")),
+        hedge_to=os.getenv("LLM_HEDGE_TO", "same"),
+        failure_threshold=int(os.getenv("LLM_BREAKER_FAILURES", "5")),
+        reset_after=float(os.getenv("LLM_BREAKER_RESET", "30")),
+    )
@@ -0,0 +1,187 @@
+"""
+Durable queue of review jobs in a SQLite file (WAL mode), shared by app.py, which enqueues
+them and reports their status, and any number of job_worker.py processes, which run them.
+
+A worker claims a job by leasing it for visibility_timeout seconds. A job whose worker
+crashed or hung becomes visible again once its lease runs out. A failed job is retried
+after retry_delay seconds, doubled on every attempt, until max_attempts is reached.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class JobQueue:
+    def __init__(self, path: str = "jobs.db", visibility_timeout: float = 600.0, max_attempts: int = 3,
+                 retry_delay: float = 30.0):
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max(1, max_attempts)
+        self.retry_delay = retry_delay
+        # sqlite3 connections can't be shared between threads, so each thread opens its own
+        self._local = threading.local()
+        with self._transaction() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, status TEXT NOT NULL, payload TEXT NOT NULL, result TEXT, error TEXT, "
+                "attempts INTEGER NOT NULL DEFAULT 0, lease TEXT, visible_at REAL NOT NULL, "
+                "created REAL NOT NULL, updated REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, visible_at)")
+
+    @classmethod
+    def from_env(cls) -> "JobQueue":
+        """Queue configured by JOB_DB, JOB_VISIBILITY_TIMEOUT, JOB_MAX_ATTEMPTS and JOB_RETRY_DELAY"""
+        return cls(
+            os.getenv("JOB_DB", "jobs.db"),
+            visibility_timeout=float(os.getenv("JOB_VISIBILITY_TIMEOUT", "600")),
+            max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", "3")),
+            retry_delay=float(os.getenv("JOB_RETRY_DELAY", "30")),
+        )
+
+    def _db(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            # Transactions are begun explicitly, see _transaction
+            db = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def _transaction(self):
+        # IMMEDIATE takes the write lock up front, so two workers can't claim the same job
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def enqueue(self, payloads: Iterable[Dict]) -> List[str]:
+        """Add one job per payload in a single transaction; returns their ids in order"""
+        now = time.time()
+        rows = [(uuid.uuid4().hex, QUEUED, json.dumps(payload, ensure_ascii=False), now, now, now)
+                for payload in payloads]
+        with self._transaction() as db:
+            db.executemany(
+                "INSERT INTO jobs (id, status, payload, visible_at, created, updated) VALUES (?, ?, ?, ?, ?, ?)", rows
+            )
+        return [row[0] for row in rows]
+
+    def claim(self, limit: int = 1) -> List[Dict]:
+        """
+        Lease up to limit jobs, oldest first: queued ones that are due and running ones whose
+        lease ran out. Each comes back as {"id", "lease", "attempts", "payload"}.
+        """
+        now = time.time()
+        claimed = []
+        with self._transaction() as db:
+            rows = db.execute(
+                "SELECT id, attempts, payload FROM jobs WHERE status IN (?, ?) AND visible_at <= ? "
+                "ORDER BY created LIMIT ?",
+                (QUEUED, RUNNING, now, max(0, limit)),
+            ).fetchall()
+            for job_id, attempts, payload in rows:
+                if attempts >= self.max_attempts:
+                    # Its last attempt never reported back
+                    db.execute(
+                        "UPDATE jobs SET status = ?, error = ?, lease = NULL, updated = ? WHERE id = ?",
+                        (FAILED, "Worker lease expired", now, job_id),
+                    )
+                    continue
+                lease = uuid.uuid4().hex
+                db.execute(
+                    "UPDATE jobs SET status = ?, attempts = attempts + 1, lease = ?, visible_at = ?, updated = ? "
+                    "WHERE id = ?",
+                    (RUNNING, lease, now + self.visibility_timeout, now, job_id),
+                )
+                claimed.append({"id": job_id, "lease": lease, "attempts": attempts + 1, "payload": json.loads(payload)})
+        return claimed
+
+    def extend(self, job_id: str, lease: str) -> bool:
+        """Push a running job's lease out by another visibility_timeout; False if the lease was lost"""
+        now = time.time()
+        with self._transaction() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET visible_at = ?, updated = ? WHERE id = ? AND lease = ? AND status = ?",
+                (now + self.visibility_timeout, now, job_id, lease, RUNNING),
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, job_id: str, lease: str, result: Dict) -> bool:
+        """Store a job's result; False when the lease was lost and another worker owns the job"""
+        now = time.time()
+        with self._transaction() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = NULL, lease = NULL, updated = ? "
+                "WHERE id = ? AND lease = ?",
+                (DONE, json.dumps(result, ensure_ascii=False), now, job_id, lease),
+            )
+        return cursor.rowcount == 1
+
+    def fail(self, job_id: str, lease: str, error: str) -> bool:
+        """Record a failed attempt; the job is queued again unless it has used all its attempts"""
+        now = time.time()
+        with self._transaction() as db:
+            row = db.execute("SELECT attempts FROM jobs WHERE id = ? AND lease = ?", (job_id, lease)).fetchone()
+            if row is None:
+                return False
+            if row[0] >= self.max_attempts:
+                db.execute(
+                    "UPDATE jobs SET status = ?, error = ?, lease = NULL, updated = ? WHERE id = ?",
+                    (FAILED, error, now, job_id),
+                )
+            else:
+                db.execute(
+                    "UPDATE jobs SET status = ?, error = ?, lease = NULL, visible_at = ?, updated = ? WHERE id = ?",
+                    (QUEUED, error, now + self.retry_delay * 2 ** (row[0] - 1), now, job_id),
+                )
+        return True
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        return self.get_many([job_id]).get(job_id)
+
+    def get_many(self, job_ids: List[str]) -> Dict[str, Dict]:
+        """Status of the given jobs by id; unknown ids are left out"""
+        jobs = {}
+        db = self._db()
+        # SQLite allows 999 parameters per statement in older builds
+        for start in range(0, len(job_ids), 500):
+            chunk = job_ids[start:start + 500]
+            rows = db.execute(
+                "SELECT id, status, result, error, attempts, created, updated FROM jobs "
+                f"WHERE id IN ({','.join('?' * len(chunk))})",
+                chunk,
+            ).fetchall()
+            for job_id, status, result, error, attempts, created, updated in rows:
+                job = {"id": job_id, "status": status, "attempts": attempts, "created": created, "updated": updated}
+                if result is not None:
+                    job["result"] = json.loads(result)
+                if error is not None:
+                    job["error"] = error
+                jobs[job_id] = job
+        return jobs
+
+    def counts(self) -> Dict[str, int]:
+        """Number of jobs per status"""
+        rows = self._db().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+    def purge(self, older_than: float) -> int:
+        """Delete finished jobs last updated more than older_than seconds ago"""
+        with self._transaction() as db:
+            cursor = db.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated < ?", (DONE, FAILED, time.time() - older_than)
+            )
+        return cursor.rowcount
@@ -0,0 +1,133 @@
+"""
+Run the review jobs queued through POST /jobs (see job_queue.py) until stopped:
+
+    python job_worker.py --workers 8
+    python job_worker.py --processes 4 --workers 4
+
+Every process leases as many jobs as it has idle threads and keeps their leases alive while
+they run. Workers can be started and stopped independently of the API, as long as they share
+its JOB_DB file. SIGTERM or Ctrl-C stops leasing new jobs and waits for the running ones;
+jobs of a worker that was killed are retried once their lease runs out.
+"""
+import argparse
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+from job_queue import JobQueue
+from rate_limit import parse_limits
+from shared_state import shared_state_path
+
+# Finished jobs are deleted after JOB_RETENTION seconds
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", str(7 * 86400)))
+PURGE_INTERVAL = 3600.0
+
+
+def run_job(queue: JobQueue, job: Dict) -> bool:
+    """Reply to one leased job and record the outcome"""
+    from agent_checkpoint import run_agent_cached
+
+    try:
+        result = run_agent_cached(job["payload"])
+    except Exception as e:
+        print(f"job {job['id']} attempt {job['attempts']} failed: {e}", file=sys.stderr)
+        queue.fail(job["id"], job["lease"], f"{type(e).__name__}: {e}")
+        return False
+    queue.complete(job["id"], job["lease"], result)
+    return True
+
+
+def run_worker(queue: JobQueue, workers: int = 4, poll_interval: float = 1.0,
+               stop: Optional[threading.Event] = None):
+    """Lease and run jobs on `workers` threads until stop is set, then wait for the running ones"""
+    stop = stop or threading.Event()
+    running = {}  # job id -> (lease, future)
+    lock = threading.Lock()
+    drained = threading.Event()
+
+    def heartbeat():
+        # Long crews must not outlive their lease, or another worker would run them again.
+        # Runs until the pool has drained, so jobs finishing during shutdown keep their leases too.
+        while not drained.wait(queue.visibility_timeout / 3):
+            with lock:
+                leases = [(job_id, lease) for job_id, (lease, future) in running.items() if not future.done()]
+            for job_id, lease in leases:
+                queue.extend(job_id, lease)
+
+    threading.Thread(target=heartbeat, name="job-heartbeat", daemon=True).start()
+    last_purge = 0.0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job-worker") as pool:
+        while not stop.is_set():
+            with lock:
+                for job_id in [job_id for job_id, (_, future) in running.items() if future.done()]:
+                    del running[job_id]
+                idle = workers - len(running)
+            jobs = queue.claim(idle) if idle > 0 else []
+            with lock:
+                for job in jobs:
+                    running[job["id"]] = (job["lease"], pool.submit(run_job, queue, job))
+            if JOB_RETENTION > 0 and time.monotonic() - last_purge > PURGE_INTERVAL:
+                queue.purge(JOB_RETENTION)
+                last_purge = time.monotonic()
+            if not jobs:
+                stop.wait(poll_interval)
+    drained.set()
+
+
+def _stop_on_signals(stop: threading.Event):
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stop.set())
+
+
+def _process_main(workers: int, poll_interval: float, rate_limits: Dict[str, float]):
+    import models
+
+    for model, per_minute in rate_limits.items():
+        models.llm_rate_limiter.set_limit(model, per_minute)
+    stop = threading.Event()
+    _stop_on_signals(stop)
+    run_worker(JobQueue.from_env(), workers, poll_interval, stop)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run queued review jobs")
+    parser.add_argument("--workers", type=int, default=4, help="Jobs run at once per process")
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="Seconds between polls of an empty queue")
+    args = parser.parse_args()
+
+    # Every process gets its share of each LLM_RATE_LIMITS limit, unless they share one bucket
+    processes = max(1, args.processes)
+    split = processes if shared_state_path() is None else 1
+    shares = {model: per_minute / split
+              for model, per_minute in parse_limits(os.getenv("LLM_RATE_LIMITS", "")).items()}
+    print(f"running jobs from {os.getenv('JOB_DB', 'jobs.db')} with {processes} x {args.workers} workers")
+    if processes == 1:
+        _process_main(args.workers, args.poll_interval, shares)
+        return
+
+    children = [
+        multiprocessing.Process(target=_process_main, args=(args.workers, args.poll_interval, shares),
+                                name=f"job-worker-{index}")
+        for index in range(processes)
+    ]
+    for child in children:
+        child.start()
+    stop = threading.Event()
+    _stop_on_signals(stop)
+    while not stop.is_set() and any(child.is_alive() for child in children):
+        stop.wait(1.0)
+    for child in children:
+        if child.is_alive():
+            os.kill(child.pid, signal.SIGTERM)
+    for child in children:
+        child.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+crewai LLM clients behind models.shared_llm. Kept apart from models.py so crewai is only
+imported when the first client is created.
+"""
+from crewai import LLM
+
+import models
+
+
+class RateLimitedLLM(LLM):
+    """
+    crewai LLM that counts prompt tokens and goes through llm_caller, so slow calls are hedged
+    and failed ones fall back to other models. Every attempt waits for its model's rate limit.
+    """
+
+    def __init__(self, rate_limit_key: str, **llm_kwargs):
+        super().__init__(**llm_kwargs)
+        self.rate_limit_key = rate_limit_key
+
+    def call(self, messages, *args, **kwargs):
+        models._add_prompt_tokens(self.model, messages)
+
+        def attempt(model):
+            llm = self if model == self.rate_limit_key else models.model_llm(model)
+            return llm.call_once(messages, *args, **kwargs)
+
+        return models.llm_caller.call(self.rate_limit_key, attempt)
+
+    def call_once(self, messages, *args, **kwargs):
+        """One call to this model, without hedging or fallback"""
+        models.llm_rate_limiter.acquire(self.rate_limit_key)
+        return LLM.call(self, messages, *args, **kwargs)
+
+
+class RoutedLLM(RateLimitedLLM):
+    """RateLimitedLLM for an Ollama model whose calls go to the endpoint ollama_router picks"""
+
+    def __init__(self, rate_limit_key: str, **llm_kwargs):
+        super().__init__(rate_limit_key, **llm_kwargs)
+        self._llm_kwargs = llm_kwargs
+        self._endpoint_llms = {}
+
+    def endpoint_llm(self, url: str) -> LLM:
+        """Plain LLM with this one's settings, pointed at url"""
+        llm = self._endpoint_llms.get(url)
+        if llm is None:
+            llm = self._endpoint_llms.setdefault(url, LLM(**{**self._llm_kwargs, "base_url": url}))
+        return llm
+
+    def call_once(self, messages, *args, **kwargs):
+        models.llm_rate_limiter.acquire(self.rate_limit_key)
+        with models.ollama_router.lease(self.model) as endpoint:
+            return self.endpoint_llm(endpoint.url).call(messages, *args, **kwargs)
@@ -0,0 +1,99 @@
+"""
+Deadline-aware degradation of the crew pipeline.
+
+Every review carries a deadline. Before the crew starts, and again before the response
+stages, the LoadShedder estimates how long the remaining stages will take from observed
+stage latencies, and picks the lightest pipeline that still fits:
+
+    0 none               the full pipeline
+    1 capped_iterations  agents get at most DEGRADED_MAX_ITER reasoning iterations
+    2 lite_model         also gemini-2.0-flash-lite instead of gemini-2.0-flash
+    3 no_reviewer        also no reviewer stage; the drafted response is the reply
+
+While reviews are queued behind the running ones, each run gets a smaller share of the
+default deadline, so the queue drains before the requests waiting in it run out of time.
+"""
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+LEVELS = ("none", "capped_iterations", "lite_model", "no_reviewer")
+CAPPED_ITERATIONS, LITE_MODEL, NO_REVIEWER = 1, 2, 3
+
+# Starting guesses in seconds, replaced by observed latencies as reviews are answered
+DEFAULT_STAGE_SECONDS = {
+    "sentiment_task": 3.0,
+    "sentiment_review_task": 4.0,
+    "response_task": 6.0,
+    "reviewer_task": 10.0,
+}
+
+
+class LoadShedder:
+    def __init__(self, default_deadline: float = 60.0, headroom: float = 0.9, smoothing: float = 0.2,
+                 pressure: Optional[Callable[[], Tuple[int, int]]] = None):
+        self.default_deadline = default_deadline
+        self.headroom = headroom
+        self.smoothing = smoothing
+        # Returns (reviews waiting for a worker, workers); set by the server
+        self.pressure = pressure
+        self._seconds: Dict[Tuple[str, int], float] = {}
+        self._lock = threading.Lock()
+
+    def deadline(self, budget_ms: Optional[str] = None) -> float:
+        """time.monotonic() deadline from a request's budget in milliseconds, or the default budget"""
+        try:
+            budget = float(budget_ms) / 1000.0 if budget_ms else self.default_deadline
+        except ValueError:
+            budget = self.default_deadline
+        return time.monotonic() + budget
+
+    def observe(self, stage: str, level: int, seconds: float):
+        """Feed in how long a stage took at a degradation level"""
+        with self._lock:
+            previous = self._seconds.get((stage, level))
+            if previous is None:
+                self._seconds[(stage, level)] = seconds
+            else:
+                self._seconds[(stage, level)] = (1 - self.smoothing) * previous + self.smoothing * seconds
+
+    def estimate(self, stages: Iterable[str], level: int) -> float:
+        """Expected seconds for stages at level"""
+        total = 0.0
+        with self._lock:
+            for stage in stages:
+                if stage == "reviewer_task" and level >= NO_REVIEWER:
+                    continue
+                # Unobserved levels borrow the nearest lighter level's latency, then the default
+                seconds = next(
+                    (self._seconds[(stage, lower)] for lower in range(level, -1, -1) if (stage, lower) in self._seconds),
+                    DEFAULT_STAGE_SECONDS.get(stage, 0.0),
+                )
+                total += seconds
+        return total
+
+    def budget(self, deadline: Optional[float]) -> Optional[float]:
+        """Seconds this run may take; None when there is no deadline and no queue"""
+        remaining = None if deadline is None else deadline - time.monotonic()
+        if self.pressure is not None:
+            waiting, workers = self.pressure()
+            if waiting > 0:
+                share = self.default_deadline / (1 + waiting / max(1, workers))
+                remaining = share if remaining is None else min(remaining, share)
+        return remaining
+
+    def choose(self, stages: Iterable[str], deadline: Optional[float], minimum: int = 0) -> int:
+        """The lightest level, no lighter than minimum, at which stages fit before the deadline"""
+        stages = list(stages)
+        remaining = self.budget(deadline)
+        if remaining is None:
+            return minimum
+        for level in range(minimum, len(LEVELS)):
+            if self.estimate(stages, level) <= remaining * self.headroom:
+                return level
+        return len(LEVELS) - 1
+
+
+def shedder_from_env() -> LoadShedder:
+    return LoadShedder(default_deadline=float(os.getenv("REQUEST_DEADLINE", "60")))
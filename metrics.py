@@ -0,0 +1,167 @@
+import bisect
+import threading
+from typing import Callable, Dict, Iterable, Tuple
+
+# Latency buckets in seconds, from fast cache hits up to multi-minute crew runs
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+# Prompt sizes in tokens
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+# Items per batch
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                yield f"{self.name}{_format_labels(self.labels, key)} {value}"
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = (), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # per-bucket counts, then sum and count
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    labels = _format_labels(self.labels, key, 'le="%s"' % bound)
+                    yield f"{self.name}_bucket{labels} {cumulative}"
+                labels = _format_labels(self.labels, key, 'le="+Inf"')
+                yield f"{self.name}_bucket{labels} {count}"
+                yield f"{self.name}_sum{_format_labels(self.labels, key)} {total}"
+                yield f"{self.name}_count{_format_labels(self.labels, key)} {count}"
+
+
+class CallbackMetric:
+    """Counter or gauge whose values are read from fn() at scrape time, e.g. cache statistics"""
+
+    def __init__(self, name: str, help_text: str, kind: str, labels: Iterable[str],
+                 fn: Callable[[], Dict[Tuple[str, ...], float]]):
+        self.name = name
+        self.help_text = help_text
+        self.kind = kind
+        self.labels = tuple(labels)
+        self.fn = fn
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for key, value in sorted(self.fn().items()):
+            yield f"{self.name}{_format_labels(self.labels, key)} {value}"
+
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+def register(metric):
+    with _registry_lock:
+        _registry.append(metric)
+    return metric
+
+
+def render() -> str:
+    """All registered metrics in the Prometheus text exposition format"""
+    lines = []
+    with _registry_lock:
+        metrics = list(_registry)
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# Hot-path metrics shared by app.py, executor.py, agent_checkpoint.py and models.py
+requests_total = register(Counter(
+    "review_requests_total", "Review requests by endpoint and outcome", ("endpoint", "outcome")
+))
+request_seconds = register(Histogram(
+    "review_request_seconds", "End-to-end review request latency", ("endpoint",)
+))
+queue_wait_seconds = register(Histogram(
+    "agent_queue_wait_seconds", "Time admitted work waited for a worker thread"
+))
+stage_seconds = register(Histogram(
+    "crew_stage_seconds", "Wall time of each crew task", ("stage", "profile")
+))
+stage_prompt_tokens = register(Histogram(
+    "crew_stage_prompt_tokens", "Prompt tokens sent by each crew task", ("stage", "profile"), buckets=TOKEN_BUCKETS
+))
+llm_calls_total = register(Counter(
+    "llm_calls_total", "LLM calls by model and outcome", ("model", "outcome")
+))
+llm_call_seconds = register(Histogram(
+    "llm_call_seconds", "Latency of individual LLM calls", ("model",)
+))
+llm_tokens_total = register(Counter(
+    "llm_tokens_total", "LLM tokens by model and kind (prompt or completion)", ("model", "kind")
+))
+llm_hedges_total = register(Counter(
+    "llm_hedges_total", "Hedged LLM calls by primary model and outcome (started, won, lost)", ("model", "outcome")
+))
+llm_fallbacks_total = register(Counter(
+    "llm_fallbacks_total", "LLM calls passed on to the next fallback model, by model and reason", ("model", "reason")
+))
+stage_output_total = register(Counter(
+    "stage_output_total", "Structured sentiment stage outputs by stage and outcome (valid, repaired, invalid)",
+    ("stage", "outcome")
+))
+fast_path_total = register(Counter(
+    "sentiment_fast_path_total", "Local sentiment classifier outcomes (hit, escalated, unavailable)", ("outcome",)
+))
+coalesced_total = register(Counter(
+    "review_coalesced_total", "Reviews answered by an identical crew run that was already in progress"
+))
+degraded_total = register(Counter(
+    "review_degradation_total", "Crew runs by the degradation level chosen to meet their deadline", ("level",)
+))
+sentiment_batch_size = register(Histogram(
+    "sentiment_batch_size", "Texts per local classifier forward pass", buckets=BATCH_SIZE_BUCKETS
+))
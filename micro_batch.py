@@ -0,0 +1,82 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List
+
+
+class MicroBatcher:
+    """
+    Gathers items submitted from any thread into batches for a single worker thread.
+    A batch is run as soon as it holds max_batch_size items, or max_wait seconds after its
+    first item arrived. handler gets the list of items and returns one result per item.
+    """
+
+    def __init__(self, handler: Callable[[List], List], max_batch_size: int = 64, max_wait: float = 0.002,
+                 name: str = "micro-batch", on_batch: Callable[[int], None] = None):
+        self.handler = handler
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait)
+        self.on_batch = on_batch
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item) -> Future:
+        """Queue item; the future resolves to its result"""
+        if self._closed:
+            raise RuntimeError("MicroBatcher is closed")
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def submit_async(self, item) -> asyncio.Future:
+        """submit() for coroutines: awaiting the result doesn't block the event loop"""
+        return asyncio.wrap_future(self.submit(item))
+
+    def close(self):
+        """Finish the queued items, then stop the worker thread"""
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def _next_batch(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                entry = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is None:
+                # Put the stop marker back so the loop ends after this batch
+                self._queue.put(None)
+                break
+            batch.append(entry)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            # Callers that cancelled while queued are dropped from the batch
+            batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            if self.on_batch is not None:
+                self.on_batch(len(batch))
+            try:
+                results = self.handler([item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
@@ -0,0 +1,318 @@
+"""
+Deterministic stand-in for the Gemini and Ollama backends, for benchmarks and offline runs.
+
+Speaks the OpenAI chat completions API (/v1/chat/completions) and the Ollama API
+(/api/chat, /api/generate, /api/tags), with or without streaming. Replies are built from
+the prompt so every crew stage gets output it can parse: sentiment JSON, batch sentiment
+lists, the "fast" profile's combined JSON, or a customer reply.
+
+    python mock_llm_server.py --port 8001 --latency-ms 400 --jitter 0.3 --tokens-per-second 80
+    MOCK_LLM_URL=http://localhost:8001/v1 python app.py
+
+Latency is time to first token drawn from a lognormal distribution around --latency-ms
+(--jitter is its sigma, 0 for a fixed delay), then one token every 1/--tokens-per-second.
+The draw is seeded from --seed and the request body, so the same request always takes
+the same time.
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+NEGATIVE_WORDS = (
+    "bad", "broken", "terrible", "awful", "worst", "refund", "disappointed", "never", "poor",
+    "not work", "didn't work", "doesn't work", "waste", "late", "scam", "angry", "horrible",
+)
+POSITIVE_WORDS = (
+    "great", "love", "excellent", "perfect", "good", "amazing", "awesome", "happy", "easy",
+    "best", "nice", "thank", "wonderful", "fast",
+)
+
+# crewai asks agents for a "Final Answer:" and retries when it is missing
+CREW_FORMAT_MARKER = "Final Answer:"
+
+
+def classify(text: str):
+    """Keyword sentiment, good enough to exercise every branch of the response prompts"""
+    text = text.lower()
+    negative = sum(text.count(word) for word in NEGATIVE_WORDS)
+    positive = sum(text.count(word) for word in POSITIVE_WORDS)
+    if negative > positive:
+        return "Negative", "frustrated"
+    if positive > negative:
+        return "Positive", "happy"
+    return "Neutral", "calm"
+
+
+def _quoted(prompt: str, label: str) -> str:
+    match = re.search(rf"{label}:?\s*'(.*?)'", prompt, re.DOTALL)
+    return match.group(1) if match else ""
+
+
+def _reply_text(prompt: str, sentiment: str) -> str:
+    name = _quoted(prompt, "name") or "there"
+    product = _quoted(prompt, "product") or "your purchase"
+    if sentiment == "Negative":
+        middle = (
+            f"We're so sorry {product} let you down. We'd love to make it right with a replacement "
+            "or a refund, whichever suits you best."
+        )
+    elif sentiment == "Positive":
+        middle = f"Thank you so much for the kind words about {product}! Customers like you make our day."
+    else:
+        middle = f"Thanks for sharing your thoughts on {product}. What could we do to make it even better?"
+    return (
+        f"Hey {name}! {middle} Reach Customer Service Contact at customerservice@amazon.com "
+        "or +1-800-123-4567. Let us know if you need anything!"
+    )
+
+
+def build_reply(prompt: str) -> str:
+    """Reply content for a prompt, shaped like what the matching crew stage expects"""
+    if "index of the review" in prompt:
+        match = re.search(r"\[\s*\{.*\}\s*\]", prompt, re.DOTALL)
+        try:
+            items = json.loads(match.group(0)) if match else []
+        except ValueError:
+            items = []
+        results = []
+        for item in items:
+            if isinstance(item, dict) and "review" in item and str(item.get("index", "")).isdigit():
+                sentiment, emotion = classify(item["review"])
+                results.append({"index": int(item["index"]), "sentiment": sentiment, "emotion": emotion})
+        return json.dumps(results)
+
+    review = _quoted(prompt, "review") or _quoted(prompt, "text") or prompt
+    sentiment, emotion = classify(review)
+    if "The final reply to the customer" in prompt:
+        return json.dumps({"sentiment": sentiment, "emotion": emotion, "reply": _reply_text(prompt, sentiment)})
+    if "response string" in prompt or "Reply with the final response only" in prompt:
+        return _reply_text(prompt, sentiment)
+    if "Positive, Negative, or Neutral" in prompt:
+        analysis = {"sentiment": sentiment, "emotion": emotion}
+        if "Explanation of validation" in prompt:
+            analysis["review"] = f"The review reads as {sentiment.lower()}."
+        return json.dumps(analysis)
+    return _reply_text(prompt, sentiment)
+
+
+def count_tokens(text: str) -> int:
+    # Roughly four characters per token, like most BPE vocabularies on English text
+    return max(1, len(text) // 4)
+
+
+class MockBackend:
+    """Reply content and timing for one request"""
+
+    def __init__(self, latency_ms: float = 300.0, jitter: float = 0.25, tokens_per_second: float = 100.0,
+                 seed: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.tokens_per_second = tokens_per_second
+        self.seed = seed
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def plan(self, body: bytes, prompt: str, crew_format: bool):
+        """Return (content, first token delay, per-token delay) for a request"""
+        with self._lock:
+            self.requests += 1
+        digest = hashlib.sha256(str(self.seed).encode("utf-8") + body).digest()
+        rng = random.Random(int.from_bytes(digest[:8], "big"))
+        first_token = self.latency_ms / 1000.0
+        if self.jitter > 0:
+            first_token *= rng.lognormvariate(0, self.jitter)
+        per_token = 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+        content = build_reply(prompt)
+        if crew_format:
+            content = f"Thought: I now can give a great answer\n{CREW_FORMAT_MARKER} {content}"
+        return content, first_token, per_token
+
+
+def _chunks(content: str):
+    # Whitespace-delimited pieces keep the streamed text identical to the full reply
+    return re.findall(r"\S+\s*|\s+", content)
+
+
+def _prompt_text(messages) -> str:
+    parts = []
+    for message in messages or []:
+        content = message.get("content")
+        if isinstance(content, list):
+            content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+        parts.append(str(content or ""))
+    return "\n".join(parts)
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    backend: MockBackend = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip("/") in ("/api/tags", "/v1/models", ""):
+            self._send_json({
+                "models": [{"name": "mock:latest"}],
+                "data": [{"id": "mock", "object": "model"}],
+            })
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        try:
+            request = json.loads(body or b"{}")
+        except ValueError:
+            self._send_json({"error": "invalid JSON"}, status=400)
+            return
+        path = self.path.rstrip("/")
+        if path.endswith("/chat/completions"):
+            self._openai(request, body)
+        elif path == "/api/chat":
+            self._ollama(request, body, _prompt_text(request.get("messages")), chat=True)
+        elif path == "/api/generate":
+            self._ollama(request, body, str(request.get("prompt", "")), chat=False)
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def _openai(self, request, body):
+        prompt = _prompt_text(request.get("messages"))
+        content, first_token, per_token = self.backend.plan(body, prompt, CREW_FORMAT_MARKER in prompt)
+        model = request.get("model", "mock")
+        usage = {
+            "prompt_tokens": count_tokens(prompt),
+            "completion_tokens": count_tokens(content),
+            "total_tokens": count_tokens(prompt) + count_tokens(content),
+        }
+        time.sleep(first_token)
+        if not request.get("stream"):
+            time.sleep(per_token * usage["completion_tokens"])
+            self._send_json({
+                "id": "chatcmpl-mock",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            })
+            return
+
+        self._start_stream("text/event-stream")
+        for piece in _chunks(content):
+            self._write_chunk("data: " + json.dumps({
+                "id": "chatcmpl-mock",
+                "object": "chat.completion.chunk",
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+            }) + "\n\n")
+            time.sleep(per_token * count_tokens(piece))
+        self._write_chunk("data: " + json.dumps({
+            "id": "chatcmpl-mock",
+            "object": "chat.completion.chunk",
+            "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            "usage": usage,
+        }) + "\n\n")
+        self._write_chunk("data: [DONE]\n\n")
+        self._write_chunk("")
+
+    def _ollama(self, request, body, prompt, chat):
+        content, first_token, per_token = self.backend.plan(body, prompt, CREW_FORMAT_MARKER in prompt)
+        model = request.get("model", "mock")
+        prompt_tokens, completion_tokens = count_tokens(prompt), count_tokens(content)
+
+        def message(text, done):
+            payload = {"model": model, "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ"), "done": done}
+            if chat:
+                payload["message"] = {"role": "assistant", "content": text}
+            else:
+                payload["response"] = text
+            if done:
+                payload.update(prompt_eval_count=prompt_tokens, eval_count=completion_tokens, done_reason="stop")
+            return payload
+
+        time.sleep(first_token)
+        # Ollama streams unless the request says otherwise
+        if not request.get("stream", True):
+            time.sleep(per_token * completion_tokens)
+            self._send_json(message(content, True))
+            return
+
+        self._start_stream("application/x-ndjson")
+        for piece in _chunks(content):
+            self._write_chunk(json.dumps(message(piece, False)) + "\n")
+            time.sleep(per_token * count_tokens(piece))
+        self._write_chunk(json.dumps(message("", True)) + "\n")
+        self._write_chunk("")
+
+    def _send_json(self, payload, status=200):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _start_stream(self, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _write_chunk(self, text):
+        # HTTP/1.1 chunked encoding; an empty chunk ends the response
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+def make_server(host: str = "127.0.0.1", port: int = 0, **backend_kwargs) -> ThreadingHTTPServer:
+    """Build a mock server; port 0 picks a free port (see server.server_address)"""
+    handler = type("BoundMockLLMHandler", (MockLLMHandler,), {"backend": MockBackend(**backend_kwargs)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_in_thread(**kwargs) -> ThreadingHTTPServer:
+    """Start a mock server on a background thread, for benchmarks in the same process"""
+    server = make_server(**kwargs)
+    threading.Thread(target=server.serve_forever, name="mock-llm", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deterministic OpenAI/Ollama-compatible mock LLM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="Median time to first token")
+    parser.add_argument("--jitter", type=float, default=0.25, help="Lognormal sigma of the latency, 0 for fixed")
+    parser.add_argument("--tokens-per-second", type=float, default=100.0, help="0 for instant completions")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = make_server(
+        args.host, args.port,
+        latency_ms=args.latency_ms, jitter=args.jitter,
+        tokens_per_second=args.tokens_per_second, seed=args.seed,
+    )
+    print(f"Mock LLM listening on http://{args.host}:{server.server_address[1]} "
+          f"(OpenAI base URL /v1, Ollama base URL /)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
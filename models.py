@@ -1,21 +1,257 @@
 import os
 import json
-from crewai import LLM
-from dotenv import load_dotenv, find_dotenv
+import threading
+from contextlib import contextmanager
+from typing import TYPE_CHECKING
+from dotenv import load_dotenv
 
-# Load environment variables from .env file
-dotenv_path = find_dotenv()
+import metrics
+from hedging import caller_from_env
+from ollama_router import router_from_env
+from rate_limit import limiter_from_env
+
+if TYPE_CHECKING:
+    from crewai import LLM
+
+# Load environment variables from .env file. This stays at import time because other modules
+# read their settings from the environment when they are imported.
 load_dotenv()
 
 # google
 file_path = 'gen-lang-client-0184211067-8d635d347db2.json'
+_vertex_credentials_json = None
+
+
+def vertex_credentials_json() -> str:
+    """The Vertex service account JSON, read on first use"""
+    global _vertex_credentials_json
+    if _vertex_credentials_json is None:
+        with open(file_path, 'r') as file:
+            _vertex_credentials_json = json.dumps(json.load(file))
+    return _vertex_credentials_json
+
+
+# Process-wide LLM clients. crewai's LLM only holds configuration and hands every call to
+# litellm, so one instance per model can be shared by all worker threads.
+_llm_clients = {}
+# The same clients by model name, for fallback chains
+_model_llms = {}
+_llm_lock = threading.Lock()
+
+
+def _configure_http_pool():
+    """Give litellm one keep-alive HTTP client so calls reuse TLS connections"""
+    try:
+        import httpx
+        import litellm
+    except ImportError:
+        return
+    limits = httpx.Limits(
+        max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "32")),
+        max_keepalive_connections=int(os.getenv("LLM_MAX_KEEPALIVE", "16")),
+    )
+    if litellm.client_session is None:
+        litellm.client_session = httpx.Client(limits=limits, timeout=120.0)
+
+
+def _record_llm_call(outcome):
+    def callback(kwargs, response, start_time, end_time):
+        model = kwargs.get("model", "unknown")
+        metrics.llm_calls_total.inc(model=model, outcome=outcome)
+        try:
+            metrics.llm_call_seconds.observe((end_time - start_time).total_seconds(), model=model)
+        except (TypeError, AttributeError):
+            pass
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            metrics.llm_tokens_total.inc(getattr(usage, "prompt_tokens", 0) or 0, model=model, kind="prompt")
+            metrics.llm_tokens_total.inc(getattr(usage, "completion_tokens", 0) or 0, model=model, kind="completion")
+    return callback
+
+
+def _register_usage_callbacks():
+    """Count every litellm call, its latency and token usage per model for /metrics"""
+    try:
+        import litellm
+    except ImportError:
+        return
+    litellm.success_callback.append(_record_llm_call("success"))
+    litellm.failure_callback.append(_record_llm_call("failure"))
+
+
+_litellm_configured = False
+
+
+def _configure_litellm():
+    # litellm is slow to import, so it is set up with the first client rather than on import
+    global _litellm_configured
+    if not _litellm_configured:
+        _litellm_configured = True
+        _configure_http_pool()
+        _register_usage_callbacks()
+
+
+# Set to the OpenAI-compatible base URL of mock_llm_server.py (e.g. http://localhost:8001/v1)
+# to send every model's calls there instead of Gemini or Ollama, for benchmarks and offline runs
+MOCK_LLM_URL = os.getenv("MOCK_LLM_URL")
+
+
+def _mock_llm_kwargs(llm_kwargs):
+    # The real model name is kept after the openai/ prefix so replies and metrics still tell models apart
+    return {
+        "model": "openai/" + llm_kwargs["model"],
+        "base_url": MOCK_LLM_URL,
+        "api_key": "mock",
+        "temperature": llm_kwargs.get("temperature"),
+    }
+
+
+# Requests per minute per model, from LLM_RATE_LIMITS="gemini/gemini-2.0-flash=1000,..."
+llm_rate_limiter = limiter_from_env()
+
+
+# Pools of Ollama servers for the local models, from OLLAMA_ENDPOINTS and OLLAMA_MODEL_ENDPOINTS
+ollama_router = router_from_env()
+
+
+# Hedging, fallback chains and circuit breakers for every agent's LLM calls, keyed by model name
+llm_caller = caller_from_env()
+metrics.register(metrics.CallbackMetric(
+    "llm_circuit_open", "1 while a model's circuit breaker keeps calls away from it", "gauge", ("model",),
+    lambda: {(model,): int(state != "closed") for model, state in llm_caller.breaker_states().items()},
+))
+
+
+# Prompt tokens sent by each thread, so crew stages can report what they cost
+_prompt_tokens = threading.local()
+
+
+def count_prompt_tokens(model: str, messages) -> int:
+    try:
+        import litellm
+
+        return litellm.token_counter(model=model, messages=messages)
+    except Exception:
+        # Roughly four characters per token
+        return sum(len(str(message.get("content") or "")) for message in messages) // 4
+
+
+def _add_prompt_tokens(model: str, messages):
+    _prompt_tokens.count = getattr(_prompt_tokens, "count", 0) + count_prompt_tokens(model, messages)
+
+
+def take_prompt_tokens() -> int:
+    """Prompt tokens this thread has sent since the previous call"""
+    count = getattr(_prompt_tokens, "count", 0)
+    _prompt_tokens.count = 0
+    return count
+
+
+@contextmanager
+def _base_url(llm: "LLM"):
+    # Routed models hold an endpoint slot for the whole call; others use their own base_url
+    if hasattr(llm, "endpoint_llm"):
+        with ollama_router.lease(llm.model) as endpoint:
+            yield endpoint.url
+    else:
+        yield getattr(llm, "base_url", None)
+
+
+def shared_llm(key: str, **llm_kwargs) -> "LLM":
+    """Return the shared LLM client registered under key, creating it on first use"""
+    client = _llm_clients.get(key)
+    if client is None:
+        with _llm_lock:
+            client = _llm_clients.get(key)
+            if client is None:
+                # Imports crewai, which takes seconds, so it waits for the first client
+                from llm_clients import RateLimitedLLM, RoutedLLM
+
+                _configure_litellm()
+                # Limits are keyed by the real model name, even when calls go to the mock server
+                rate_limit_key = llm_kwargs["model"]
+                if MOCK_LLM_URL:
+                    client = RateLimitedLLM(rate_limit_key, **_mock_llm_kwargs(llm_kwargs))
+                elif rate_limit_key.startswith("ollama/"):
+                    client = RoutedLLM(rate_limit_key, **llm_kwargs)
+                else:
+                    client = RateLimitedLLM(rate_limit_key, **llm_kwargs)
+                _llm_clients[key] = client
+                _model_llms.setdefault(rate_limit_key, client)
+    return client
+
+
+def create_llms():
+    """Create the shared client of every google_model and local_model model"""
+    for factory_class in (google_model, local_model):
+        for name, factory in vars(factory_class).items():
+            if not name.startswith("_") and callable(factory):
+                factory()
+
+
+def model_llm(model: str) -> "LLM":
+    """The shared client for a model name from google_model or local_model"""
+    if model not in _model_llms:
+        create_llms()
+    try:
+        return _model_llms[model]
+    except KeyError:
+        raise ValueError(f"No model named '{model}' in google_model or local_model") from None
+
+
+def stream_completion(llm: "LLM", messages):
+    """Yield the reply to messages chunk by chunk, using the same settings llm.call would"""
+    import litellm
+
+    llm_rate_limiter.acquire(getattr(llm, "rate_limit_key", llm.model))
+    _add_prompt_tokens(llm.model, messages)
+    with _base_url(llm) as base_url:
+        params = {
+            "model": llm.model,
+            "messages": messages,
+            "temperature": getattr(llm, "temperature", None),
+            "base_url": base_url,
+            "api_key": getattr(llm, "api_key", None),
+            **(getattr(llm, "kwargs", None) or {}),
+            "stream": True,
+        }
+        params = {key: value for key, value in params.items() if value is not None}
+        for chunk in litellm.completion(**params):
+            text = chunk.choices[0].delta.content if chunk.choices else None
+            if text:
+                yield text
+
+
+def json_mode_params(model: str):
+    """response_format for JSON-only replies, when litellm says the model supports it"""
+    try:
+        import litellm
+
+        supported = litellm.get_supported_openai_params(model=model) or []
+    except Exception:
+        return {}
+    return {"response_format": {"type": "json_object"}} if "response_format" in supported else {}
+
 
-# Load the JSON file
-with open(file_path, 'r') as file:
-    vertex_credentials = json.load(file)
+def complete_json(llm: "LLM", messages) -> str:
+    """One non-streaming call with llm's settings, in JSON mode where the model supports it"""
+    import litellm
 
-# gemini model
-vertex_credentials_json = json.dumps(vertex_credentials)
+    llm_rate_limiter.acquire(getattr(llm, "rate_limit_key", llm.model))
+    _add_prompt_tokens(llm.model, messages)
+    with _base_url(llm) as base_url:
+        params = {
+            "model": llm.model,
+            "base_url": base_url,
+            "api_key": getattr(llm, "api_key", None),
+            **(getattr(llm, "kwargs", None) or {}),
+            "messages": messages,
+            "temperature": 0,
+            **json_mode_params(llm.model),
+        }
+        params = {key: value for key, value in params.items() if value is not None}
+        response = litellm.completion(**params)
+    return response.choices[0].message.content or ""
 
 
 # define class for LLM
@@ -23,51 +259,54 @@ vertex_credentials_json = json.dumps(vertex_credentials)
 class google_model:
 
     def gemini_2_flash():
-        return LLM(
+        return shared_llm(
+            "gemini_2_flash",
             model="gemini/gemini-2.0-flash",
             temperature=0.7,
-            vertex_credentials=vertex_credentials_json
+            vertex_credentials=vertex_credentials_json()
         )
         
     def gemini_2_flash_lite():
-        return LLM(
+        return shared_llm(
+            "gemini_2_flash_lite",
             model="gemini/gemini-2.0-flash-lite",
             temperature=0.7,
-            vertex_credentials=vertex_credentials_json
+            vertex_credentials=vertex_credentials_json()
         )
         
     def gemini_pro():
-        return LLM(
+        return shared_llm(
+            "gemini_pro",
             model="gemini/gemini-2.5-pro-exp-03-25",
             temperature=0.7,
-            vertex_credentials=vertex_credentials_json
+            vertex_credentials=vertex_credentials_json()
         )
 class local_model():
     
     def mistral():
-        return LLM(
+        return shared_llm(
+                "mistral",
                 model="ollama/mistral:latest",
-                base_url="http://localhost:11434",
                 temperature=0.7,
             )
         
     def gemma():
-        return LLM(
+        return shared_llm(
+                "gemma",
                 model="ollama/gemma3:latest",
-                base_url="http://localhost:11434",
                 temperature=0.7,
             )
         
     def ollama():
-        return LLM(
+        return shared_llm(
+            "ollama",
             model="ollama/llama3.2:latest",
-            base_url="http://localhost:11434",
             temperature=0.7,
         )
     
     def cogito():
-        return LLM(
+        return shared_llm(
+                "cogito",
                 model="ollama/cogito:latest",
-                base_url="http://localhost:11434",
                 temperature=0.7,
             )
\ No newline at end of file
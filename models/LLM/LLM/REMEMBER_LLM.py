@@ -1,11 +1,78 @@
-import ollama
+import json
+import os
+import sqlite3
+import sys
+import threading
 import time
-from typing import Dict, List
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+# The shared emotion matcher lives at the repository root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..")))
+from emotion_matcher import PhraseMatcher
+from ollama_router import router_from_env
+from shared_state import SharedState, shared_state_from_env
+
+# Session limits: idle sessions expire after SESSION_TTL seconds and at most SESSION_MAX are kept (LRU)
+SESSION_MAX = int(os.getenv("SESSION_MAX", "1000"))
+SESSION_TTL = float(os.getenv("SESSION_TTL", "3600"))
+# Approximate tokens of history sent to the model; older turns are folded into a digest
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "2000"))
+# SQLite file that keeps sessions across restarts; unset keeps them in memory only.
+# With SHARED_STATE_DB set, sessions live there instead and every process sees the same ones.
+SESSION_DB = os.getenv("SESSION_DB") or None
+
+
+def estimate_tokens(text: str) -> int:
+    # Roughly four characters per token, plus a few for the role and message framing
+    return len(text or "") // 4 + 4
+
+
+def first_sentence(text: str, limit: int = 160) -> str:
+    text = " ".join((text or "").split())
+    for mark in (". ", "? ", "! "):
+        if mark in text:
+            text = text.split(mark, 1)[0] + mark.strip()
+            break
+    return text if len(text) <= limit else text[:limit - 3] + "..."
+
+
+def extractive_digest(digest: str, messages: List[Dict], max_tokens: int) -> str:
+    """
+    Default digest: the first sentence of each folded message appended to the old digest,
+    dropping the oldest lines once it outgrows max_tokens. No model call, so it costs nothing per turn.
+    """
+    lines = [line for line in (digest or "").split("\n") if line]
+    for message in messages:
+        lines.append(f"{message['role']}: {first_sentence(message['content'])}")
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+    return "\n".join(lines)
 
 
 class ConversationManager:
-    def __init__(self):
-        self.sessions: Dict[str, Dict] = {}
+    def __init__(self, max_sessions: int = SESSION_MAX, idle_ttl: float = SESSION_TTL,
+                 history_tokens: int = HISTORY_TOKEN_BUDGET, db_path: Optional[str] = SESSION_DB,
+                 summarize: Callable[[str, List[Dict], int], str] = extractive_digest,
+                 state: Optional[SharedState] = None):
+        # Shared sessions replace both the in-memory and the SESSION_DB tier
+        self.state = state if state is not None else shared_state_from_env()
+        # Most recently used sessions last
+        self.sessions: "OrderedDict[str, Dict]" = OrderedDict()
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.history_tokens = history_tokens
+        self.summarize = summarize
+        self._lock = threading.RLock()
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS sessions "
+                "(session_id TEXT PRIMARY KEY, data TEXT NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._db.commit()
         self.emotion_prompts = {
             "sad": ["It sounds like you're feeling down. Would you like to talk about what's bothering you?",
                     "I'm here to listen if you need someone to talk to."],
@@ -20,64 +87,197 @@ class ConversationManager:
             "disappointed": ["I understand you're feeling disappointed. Let's see how we can improve things.",
                              "Every setback is a step toward success. Don't lose hope."]
         }
+        # Compiled once; self_reflect adds its new prompts to it as well
+        self.emotion_matcher = PhraseMatcher(self.emotion_prompts)
 
     def start_new_session(self, user_id: str) -> str:
         """Initialize a new session"""
         session_id = f"{user_id}_{time.time()}"
-        self.sessions[session_id] = {
+        session = {
             "messages": [],
+            "digest": "",
+            "tokens": 0,
+            "last_used": time.time(),
             "context": {
                 "detected_emotion": None,
                 "user_sentiment": None,
                 "feedback_received": False
             }
         }
+        if self.state is not None:
+            self.state.set("sessions", session_id, session, ttl=self.idle_ttl)
+            self.state.purge("sessions")
+            # Every access rewrites a session with idle_ttl, so the oldest expiry is the least recently used
+            self.state.trim("sessions", self.max_sessions)
+            return session_id
+        with self._lock:
+            self.sessions[session_id] = session
+            self._save(session_id)
+            self._evict()
+            self._sweep_db()
         return session_id
 
     def add_message(self, session_id: str, role: str, content: str):
-        """Add a message to the conversation history"""
-        if session_id in self.sessions:
-            self.sessions[session_id]["messages"].append({
+        """Add a message to the conversation history, folding the oldest turns into the digest when over budget"""
+        def append(session):
+            session["messages"].append({
                 "role": role,
                 "content": content
             })
+            session["tokens"] += estimate_tokens(content)
+            self._fold(session)
+
+        self._with_session(session_id, append)
 
     def get_context(self, session_id: str) -> List[Dict]:
-        """Get the conversation context"""
-        return self.sessions[session_id]["messages"] if session_id in self.sessions else []
+        """
+        Get the conversation context: the digest of older turns as a system message, then
+        the recent messages. Returns a new list, so callers can add per-turn messages to it.
+        """
+        def context(session):
+            messages = []
+            if session["digest"]:
+                messages.append({
+                    'role': 'system',
+                    'content': f"Summary of the earlier conversation:\n{session['digest']}"
+                })
+            return messages + [dict(message) for message in session["messages"]]
+
+        return self._with_session(session_id, context, save=False) or []
 
     def update_context(self, session_id: str, key: str, value):
         """Update context information for a session"""
-        if session_id in self.sessions:
-            self.sessions[session_id]["context"][key] = value
+        def update(session):
+            session["context"][key] = value
+
+        self._with_session(session_id, update)
+
+    def end_session(self, session_id: str):
+        if self.state is not None:
+            self.state.delete("sessions", session_id)
+            return
+        with self._lock:
+            self.sessions.pop(session_id, None)
+            if self._db is not None:
+                self._db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+                self._db.commit()
 
     def detect_emotion(self, user_input: str) -> str:
-        """Detect emotion from user input"""
-        for emotion, prompts in self.emotion_prompts.items():
-            for prompt in prompts:
-                if prompt.lower() in user_input.lower():
-                    return emotion
-        return None
+        """Detect emotion from user input: the emotion whose prompts match it most often"""
+        return self.emotion_matcher.match(user_input)
+
+    def detect_emotions(self, user_input: str) -> Dict[str, int]:
+        """Every emotion whose prompts appear in the user input, with its number of matches"""
+        return self.emotion_matcher.scores(user_input)
 
     def self_reflect(self, session_id: str, user_input: str) -> bool:
         """
         Model self-reflection: adjust emotional prompts based on user feedback
         """
-        if session_id not in self.sessions:
+        if not self._with_session(session_id, lambda session: True, save=False):
             return False
 
         if "not helpful" in user_input.lower():
             print("Model is reflecting on its response...")
-            self.emotion_prompts.setdefault("confused", []).append(
-                "I'm sorry if my response wasn't helpful. Can you clarify what you need?"
-            )
+            prompt = "I'm sorry if my response wasn't helpful. Can you clarify what you need?"
+            self.emotion_prompts.setdefault("confused", []).append(prompt)
+            self.emotion_matcher.add("confused", prompt)
             self.update_context(session_id, "feedback_received", True)
             return True
         return False
 
+    def _with_session(self, session_id: str, fn: Callable[[Dict], object], save: bool = True):
+        """
+        fn(session) on a live session, which is saved afterwards; None when the session is
+        unknown or expired. Shared sessions are changed atomically across processes.
+        """
+        if self.state is None:
+            with self._lock:
+                session = self._session(session_id)
+                if session is None:
+                    return None
+                result = fn(session)
+                if save:
+                    self._save(session_id)
+                return result
+
+        result = None
+
+        def apply(session):
+            nonlocal result
+            if session is not None:
+                session["last_used"] = time.time()
+                result = fn(session)
+            return session
+
+        # Always written back, which also pushes out the session's expiry
+        self.state.update("sessions", session_id, apply, ttl=self.idle_ttl)
+        return result
+
+    def _session(self, session_id: str) -> Optional[Dict]:
+        # Caller holds self._lock. Marks the session as used, loading it from SQLite if it was evicted.
+        now = time.time()
+        session = self.sessions.get(session_id)
+        if session is None and self._db is not None:
+            row = self._db.execute(
+                "SELECT data FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is not None:
+                session = json.loads(row[0])
+                self.sessions[session_id] = session
+        if session is None:
+            return None
+        if now - session["last_used"] > self.idle_ttl:
+            self.end_session(session_id)
+            return None
+        session["last_used"] = now
+        self.sessions.move_to_end(session_id)
+        self._evict()
+        return session
+
+    def _fold(self, session: Dict):
+        # Keep the latest exchange verbatim even if it alone is over budget
+        folded = []
+        while len(session["messages"]) > 2 and session["tokens"] > self.history_tokens:
+            message = session["messages"].pop(0)
+            session["tokens"] -= estimate_tokens(message["content"])
+            folded.append(message)
+        if folded:
+            # The digest gets a quarter of the budget
+            session["digest"] = self.summarize(session["digest"], folded, self.history_tokens // 4)
+
+    def _evict(self):
+        # Caller holds self._lock. Drops idle sessions, then the least recently used beyond
+        # max_sessions; evicted sessions stay in SQLite until they expire.
+        now = time.time()
+        while self.sessions:
+            session = next(iter(self.sessions.values()))
+            if now - session["last_used"] <= self.idle_ttl and len(self.sessions) <= self.max_sessions:
+                break
+            self.sessions.popitem(last=False)
+
+    def _sweep_db(self):
+        # Caller holds self._lock
+        if self._db is not None:
+            self._db.execute("DELETE FROM sessions WHERE last_used < ?", (time.time() - self.idle_ttl,))
+            self._db.commit()
+
+    def _save(self, session_id: str):
+        # Caller holds self._lock
+        if self._db is None:
+            return
+        session = self.sessions[session_id]
+        self._db.execute(
+            "INSERT OR REPLACE INTO sessions (session_id, data, last_used) VALUES (?, ?, ?)",
+            (session_id, json.dumps(session, ensure_ascii=False), session["last_used"]),
+        )
+        self._db.commit()
+
 
 # Initialize conversation manager
 conv_manager = ConversationManager()
+# Chat calls go to the least busy healthy server in OLLAMA_ENDPOINTS
+ollama_router = router_from_env()
 
 
 # Main program
@@ -103,10 +303,10 @@ def main():
         if emotion:
             conv_manager.update_context(session_id, "detected_emotion", emotion)
 
-        # Prepare conversation context
+        # Prepare conversation context (a bounded window: digest plus recent turns)
         messages = conv_manager.get_context(session_id)
 
-        # If emotion is detected, add an emotional prompt
+        # If emotion is detected, add an emotional prompt for this turn only
         if emotion:
             messages.append({
                 'role': 'system',
@@ -114,7 +314,7 @@ def main():
             })
 
         # Get model response
-        response = ollama.chat(
+        response = ollama_router.chat(
             model='llama3.1',
             messages=messages
         )
@@ -1,10 +1,14 @@
+import itertools
+import json
+import multiprocessing
+import os
 import torch
 import torch.nn as nn
 import torch.optim as optim
-from torch.utils.data import Dataset, DataLoader
+from torch.utils.data import Dataset, DataLoader, Sampler
 import numpy as np
 from sklearn.preprocessing import LabelEncoder
-from torch.nn.utils.rnn import pad_sequence
+from torch.nn.utils.rnn import pack_padded_sequence, pad_sequence
 import random
 
 
@@ -29,23 +33,82 @@ responses = {
 }
 
 
+def save_corpus(prefix, tokens, offsets, labels=None):
+    """
+    Write a tokenised corpus as <prefix>.tokens.npy (every token id, int32) and
+    <prefix>.offsets.npy (text i is tokens[offsets[i]:offsets[i + 1]]), plus
+    <prefix>.labels.npy when labels are given.
+    """
+    np.save(f"{prefix}.tokens.npy", np.asarray(tokens, dtype=np.int32))
+    np.save(f"{prefix}.offsets.npy", np.asarray(offsets, dtype=np.int64))
+    if labels is not None:
+        np.save(f"{prefix}.labels.npy", np.asarray(labels, dtype=str))
+
+
+def load_corpus(prefix):
+    """Memory-map a corpus written by save_corpus; returns (tokens, offsets, labels or None)"""
+    tokens = np.load(f"{prefix}.tokens.npy", mmap_mode="r")
+    offsets = np.load(f"{prefix}.offsets.npy", mmap_mode="r")
+    try:
+        labels = np.load(f"{prefix}.labels.npy")
+    except FileNotFoundError:
+        labels = None
+    return tokens, offsets, labels
+
+
 class TextDataset(Dataset):
+    """
+    Texts are tokenised once, up front, into a flat int32 buffer with offsets, so __getitem__
+    is a slice. A dataset built with from_corpus reads that buffer memory-mapped instead.
+    """
+
     def __init__(self, texts, labels, tokenizer, max_len):
-        self.texts = texts
-        self.labels = labels
         self.tokenizer = tokenizer
         self.max_len = max_len
         self.label_encoder = LabelEncoder()
-        self.labels = self.label_encoder.fit_transform(self.labels)
+        self.labels = self.label_encoder.fit_transform(labels)
+        self._corpus = None
+        if texts is not None:
+            self.tokens, self.offsets = tokenizer.encode_batch(texts)
+
+    @classmethod
+    def from_corpus(cls, prefix, tokenizer, labels=None, max_len=None):
+        """Dataset over a corpus saved with save_corpus; labels default to the saved ones"""
+        tokens, offsets, saved_labels = load_corpus(prefix)
+        dataset = cls(None, saved_labels if labels is None else labels, tokenizer, max_len)
+        dataset.tokens, dataset.offsets = tokens, offsets
+        dataset._corpus = prefix
+        return dataset
+
+    def save(self, prefix):
+        save_corpus(prefix, self.tokens, self.offsets, self.label_encoder.inverse_transform(self.labels))
 
     def __len__(self):
-        return len(self.texts)
+        return len(self.offsets) - 1
+
+    def lengths(self):
+        """Token count of every text, after max_len truncation"""
+        lengths = np.diff(self.offsets)
+        return np.minimum(lengths, self.max_len) if self.max_len else lengths
 
     def __getitem__(self, idx):
-        text = self.texts[idx]
-        label = self.labels[idx]
-        tokens = self.tokenizer.texts_to_sequences([text])[0]  # 使用 texts_to_sequences 方法
-        return torch.tensor(tokens, dtype=torch.long), torch.tensor(label, dtype=torch.long)
+        start, end = self.offsets[idx], self.offsets[idx + 1]
+        if self.max_len:
+            end = min(end, start + self.max_len)
+        # int32 view into the buffer; collate_fn converts the whole batch to long at once
+        return self.tokens[start:end], torch.tensor(self.labels[idx], dtype=torch.long)
+
+    def __getstate__(self):
+        # DataLoader workers re-open a memory-mapped corpus instead of receiving a copy of it
+        state = dict(self.__dict__)
+        if self._corpus is not None:
+            del state["tokens"], state["offsets"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self._corpus is not None:
+            self.tokens, self.offsets, _ = load_corpus(self._corpus)
 
 
 class SimpleTokenizer:
@@ -54,10 +117,11 @@ class SimpleTokenizer:
         self.index = 1
 
     def fit_on_texts(self, texts):
+        vocab = self.vocab
         for text in texts:
             for word in text.split():
-                if word not in self.vocab:
-                    self.vocab[word] = self.index
+                if word not in vocab:
+                    vocab[word] = self.index
                     self.index += 1
 
     def texts_to_sequences(self, texts):
@@ -67,6 +131,90 @@ class SimpleTokenizer:
             sequences.append(sequence)
         return sequences
 
+    def encode_batch(self, texts):
+        """
+        Tokenise many texts at once into a flat int32 array of token ids and an int64 array
+        of offsets, where text i is tokens[offsets[i]:offsets[i + 1]]
+        """
+        lookup = self.vocab.get
+        lengths = []
+        ids = []
+        for text in texts:
+            words = text.split()
+            lengths.append(len(words))
+            ids.append(map(lookup, words, itertools.repeat(0)))
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        tokens = np.fromiter(itertools.chain.from_iterable(ids), dtype=np.int32, count=int(offsets[-1]))
+        return tokens, offsets
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump({"vocab": self.vocab}, file, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path):
+        tokenizer = cls()
+        with open(path, encoding="utf-8") as file:
+            tokenizer.vocab = json.load(file)["vocab"]
+        tokenizer.index = max(tokenizer.vocab.values(), default=0) + 1
+        return tokenizer
+
+class BucketBatchSampler(Sampler):
+    """
+    Batches of texts with similar lengths, so little of each batch is padding. Indices are
+    shuffled, cut into pools of bucket_batches batches, sorted by length within each pool
+    and split into batches; the batch order is shuffled again every epoch.
+    """
+
+    def __init__(self, lengths, batch_size, shuffle=True, bucket_batches=50, seed=0, drop_last=False):
+        self.lengths = np.asarray(lengths)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.bucket_batches = bucket_batches
+        self.drop_last = drop_last
+        self.seed = seed
+        self.epoch = 0
+
+    def __iter__(self):
+        rng = np.random.default_rng(self.seed + self.epoch)
+        self.epoch += 1
+        order = rng.permutation(len(self.lengths)) if self.shuffle else np.arange(len(self.lengths))
+        pool_size = self.batch_size * self.bucket_batches
+        batches = []
+        for start in range(0, len(order), pool_size):
+            pool = order[start:start + pool_size]
+            pool = pool[np.argsort(self.lengths[pool], kind="stable")]
+            for batch_start in range(0, len(pool), self.batch_size):
+                batch = pool[batch_start:batch_start + self.batch_size]
+                if len(batch) == self.batch_size or not self.drop_last:
+                    batches.append(batch.tolist())
+        if self.shuffle:
+            rng.shuffle(batches)
+        return iter(batches)
+
+    def __len__(self):
+        if self.drop_last:
+            return len(self.lengths) // self.batch_size
+        return -(-len(self.lengths) // self.batch_size)
+
+
+def make_dataloader(dataset, lengths, batch_size, shuffle=True, num_workers=0, seed=0):
+    """DataLoader over length-bucketed batches, optionally with worker processes"""
+    options = {}
+    if num_workers > 0:
+        options["persistent_workers"] = True
+        # This module is often loaded by file path, which spawned workers couldn't import again
+        if "fork" in multiprocessing.get_all_start_methods():
+            options["multiprocessing_context"] = "fork"
+    return DataLoader(
+        dataset,
+        batch_sampler=BucketBatchSampler(lengths, batch_size, shuffle=shuffle, seed=seed),
+        collate_fn=collate_fn,
+        num_workers=num_workers,
+        **options,
+    )
+
 #  LSTM模型
 class EmotionClassifier(nn.Module):
     def __init__(self, vocab_size, embedding_dim, hidden_dim, output_dim, n_layers, dropout):
@@ -76,39 +224,105 @@ class EmotionClassifier(nn.Module):
         self.fc = nn.Linear(hidden_dim, output_dim)
         self.dropout = nn.Dropout(dropout)
 
-    def forward(self, text):
+    def forward(self, text, lengths=None):
+        """
+        text is a padded batch; with lengths (as returned by collate_fn) the LSTM skips the
+        padding and hidden[-1] is each text's state after its last real token
+        """
         embedded = self.dropout(self.embedding(text))
+        if lengths is not None:
+            embedded = pack_padded_sequence(embedded, lengths.cpu(), batch_first=True, enforce_sorted=False)
         output, (hidden, cell) = self.lstm(embedded)
         return self.fc(hidden[-1])
 
 
 def collate_fn(batch):
+    """Pad a batch; returns (texts, labels, lengths)"""
     texts, labels = zip(*batch)
+    # An empty text becomes a single padding token so it still has a state to classify
+    # np.array copies the (read-only, memory-mapped) int32 slice into a writable int64 array that torch can share
+    texts = [torch.from_numpy(np.array(text if len(text) else [0], dtype=np.int64)) for text in texts]
+    lengths = torch.tensor([len(text) for text in texts], dtype=torch.long)
     texts_padded = pad_sequence(texts, batch_first=True, padding_value=0)  # 填充文本序列
     labels = torch.stack(labels)  # 将标签堆叠成一个张量
-    return texts_padded, labels
+    return texts_padded, labels, lengths
 
 
 def train(model, dataloader, optimizer, criterion, device):
+    """One epoch; returns the mean training loss"""
     model.train()
-    for texts, labels in dataloader:
+    total, count = 0.0, 0
+    for texts, labels, lengths in dataloader:
         texts, labels = texts.to(device), labels.to(device)
         optimizer.zero_grad()
-        predictions = model(texts)
+        predictions = model(texts, lengths)
         loss = criterion(predictions, labels)
         loss.backward()
         optimizer.step()
+        total += loss.item() * len(labels)
+        count += len(labels)
+    return total / max(count, 1)
 
 
-def classify_emotion(model, tokenizer, text, device, dataset):
+def evaluate(model, dataloader, criterion, device):
+    """Mean loss and accuracy over a held-out dataloader"""
     model.eval()
-    with torch.no_grad():
-        tokens = tokenizer.texts_to_sequences([text])
-        tokens = pad_sequence([torch.tensor(seq, dtype=torch.long) for seq in tokens], batch_first=True)
-        tokens = tokens.to(device)
-        predictions = model(tokens)
-        emotion_index = torch.argmax(predictions, dim=1).item()
-    return dataset.label_encoder.inverse_transform([emotion_index])[0]
+    total, correct, count = 0.0, 0, 0
+    with torch.inference_mode():
+        for texts, labels, lengths in dataloader:
+            texts, labels = texts.to(device), labels.to(device)
+            predictions = model(texts, lengths)
+            total += criterion(predictions, labels).item() * len(labels)
+            correct += (predictions.argmax(dim=1) == labels).sum().item()
+            count += len(labels)
+    return {"loss": total / max(count, 1), "accuracy": correct / max(count, 1)}
+
+
+def save_checkpoint(path, model, optimizer, tokenizer, epoch, **extra):
+    """Model, optimizer and vocab after `epoch` finished epochs, written atomically"""
+    checkpoint = {
+        "epoch": epoch,
+        "model": model.state_dict(),
+        "optimizer": optimizer.state_dict(),
+        "vocab": tokenizer.vocab,
+        **extra,
+    }
+    temporary = f"{path}.tmp"
+    torch.save(checkpoint, temporary)
+    os.replace(temporary, path)
+
+
+def load_checkpoint(path, model, optimizer=None, device="cpu"):
+    """Restore a save_checkpoint file into model (and optimizer); returns the whole checkpoint"""
+    checkpoint = torch.load(path, map_location=device, weights_only=False)
+    model.load_state_dict(checkpoint["model"])
+    if optimizer is not None:
+        optimizer.load_state_dict(checkpoint["optimizer"])
+    return checkpoint
+
+
+def encode_for_model(tokenizer, texts, device):
+    """Padded token ids and lengths for a list of texts, ready for EmotionClassifier"""
+    tokens, offsets = tokenizer.encode_batch(texts)
+    batch = [(tokens[offsets[i]:offsets[i + 1]], torch.tensor(0)) for i in range(len(texts))]
+    padded, _, lengths = collate_fn(batch)
+    return padded.to(device), lengths
+
+
+def predict_batch(model, tokenizer, texts, device, temperature=1.0):
+    """Class probabilities for many texts in one forward pass"""
+    model.eval()
+    with torch.inference_mode():
+        padded, lengths = encode_for_model(tokenizer, texts, device)
+        return torch.softmax(model(padded, lengths) / temperature, dim=1)
+
+
+def classify_emotion(model, tokenizer, text, device, classes):
+    """classes is the list of labels by index, or a TextDataset to take them from"""
+    if isinstance(classes, TextDataset):
+        classes = classes.label_encoder.classes_
+    emotion_index = predict_batch(model, tokenizer, [text], device).argmax(dim=1).item()
+    return classes[emotion_index]
 
 
 def generate_response(emotion):
@@ -131,7 +345,7 @@ def main():
     tokenizer = SimpleTokenizer()
     tokenizer.fit_on_texts(texts)
     dataset = TextDataset(texts, labels, tokenizer, max_len=20)
-    dataloader = DataLoader(dataset, batch_size=BATCH_SIZE, shuffle=True, collate_fn=collate_fn)  # 使用自定义 collate_fn
+    dataloader = make_dataloader(dataset, dataset.lengths(), BATCH_SIZE)  # 使用自定义 collate_fn
 
 
     model = EmotionClassifier(VOCAB_SIZE, EMBEDDING_DIM, HIDDEN_DIM, OUTPUT_DIM, N_LAYERS, DROPOUT).to(DEVICE)
@@ -1,4 +1,10 @@
+import os
 import random
+import sys
+
+# The shared emotion matcher lives at the repository root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..")))
+from emotion_matcher import PhraseMatcher
 
 
 keywords = {
@@ -9,12 +15,14 @@ keywords = {
     "scared": ["Don't be afraid. I'm here to support you.", "You're stronger than you think. You can face this!"],
     "disappointed": ["Disappointments are temporary. There are always new opportunities.", "Don't lose hope. Every setback is a step toward success."]
 }
+# Each emotion is its own keyword, matched as a whole word
+keyword_matcher = PhraseMatcher({emotion: [emotion] for emotion in keywords})
 
 
 def detect_emotion(text):
-    for emotion, responses in keywords.items():
-        if emotion in text.lower():
-            return random.choice(responses)
+    emotion = keyword_matcher.match(text)
+    if emotion:
+        return random.choice(keywords[emotion])
     return "I understand how you feel. If you'd like, you can tell me more about it."
 
 
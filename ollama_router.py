@@ -0,0 +1,189 @@
+"""
+Spreads local model calls over several Ollama servers.
+
+    OLLAMA_ENDPOINTS=http://gpu-1:11434,http://gpu-2:11434
+    OLLAMA_MODEL_ENDPOINTS="cogito:latest=http://gpu-3:11434|http://gpu-4:11434"
+
+Each call goes to the healthy endpoint with the fewest calls in flight, and waits when every
+endpoint already has OLLAMA_MAX_CONCURRENCY calls running. An endpoint that fails
+OLLAMA_EJECT_AFTER calls in a row is taken out of rotation. It is probed (GET /api/tags) every
+OLLAMA_HEALTH_INTERVAL seconds and readmitted once it answers.
+"""
+import os
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+DEFAULT_ENDPOINT = "http://localhost:11434"
+
+
+class NoEndpointAvailable(Exception):
+    """Raised when no endpoint had a free slot within the timeout"""
+
+
+class Endpoint:
+    def __init__(self, url: str, max_concurrency: int):
+        self.url = url.rstrip("/")
+        self.max_concurrency = max_concurrency
+        self.outstanding = 0
+        self.failures = 0
+        self.healthy = True
+        self._client = None
+
+    @property
+    def client(self):
+        """ollama.Client for this endpoint, created once so its HTTP connections are reused"""
+        if self._client is None:
+            import ollama
+
+            self._client = ollama.Client(host=self.url)
+        return self._client
+
+    def __repr__(self):
+        state = "healthy" if self.healthy else "ejected"
+        return f"Endpoint({self.url}, {state}, {self.outstanding}/{self.max_concurrency})"
+
+
+class OllamaRouter:
+    """Least-outstanding-requests balancing over per-model pools of Ollama endpoints"""
+
+    def __init__(self, endpoints: Optional[List[str]] = None, model_endpoints: Optional[Dict[str, List[str]]] = None,
+                 max_concurrency: int = 4, eject_after: int = 3, health_interval: float = 10.0,
+                 health_timeout: float = 2.0):
+        self.max_concurrency = max(1, max_concurrency)
+        self.eject_after = max(1, eject_after)
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        # One Endpoint per URL, so its concurrency limit holds across every model it serves
+        self._endpoints: Dict[str, Endpoint] = {}
+        self._default = self._pool(endpoints or [DEFAULT_ENDPOINT])
+        self._pools = {model: self._pool(urls) for model, urls in (model_endpoints or {}).items()}
+        self._condition = threading.Condition()
+        self._health_thread = None
+
+    def _pool(self, urls: List[str]) -> List[Endpoint]:
+        pool = []
+        for url in urls:
+            url = url.strip().rstrip("/")
+            if url:
+                endpoint = self._endpoints.setdefault(url, Endpoint(url, self.max_concurrency))
+                pool.append(endpoint)
+        return pool
+
+    def endpoints(self, model: Optional[str] = None) -> List[Endpoint]:
+        """The pool serving model (the default pool when it has none of its own)"""
+        return self._pools.get(self._model_name(model), self._default) if model else list(self._endpoints.values())
+
+    @staticmethod
+    def _model_name(model: str) -> str:
+        # "ollama/mistral:latest" and "mistral:latest" are the same model
+        return model.split("/", 1)[1] if model.startswith("ollama/") else model
+
+    def _pick(self, pool: List[Endpoint]) -> Optional[Endpoint]:
+        # Caller holds self._condition. When every endpoint is ejected, they are all tried
+        # anyway rather than failing outright.
+        candidates = [endpoint for endpoint in pool if endpoint.healthy] or pool
+        free = [endpoint for endpoint in candidates if endpoint.outstanding < endpoint.max_concurrency]
+        if not free:
+            return None
+        return min(free, key=lambda endpoint: (endpoint.outstanding, endpoint.failures))
+
+    def acquire(self, model: str, timeout: Optional[float] = None) -> Endpoint:
+        """Reserve a slot on the least busy endpoint for model; release() it when the call ends"""
+        self._start_health_checks()
+        pool = self.endpoints(model)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while True:
+                endpoint = self._pick(pool)
+                if endpoint is not None:
+                    endpoint.outstanding += 1
+                    return endpoint
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise NoEndpointAvailable(f"No Ollama endpoint for {model} had a free slot")
+                self._condition.wait(remaining)
+
+    def release(self, endpoint: Endpoint, ok: bool = True):
+        with self._condition:
+            endpoint.outstanding -= 1
+            if ok:
+                endpoint.failures = 0
+                endpoint.healthy = True
+            else:
+                endpoint.failures += 1
+                if endpoint.failures >= self.eject_after:
+                    endpoint.healthy = False
+            self._condition.notify_all()
+
+    @contextmanager
+    def lease(self, model: str, timeout: Optional[float] = None):
+        """Hold a slot on an endpoint for model; an exception counts as a failed call"""
+        endpoint = self.acquire(model, timeout)
+        ok = False
+        try:
+            yield endpoint
+            ok = True
+        finally:
+            self.release(endpoint, ok)
+
+    def chat(self, model: str, messages, **kwargs):
+        """ollama.chat on the endpoint the router picks"""
+        with self.lease(model) as endpoint:
+            return endpoint.client.chat(model=self._model_name(model), messages=messages, **kwargs)
+
+    def check_health(self):
+        """Probe every ejected endpoint once and readmit those that answer"""
+        with self._condition:
+            ejected = [endpoint for endpoint in self._endpoints.values() if not endpoint.healthy]
+        for endpoint in ejected:
+            if self._probe(endpoint):
+                with self._condition:
+                    endpoint.healthy = True
+                    endpoint.failures = 0
+                    self._condition.notify_all()
+
+    def _probe(self, endpoint: Endpoint) -> bool:
+        try:
+            with urllib.request.urlopen(endpoint.url + "/api/tags", timeout=self.health_timeout) as response:
+                return response.status == 200
+        except Exception:
+            return False
+
+    def _start_health_checks(self):
+        if self._health_thread is not None or self.health_interval <= 0:
+            return
+        with self._condition:
+            if self._health_thread is None:
+                self._health_thread = threading.Thread(target=self._health_loop, name="ollama-health", daemon=True)
+                self._health_thread.start()
+
+    def _health_loop(self):
+        while True:
+            time.sleep(self.health_interval)
+            self.check_health()
+
+
+def parse_model_endpoints(value: str) -> Dict[str, List[str]]:
+    """Parse "model=url|url,model2=url" as used by OLLAMA_MODEL_ENDPOINTS"""
+    pools = {}
+    for item in (value or "").split(","):
+        if not item.strip():
+            continue
+        model, _, urls = item.partition("=")
+        if not urls:
+            raise ValueError(f"Expected model=url|url, got '{item.strip()}'")
+        pools[model.strip()] = [url for url in urls.split("|") if url.strip()]
+    return pools
+
+
+def router_from_env() -> OllamaRouter:
+    return OllamaRouter(
+        endpoints=[url for url in os.getenv("OLLAMA_ENDPOINTS", DEFAULT_ENDPOINT).split(",") if url.strip()],
+        model_endpoints=parse_model_endpoints(os.getenv("OLLAMA_MODEL_ENDPOINTS", "")),
+        max_concurrency=int(os.getenv("OLLAMA_MAX_CONCURRENCY", "4")),
+        eject_after=int(os.getenv("OLLAMA_EJECT_AFTER", "3")),
+        health_interval=float(os.getenv("OLLAMA_HEALTH_INTERVAL", "10")),
+    )
@@ -0,0 +1,106 @@
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from shared_state import SharedState, shared_state_from_env
+
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second on average, with bursts of up to `burst`"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0, timeout: Optional[float] = None) -> bool:
+        """Block until tokens are available; False if that would take longer than timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return True
+                wait = (tokens - self._tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class SharedTokenBucket:
+    """TokenBucket kept in a SharedState, so every process on the host draws from the same bucket"""
+
+    def __init__(self, state: SharedState, name: str, rate: float, burst: Optional[float] = None):
+        self.state = state
+        self.name = name
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+
+    def acquire(self, tokens: float = 1.0, timeout: Optional[float] = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.state.take(self.name, self.rate, self.burst, tokens)
+            if wait <= 0:
+                return True
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class RateLimiter:
+    """
+    Per-model request limits in requests per minute; models without a limit are never held back.
+    With a SharedState the limits hold across all processes using it rather than per process.
+    """
+
+    def __init__(self, limits: Optional[Dict[str, float]] = None, state: Optional[SharedState] = None):
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+        self.state = state
+        for model, per_minute in (limits or {}).items():
+            self.set_limit(model, per_minute)
+
+    def set_limit(self, model: str, per_minute: Optional[float]):
+        with self._lock:
+            if not per_minute or per_minute <= 0:
+                self._buckets.pop(model, None)
+            else:
+                # A second's worth of burst, so short spikes don't wait on an idle bucket
+                rate, burst = per_minute / 60.0, max(1.0, per_minute / 60.0)
+                if self.state is not None:
+                    self._buckets[model] = SharedTokenBucket(self.state, model, rate, burst)
+                else:
+                    self._buckets[model] = TokenBucket(rate, burst)
+
+    def limits(self) -> Dict[str, float]:
+        with self._lock:
+            return {model: bucket.rate * 60.0 for model, bucket in self._buckets.items()}
+
+    def acquire(self, model: str, timeout: Optional[float] = None) -> bool:
+        bucket = self._buckets.get(model)
+        if bucket is None:
+            return True
+        return bucket.acquire(timeout=timeout)
+
+
+def parse_limits(value: str) -> Dict[str, float]:
+    """Parse "model=requests_per_minute,..." as used by LLM_RATE_LIMITS and --rate-limit"""
+    limits = {}
+    for item in (value or "").split(","):
+        if not item.strip():
+            continue
+        model, _, per_minute = item.rpartition("=")
+        if not model:
+            raise ValueError(f"Expected model=requests_per_minute, got '{item.strip()}'")
+        limits[model.strip()] = float(per_minute)
+    return limits
+
+
+def limiter_from_env() -> RateLimiter:
+    return RateLimiter(parse_limits(os.getenv("LLM_RATE_LIMITS", "")), shared_state_from_env())
@@ -0,0 +1,228 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from shared_state import shared_state_path
+
+# Markers that stand in for customer details inside cached replies
+NAME_MARKER = "<<cust_name>>"
+DATE_MARKER = "<<purch_date>>"
+
+# Result fields that may mention the customer
+_TEMPLATED_FIELDS = ("response", "reviewed_response")
+
+
+def normalise(text: str) -> str:
+    """Lowercase and collapse whitespace so trivially different reviews share a key"""
+    return re.sub(r"\s+", " ", (text or "").strip().lower())
+
+
+def _occurrences(text: str, value: str) -> list:
+    """Spans of value in text as a whole word, ignoring case"""
+    return [match.span() for match in re.finditer(rf"(?<!\w){re.escape(value)}(?!\w)", text, re.IGNORECASE)]
+
+
+def _greeting_end(text: str) -> int:
+    # The opening line or sentence, where the prompts ask for 'Hey [Customer's Name]!'
+    return re.match(r"[^\n.!?]*", text).end()
+
+
+class ResponseCache:
+    """
+    Exact-match cache of crew results.
+    An in-memory LRU bounded by max_entries and ttl seconds sits in front of an optional
+    SQLite file, so replies survive restarts. Customer name and purchase date are stored
+    as markers and filled back in for whoever asks next. That is only done when they can't
+    be mistaken for other wording: the name once, in the greeting, and the date once, neither
+    of them found in fixed_text (the prompts), the product or the review. Other replies
+    are stored as they are and only served to the same customer.
+    """
+
+    def __init__(self, namespace: str, max_entries: int = 2048, ttl: float = 86400.0,
+                 db_path: Optional[str] = None, fixed_text: str = ""):
+        self.namespace = namespace
+        self.fixed_text = fixed_text
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._db = None
+        if db_path:
+            # Other workers may hold the write lock briefly
+            self._db = sqlite3.connect(db_path, timeout=30.0, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    @classmethod
+    def from_env(cls, namespace: str, fixed_text: str = "") -> "ResponseCache":
+        """
+        Build a cache configured by RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL and RESPONSE_CACHE_DB.
+        Without RESPONSE_CACHE_DB, the SQLite tier goes in SHARED_STATE_DB, so all workers share it.
+        """
+        return cls(
+            namespace,
+            max_entries=int(os.getenv("RESPONSE_CACHE_SIZE", "2048")),
+            ttl=float(os.getenv("RESPONSE_CACHE_TTL", "86400")),
+            db_path=os.getenv("RESPONSE_CACHE_DB") or shared_state_path(),
+            fixed_text=fixed_text,
+        )
+
+    def key(self, agent_input: Dict, personal: bool = False) -> str:
+        # Different pipeline profiles produce different replies, so they never share an entry
+        parts = [
+            self.namespace,
+            normalise(agent_input.get("product", "")),
+            normalise(agent_input.get("review", "")),
+            normalise(agent_input.get("profile", "")),
+        ]
+        if personal:
+            # Replies that couldn't be templated belong to their customer
+            parts += [agent_input.get("cust_name", ""), agent_input.get("purch_date", "")]
+        return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+    def get(self, agent_input: Dict) -> Optional[Dict]:
+        """Return the cached result re-templated for this customer, or None"""
+        now = time.time()
+        for key in (self.key(agent_input), self.key(agent_input, personal=True)):
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and now - entry[0] > self.ttl:
+                    del self._entries[key]
+                    entry = None
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return self._fill(entry[1], agent_input)
+
+            stored = self._disk_get(key, now)
+            if stored is not None:
+                with self._lock:
+                    self.hits += 1
+                    self.disk_hits += 1
+                    self._remember(key, stored)
+                return self._fill(stored[1], agent_input)
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, agent_input: Dict, result: Dict):
+        """Store a fresh result, replacing customer details with markers where that is safe"""
+        key = self.key(agent_input)
+        template = self._template(result, agent_input)
+        if template is None:
+            key = self.key(agent_input, personal=True)
+            template = self._measurements_removed(result)
+        entry = (time.time(), template)
+        with self._lock:
+            self._remember(key, entry)
+        if self._db is not None:
+            with self._lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO response_cache (key, value, created) VALUES (?, ?, ?)",
+                    (key, json.dumps(template, ensure_ascii=False), entry[0]),
+                )
+                self._db.commit()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+            }
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _disk_get(self, key, now):
+        if self._db is None:
+            return None
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, created FROM response_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                self._db.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+        return (row[1], json.loads(row[0]))
+
+    def adapt(self, result: Dict, source_input: Dict, agent_input: Dict) -> Optional[Dict]:
+        """
+        The result produced for source_input, re-addressed to the customer of agent_input;
+        None when its reply can't be templated and was for a different customer.
+        """
+        template = self._template(result, source_input)
+        if template is not None:
+            return self._fill(template, agent_input)
+        same_customer = all(source_input.get(field, "") == agent_input.get(field, "")
+                            for field in ("cust_name", "purch_date"))
+        return self._fill(self._measurements_removed(result), agent_input) if same_customer else None
+
+    @staticmethod
+    def _measurements_removed(result: Dict) -> Dict:
+        # Measurements of the run that produced the reply don't apply to later hits
+        template = dict(result)
+        template.pop("timings", None)
+        template.pop("prompt_tokens", None)
+        return template
+
+    def _template(self, result: Dict, agent_input: Dict) -> Optional[Dict]:
+        """result with the customer's name and date as markers, or None when that isn't safe"""
+        template = self._measurements_removed(result)
+        fixed = "\n".join([self.fixed_text, agent_input.get("product", ""), agent_input.get("review", "")])
+        details = [
+            (agent_input.get("cust_name", "").strip(), NAME_MARKER, True),
+            (agent_input.get("purch_date", "").strip(), DATE_MARKER, False),
+        ]
+        for field in _TEMPLATED_FIELDS:
+            text = template.get(field)
+            if not isinstance(text, str):
+                continue
+            for value, marker, greeting_only in details:
+                spans = _occurrences(text, value) if value else []
+                if not spans:
+                    continue
+                # "Customer" would also match "Customer Service Contact", "May" any "may"
+                if len(value) < 2 or len(spans) > 1 or _occurrences(fixed, value):
+                    return None
+                start, end = spans[0]
+                if greeting_only and start >= _greeting_end(text):
+                    return None
+                text = text[:start] + marker + text[end:]
+            template[field] = text
+        return template
+
+    @staticmethod
+    def _fill(template: Dict, agent_input: Dict) -> Dict:
+        result = dict(template)
+        result["name"] = agent_input.get("cust_name", "")
+        result["purchase_date"] = agent_input.get("purch_date", "")
+        result["review"] = agent_input.get("review", "")
+        for field in _TEMPLATED_FIELDS:
+            if isinstance(result.get(field), str):
+                result[field] = (
+                    result[field]
+                    .replace(NAME_MARKER, agent_input.get("cust_name", ""))
+                    .replace(DATE_MARKER, agent_input.get("purch_date", ""))
+                )
+        return result
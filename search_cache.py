@@ -0,0 +1,183 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Optional
+
+from response_cache import normalise
+
+
+class SerperBackend:
+    """Live web search through crewai_tools' SerperDevTool, created on the first search"""
+
+    def __init__(self):
+        self._tool = None
+        self._lock = threading.Lock()
+
+    @property
+    def tool(self):
+        if self._tool is None:
+            with self._lock:
+                if self._tool is None:
+                    from crewai_tools import SerperDevTool
+
+                    self._tool = SerperDevTool()
+        return self._tool
+
+    def search(self, query: str) -> str:
+        return str(self.tool.run(search_query=query))
+
+
+class FileSearchBackend:
+    """
+    Offline stand-in for Serper: answers from a JSON file mapping queries (or product names)
+    to result text, for tests and runs without network access.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "r", encoding="utf-8") as file:
+            self._results = {normalise(key): value for key, value in json.load(file).items()}
+
+    def search(self, query: str) -> str:
+        result = self._results.get(normalise(query))
+        if result is None:
+            return f"No search results found for '{query}'."
+        return result if isinstance(result, str) else json.dumps(result, ensure_ascii=False)
+
+
+def backend_from_env():
+    """SEARCH_BACKEND=file reads SEARCH_FILE; anything else uses Serper"""
+    if os.getenv("SEARCH_BACKEND", "serper").lower() == "file":
+        return FileSearchBackend(os.getenv("SEARCH_FILE", "search_results.json"))
+    return SerperBackend()
+
+
+class SearchCache:
+    """
+    Search results keyed by normalised query (usually the product name).
+    Entries older than refresh_after are served while a background refresh runs, entries
+    older than ttl are fetched again before answering, and at most max_entries are kept (LRU).
+    Concurrent requests for the same query share one backend call.
+    """
+
+    def __init__(self, backend, max_entries: int = 512, ttl: float = 21600.0,
+                 refresh_after: float = 3600.0, workers: int = 2):
+        self.backend = backend
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.refresh_after = refresh_after
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="search-prefetch")
+        self._refresher = None
+        self.hits = 0
+        self.misses = 0
+        self.fetches = 0
+
+    @classmethod
+    def from_env(cls, backend=None) -> "SearchCache":
+        """Build a cache configured by SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL and SEARCH_REFRESH_AFTER"""
+        return cls(
+            backend if backend is not None else backend_from_env(),
+            max_entries=int(os.getenv("SEARCH_CACHE_SIZE", "512")),
+            ttl=float(os.getenv("SEARCH_CACHE_TTL", "21600")),
+            refresh_after=float(os.getenv("SEARCH_REFRESH_AFTER", "3600")),
+        )
+
+    def get(self, query: str) -> str:
+        """Return results for query, fetching them first only if nothing usable is cached"""
+        key = normalise(query)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry["fetched"] <= self.ttl:
+                entry["used"] = now
+                self._entries.move_to_end(key)
+                self.hits += 1
+                if now - entry["fetched"] > self.refresh_after:
+                    self._schedule(key, query)
+                return entry["result"]
+            self.misses += 1
+            future = self._schedule(key, query)
+        try:
+            return future.result()
+        except Exception:
+            if entry is not None:
+                return entry["result"]
+            raise
+
+    def peek(self, query: str) -> Optional[str]:
+        """Cached results for query without ever calling the backend"""
+        with self._lock:
+            entry = self._entries.get(normalise(query))
+            if entry is None or time.time() - entry["fetched"] > self.ttl:
+                return None
+            return entry["result"]
+
+    def prefetch(self, query: str):
+        """Start fetching query in the background unless fresh results are cached"""
+        if not query:
+            return
+        key = normalise(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.time() - entry["fetched"] > self.refresh_after:
+                self._schedule(key, query)
+
+    def start_refresher(self, interval: float = 300.0, recent: float = 3600.0):
+        """Keep results for products used within `recent` seconds fresh in the background"""
+        if self._refresher is not None:
+            return
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                now = time.time()
+                with self._lock:
+                    for key, entry in self._entries.items():
+                        if now - entry["used"] <= recent and now - entry["fetched"] > self.refresh_after:
+                            self._schedule(key, entry["query"])
+
+        self._refresher = threading.Thread(target=loop, name="search-refresher", daemon=True)
+        self._refresher.start()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "fetches": self.fetches,
+                "entries": len(self._entries),
+            }
+
+    def _schedule(self, key, query) -> Future:
+        # Caller holds self._lock
+        future = self._inflight.get(key)
+        if future is None:
+            future = self._pool.submit(self._fetch, key, query)
+            self._inflight[key] = future
+        return future
+
+    def _fetch(self, key, query):
+        try:
+            result = self.backend.search(query)
+            now = time.time()
+            with self._lock:
+                self.fetches += 1
+                previous = self._entries.get(key)
+                self._entries[key] = {
+                    "query": query,
+                    "result": result,
+                    "fetched": now,
+                    "used": previous["used"] if previous else now,
+                }
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            return result
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
@@ -0,0 +1,392 @@
+"""
+In-process sentiment service built on the LSTM EmotionClassifier from
+models/en/Sentiment Classification/main.py.
+
+Train once on the cleaned gift-card reviews (sentiment) and empathetic dialogues (emotion):
+
+    python sentiment_service.py --gift-card amazon_reviews_us_Gift_Card_v1_00.tsv \
+        --empathetic emotion-emotion_69k.csv
+
+The saved file is loaded once per process and used by run_agent to skip the two LLM
+sentiment stages when the classifier is confident.
+"""
+import argparse
+import csv
+import importlib.util
+import logging
+import os
+import re
+import sys
+import threading
+from typing import Dict, List, Optional
+
+import metrics
+from micro_batch import MicroBatcher
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CLASSIFIER_DIR = os.path.join(BASE_DIR, "models", "en", "Sentiment Classification")
+DEFAULT_MODEL_PATH = os.path.join(CLASSIFIER_DIR, "sentiment_service.pt")
+
+# Star rating to sentiment, as in the gift-card EDA
+STAR_SENTIMENT = {1: "Negative", 2: "Negative", 3: "Neutral", 4: "Positive", 5: "Positive"}
+
+EMBEDDING_DIM = 64
+HIDDEN_DIM = 128
+N_LAYERS = 2
+DROPOUT = 0.5
+
+
+def clean_text(text: str) -> str:
+    """Same cleaning as Data cleaning+EDA.ipynb"""
+    text = re.sub(r"<.*?>", "", str(text))
+    text = re.sub(r"http\S+", "", text)
+    text = re.sub(r"[^a-zA-Z\s]", "", text)
+    return text.lower().strip()
+
+
+def load_classifier_module():
+    """Import the EmotionClassifier module from its folder (the name has a space, so no package import)"""
+    module = sys.modules.get("emotion_classifier")
+    if module is None:
+        spec = importlib.util.spec_from_file_location(
+            "emotion_classifier", os.path.join(CLASSIFIER_DIR, "main.py")
+        )
+        module = importlib.util.module_from_spec(spec)
+        sys.modules["emotion_classifier"] = module
+        spec.loader.exec_module(module)
+    return module
+
+
+def read_gift_card(path: str, limit: Optional[int] = None):
+    """Yield (text, sentiment) from the gift-card review TSV"""
+    csv.field_size_limit(sys.maxsize)
+    count = 0
+    with open(path, newline="", encoding="utf-8", errors="replace") as file:
+        for row in csv.DictReader(file, delimiter="\t", quoting=csv.QUOTE_NONE):
+            try:
+                sentiment = STAR_SENTIMENT[int(row["star_rating"])]
+            except (KeyError, TypeError, ValueError):
+                continue
+            text = clean_text(row.get("review_body") or "")
+            if not text:
+                continue
+            yield text, sentiment
+            count += 1
+            if limit and count >= limit:
+                return
+
+
+def read_empathetic(path: str, limit: Optional[int] = None):
+    """Yield (text, emotion) from the empathetic dialogues CSV"""
+    count = 0
+    with open(path, newline="", encoding="utf-8", errors="replace") as file:
+        for row in csv.DictReader(file):
+            emotion = (row.get("emotion") or "").strip()
+            text = clean_text(row.get("empathetic_dialogues") or "")
+            if not emotion or not text:
+                continue
+            yield text, emotion
+            count += 1
+            if limit and count >= limit:
+                return
+
+
+def _fit_temperature(model, dataloader, device):
+    """Temperature scaling on held-out data so softmax scores behave like probabilities"""
+    import torch
+    import torch.nn as nn
+
+    model.eval()
+    logits, labels = [], []
+    with torch.no_grad():
+        for texts, batch_labels, lengths in dataloader:
+            logits.append(model(texts.to(device), lengths))
+            labels.append(batch_labels.to(device))
+    if not logits:
+        return 1.0
+    logits = torch.cat(logits)
+    labels = torch.cat(labels)
+
+    log_t = torch.zeros(1, requires_grad=True, device=device)
+    optimizer = torch.optim.LBFGS([log_t], lr=0.1, max_iter=100)
+    criterion = nn.CrossEntropyLoss()
+
+    def closure():
+        optimizer.zero_grad()
+        loss = criterion(logits / log_t.exp(), labels)
+        loss.backward()
+        return loss
+
+    optimizer.step(closure)
+    return float(log_t.exp().item())
+
+
+def train_head(dataset, epochs: int, batch_size: int, device, workers: int = 0,
+               checkpoint_path: Optional[str] = None, checkpoint_every: int = 1) -> Dict:
+    """
+    Train one EmotionClassifier on a TextDataset and return its saved form. With
+    checkpoint_path, training state is saved every checkpoint_every epochs and an
+    interrupted run picks up from the last checkpoint.
+    """
+    import torch
+    import torch.nn as nn
+    import torch.optim as optim
+    from torch.utils.data import random_split
+
+    m = load_classifier_module()
+    tokenizer = dataset.tokenizer
+    val_size = max(1, len(dataset) // 10)
+    train_set, val_set = random_split(
+        dataset, [len(dataset) - val_size, val_size], generator=torch.Generator().manual_seed(0)
+    )
+    lengths = dataset.lengths()
+    train_loader = m.make_dataloader(train_set, lengths[train_set.indices], batch_size, num_workers=workers)
+    val_loader = m.make_dataloader(val_set, lengths[val_set.indices], batch_size, shuffle=False)
+
+    classes = [str(label) for label in dataset.label_encoder.classes_]
+    config = {
+        "vocab_size": tokenizer.index,
+        "embedding_dim": EMBEDDING_DIM,
+        "hidden_dim": HIDDEN_DIM,
+        "output_dim": len(classes),
+        "n_layers": N_LAYERS,
+        "dropout": DROPOUT,
+    }
+    model = m.EmotionClassifier(**config).to(device)
+    optimizer = optim.Adam(model.parameters())
+    criterion = nn.CrossEntropyLoss()
+
+    start = 0
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        start = m.load_checkpoint(checkpoint_path, model, optimizer, device)["epoch"]
+        train_loader.batch_sampler.epoch = start
+        print(f"Resuming from {checkpoint_path} after epoch {start}.")
+
+    for epoch in range(start, epochs):
+        loss = m.train(model, train_loader, optimizer, criterion, device)
+        scores = m.evaluate(model, val_loader, criterion, device)
+        print(f"Epoch {epoch + 1}/{epochs}: train loss {loss:.4f}, "
+              f"val loss {scores['loss']:.4f}, val accuracy {scores['accuracy']:.3f}")
+        if checkpoint_path and ((epoch + 1) % checkpoint_every == 0 or epoch + 1 == epochs):
+            m.save_checkpoint(checkpoint_path, model, optimizer, tokenizer, epoch + 1, config=config, classes=classes)
+
+    temperature = _fit_temperature(model, val_loader, device)
+    print(f"Fitted temperature {temperature:.3f} over {len(classes)} classes.")
+    return {
+        "config": config,
+        "state_dict": model.state_dict(),
+        "classes": classes,
+        "temperature": temperature,
+    }
+
+
+class SentimentService:
+    """
+    Loads the saved sentiment and emotion classifiers and answers with calibrated confidence.
+    Concurrent classify() calls are gathered into micro-batches of up to max_batch_size texts,
+    waiting at most max_wait_ms for a batch to fill, and each batch is one forward pass per head.
+    """
+
+    def __init__(self, path: str, device: str = "cpu", max_batch_size: Optional[int] = None,
+                 max_wait_ms: Optional[float] = None, quantize: Optional[bool] = None,
+                 num_threads: Optional[int] = None):
+        import torch
+        import torch.nn as nn
+
+        if max_batch_size is None:
+            max_batch_size = int(os.getenv("SENTIMENT_MAX_BATCH", "64"))
+        if max_wait_ms is None:
+            max_wait_ms = float(os.getenv("SENTIMENT_MAX_WAIT_MS", "2"))
+        if quantize is None:
+            quantize = os.getenv("SENTIMENT_QUANTIZE", "0").lower() in ("1", "true", "yes")
+        if num_threads is None:
+            num_threads = int(os.getenv("SENTIMENT_THREADS", "0"))
+        if num_threads > 0:
+            torch.set_num_threads(num_threads)
+
+        m = load_classifier_module()
+        self._m = m
+        checkpoint = torch.load(path, map_location=device)
+        self.device = torch.device(device)
+        self.tokenizer = m.SimpleTokenizer()
+        self.tokenizer.vocab = checkpoint["vocab"]
+        self.tokenizer.index = max(self.tokenizer.vocab.values(), default=0) + 1
+        self.heads = {}
+        for name in ("sentiment", "emotion"):
+            head = checkpoint[name]
+            model = m.EmotionClassifier(**head["config"]).to(self.device)
+            model.load_state_dict(head["state_dict"])
+            model.eval()
+            if quantize and self.device.type == "cpu":
+                # int8 weights for the LSTM and output layer; activations stay float
+                model = torch.ao.quantization.quantize_dynamic(model, {nn.LSTM, nn.Linear}, dtype=torch.qint8)
+            self.heads[name] = (model, head["classes"], head["temperature"])
+        self._batcher = MicroBatcher(
+            self._classify_batch, max_batch_size, max_wait_ms / 1000.0, name="sentiment-batch",
+            on_batch=lambda size: metrics.sentiment_batch_size.observe(size),
+        )
+
+    def _predict(self, name, padded, lengths):
+        import torch
+
+        model, classes, temperature = self.heads[name]
+        probs = torch.softmax(model(padded, lengths) / temperature, dim=1)
+        confidence, index = torch.max(probs, dim=1)
+        return [(classes[i], c) for i, c in zip(index.tolist(), confidence.tolist())]
+
+    def _classify_batch(self, texts):
+        import torch
+
+        cleaned = [clean_text(text) for text in texts]
+        tokens, offsets = self.tokenizer.encode_batch(cleaned)
+        # Texts without a single known word have nothing to classify
+        known = [i for i in range(len(texts)) if tokens[offsets[i]:offsets[i + 1]].any()]
+        results = [None] * len(texts)
+        if not known:
+            return results
+        with torch.inference_mode():
+            batch = [(tokens[offsets[i]:offsets[i + 1]], torch.tensor(0)) for i in known]
+            padded, _, lengths = self._m.collate_fn(batch)
+            padded = padded.to(self.device)
+            sentiments = self._predict("sentiment", padded, lengths)
+            emotions = self._predict("emotion", padded, lengths)
+        for i, (sentiment, confidence), (emotion, emotion_confidence) in zip(known, sentiments, emotions):
+            results[i] = {
+                "sentiment": sentiment,
+                "emotion": emotion,
+                "confidence": round(confidence, 4),
+                "emotion_confidence": round(emotion_confidence, 4),
+            }
+        return results
+
+    def classify(self, text: str) -> Optional[Dict]:
+        """
+        Return {"sentiment", "emotion", "confidence", "emotion_confidence"}, or None when
+        the text has no known words and the classifier has nothing to go on.
+        """
+        return self._batcher.submit(text).result()
+
+    def classify_many(self, texts: List[str]) -> List[Optional[Dict]]:
+        """classify() for several texts, which share batches with any concurrent callers"""
+        futures = [self._batcher.submit(text) for text in texts]
+        return [future.result() for future in futures]
+
+    async def classify_async(self, text: str) -> Optional[Dict]:
+        """classify() for the event loop: waits for the batch without blocking the loop"""
+        return await self._batcher.submit_async(text)
+
+    def close(self):
+        self._batcher.close()
+
+
+logger = logging.getLogger(__name__)
+
+_service = None
+_service_loaded = False
+_service_lock = threading.Lock()
+
+
+def get_sentiment_service() -> Optional[SentimentService]:
+    """
+    Return the process-wide SentimentService, loading it on first call.
+    Returns None when torch or the saved model (SENTIMENT_MODEL_PATH) is missing or the
+    model can't be loaded, in which case callers fall back to the LLM sentiment stages.
+    """
+    global _service, _service_loaded
+    if _service_loaded:
+        return _service
+    with _service_lock:
+        if not _service_loaded:
+            path = os.getenv("SENTIMENT_MODEL_PATH", DEFAULT_MODEL_PATH)
+            try:
+                _service = SentimentService(path) if os.path.exists(path) else None
+            except ImportError as e:
+                logger.warning("Local sentiment classifier disabled, %s needs requirements-sentiment.txt: %s", path, e)
+                _service = None
+            except Exception as e:
+                # A corrupt or mismatched checkpoint won't load on later tries either
+                logger.warning("Local sentiment classifier disabled, %s failed to load: %s", path, e)
+                _service = None
+            _service_loaded = True
+    return _service
+
+
+def load_datasets(gift_card: str, empathetic: str, limit: Optional[int] = None,
+                  corpus_dir: Optional[str] = None) -> Dict:
+    """
+    The sentiment and emotion TextDatasets, sharing one vocabulary. With corpus_dir the
+    tokenised corpora are saved there on the first run and memory-mapped on later ones.
+    """
+    m = load_classifier_module()
+    if corpus_dir:
+        vocab_path = os.path.join(corpus_dir, "vocab.json")
+        prefixes = {name: os.path.join(corpus_dir, name) for name in ("sentiment", "emotion")}
+        if os.path.exists(vocab_path) and all(os.path.exists(p + ".offsets.npy") for p in prefixes.values()):
+            tokenizer = m.SimpleTokenizer.load(vocab_path)
+            print(f"Loaded tokenised corpora from {corpus_dir}.")
+            return {name: m.TextDataset.from_corpus(prefix, tokenizer) for name, prefix in prefixes.items()}
+
+    gift = list(read_gift_card(gift_card, limit))
+    dialogues = list(read_empathetic(empathetic, limit))
+    print(f"Loaded {len(gift)} gift-card reviews and {len(dialogues)} empathetic dialogues.")
+
+    tokenizer = m.SimpleTokenizer()
+    tokenizer.fit_on_texts([text for text, _ in gift] + [text for text, _ in dialogues])
+    datasets = {
+        "sentiment": m.TextDataset([text for text, _ in gift], [label for _, label in gift], tokenizer, max_len=None),
+        "emotion": m.TextDataset([text for text, _ in dialogues], [label for _, label in dialogues], tokenizer,
+                                 max_len=None),
+    }
+    if corpus_dir:
+        os.makedirs(corpus_dir, exist_ok=True)
+        tokenizer.save(vocab_path)
+        for name, dataset in datasets.items():
+            dataset.save(prefixes[name])
+    return datasets
+
+
+def close_sentiment_service():
+    """Stop the batching thread of the process-wide service, if it was loaded"""
+    if _service is not None:
+        _service.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the local sentiment service")
+    parser.add_argument("--gift-card", required=True, help="amazon_reviews_us_Gift_Card_v1_00.tsv")
+    parser.add_argument("--empathetic", required=True, help="emotion-emotion_69k.csv")
+    parser.add_argument("--out", default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--limit", type=int, default=None, help="Rows to read from each file")
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=0, help="DataLoader worker processes")
+    parser.add_argument("--checkpoint-dir", default=None,
+                        help="Save training state here every --checkpoint-every epochs and resume from it")
+    parser.add_argument("--checkpoint-every", type=int, default=1)
+    parser.add_argument("--corpus-dir", default=None,
+                        help="Keep the tokenised corpora here (memory-mapped .npy) and reuse them on later runs")
+    args = parser.parse_args()
+
+    import torch
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    datasets = load_datasets(args.gift_card, args.empathetic, args.limit, args.corpus_dir)
+    tokenizer = datasets["sentiment"].tokenizer
+
+    if args.checkpoint_dir:
+        os.makedirs(args.checkpoint_dir, exist_ok=True)
+    checkpoint = {"vocab": tokenizer.vocab}
+    for name in ("sentiment", "emotion"):
+        print(f"Training {name} head...")
+        checkpoint[name] = train_head(
+            datasets[name], args.epochs, args.batch_size, device, workers=args.workers,
+            checkpoint_path=os.path.join(args.checkpoint_dir, f"{name}.pt") if args.checkpoint_dir else None,
+            checkpoint_every=args.checkpoint_every,
+        )
+
+    torch.save(checkpoint, args.out)
+    print(f"Saved sentiment service to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
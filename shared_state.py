@@ -0,0 +1,157 @@
+"""
+Key-value state shared by every process on the host through one SQLite file (WAL mode),
+for running app.py with several uvicorn workers:
+
+    SHARED_STATE_DB=shared_state.db
+
+Values are JSON. update() is an atomic read-modify-write across processes, and take() is
+a token bucket built on it, so rate limits hold for all workers together.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Optional
+
+
+def shared_state_path() -> Optional[str]:
+    """SHARED_STATE_DB, read on every call so a default set at start-up reaches every module"""
+    return os.getenv("SHARED_STATE_DB") or None
+
+
+class SharedState:
+    def __init__(self, path: str):
+        self.path = path
+        # sqlite3 connections can't be shared between threads, so each thread opens its own
+        self._local = threading.local()
+        with self._transaction() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS shared_state (namespace TEXT NOT NULL, key TEXT NOT NULL, "
+                "value TEXT NOT NULL, expires REAL, PRIMARY KEY (namespace, key))"
+            )
+
+    def _db(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def _transaction(self):
+        # IMMEDIATE takes the write lock up front, so a read-modify-write can't interleave
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    @staticmethod
+    def _read(db: sqlite3.Connection, namespace: str, key: str, now: float) -> Any:
+        row = db.execute(
+            "SELECT value, expires FROM shared_state WHERE namespace = ? AND key = ?", (namespace, key)
+        ).fetchone()
+        if row is None or (row[1] is not None and row[1] <= now):
+            return None
+        return json.loads(row[0])
+
+    @staticmethod
+    def _write(db: sqlite3.Connection, namespace: str, key: str, value: Any, ttl: Optional[float], now: float):
+        if value is None:
+            db.execute("DELETE FROM shared_state WHERE namespace = ? AND key = ?", (namespace, key))
+        else:
+            db.execute(
+                "INSERT OR REPLACE INTO shared_state (namespace, key, value, expires) VALUES (?, ?, ?, ?)",
+                (namespace, key, json.dumps(value, ensure_ascii=False), None if ttl is None else now + ttl),
+            )
+
+    def get(self, namespace: str, key: str) -> Any:
+        """The stored value, or None when missing or expired"""
+        return self._read(self._db(), namespace, key, time.time())
+
+    def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None):
+        """Store value (None deletes), expiring ttl seconds from now"""
+        with self._transaction() as db:
+            self._write(db, namespace, key, value, ttl, time.time())
+
+    def delete(self, namespace: str, key: str):
+        self.set(namespace, key, None)
+
+    def update(self, namespace: str, key: str, fn: Callable[[Any], Any], ttl: Optional[float] = None) -> Any:
+        """
+        Atomically replace the value with fn(value), value being None when missing; fn
+        returning None deletes the key. Returns the new value. fn may run while other
+        processes wait for the lock, so it must be quick.
+        """
+        now = time.time()
+        with self._transaction() as db:
+            value = fn(self._read(db, namespace, key, now))
+            self._write(db, namespace, key, value, ttl, now)
+        return value
+
+    def take(self, bucket: str, rate: float, burst: float, tokens: float = 1.0) -> float:
+        """
+        Take tokens from a token bucket refilled at rate per second up to burst.
+        Returns 0 when they were taken, otherwise the seconds until they will be available.
+        """
+        wait = [0.0]
+
+        def refill_and_take(state):
+            now = time.time()
+            state = state or {"tokens": burst, "updated": now}
+            available = min(burst, state["tokens"] + max(0.0, now - state["updated"]) * rate)
+            if available >= tokens:
+                available -= tokens
+            else:
+                wait[0] = (tokens - available) / rate
+            return {"tokens": available, "updated": now}
+
+        self.update("token_bucket", bucket, refill_and_take)
+        return wait[0]
+
+    def trim(self, namespace: str, max_entries: int) -> int:
+        """
+        Delete all but the max_entries keys of namespace that expire last. For keys that are
+        always written with the same ttl, those are the most recently written ones.
+        """
+        with self._transaction() as db:
+            cursor = db.execute(
+                "DELETE FROM shared_state WHERE namespace = ? AND key NOT IN "
+                "(SELECT key FROM shared_state WHERE namespace = ? ORDER BY expires DESC LIMIT ?)",
+                (namespace, namespace, max(0, max_entries)),
+            )
+        return cursor.rowcount
+
+    def purge(self, namespace: Optional[str] = None) -> int:
+        """Delete expired keys, in one namespace or all of them"""
+        with self._transaction() as db:
+            if namespace is None:
+                cursor = db.execute("DELETE FROM shared_state WHERE expires <= ?", (time.time(),))
+            else:
+                cursor = db.execute(
+                    "DELETE FROM shared_state WHERE namespace = ? AND expires <= ?", (namespace, time.time())
+                )
+        return cursor.rowcount
+
+
+_shared_state = None
+_shared_state_lock = threading.Lock()
+
+
+def shared_state_from_env() -> Optional[SharedState]:
+    """The process-wide SharedState on SHARED_STATE_DB, or None when it isn't set"""
+    global _shared_state
+    path = shared_state_path()
+    if path is None:
+        return None
+    with _shared_state_lock:
+        if _shared_state is None or _shared_state.path != path:
+            _shared_state = SharedState(path)
+    return _shared_state
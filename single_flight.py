@@ -0,0 +1,68 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Tuple
+
+
+class SingleFlight:
+    """
+    Runs one call per key at a time. Callers that ask for a key while its call is still in
+    progress wait for that call's result instead of starting their own.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Any, Future] = {}
+        self._lock = threading.Lock()
+
+    def run(self, key, fn: Callable, *args, **kwargs) -> Tuple[Any, bool]:
+        """
+        fn(*args, **kwargs), or the result of the identical call already running.
+        Returns (result, shared), shared being True when another caller's run was reused.
+        An exception raised by the run reaches every caller waiting on it.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            return future.result(), True
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+
+class AsyncSingleFlight:
+    """
+    SingleFlight for the event loop: start() is only called when no run for the key is in
+    progress, and must return a future. Every caller awaits it through asyncio.shield, so a
+    cancelled caller (a client that went away, a timeout) never cancels the shared run.
+    Must be used from a single event loop.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Any, asyncio.Future] = {}
+
+    def join(self, key, start: Callable[[], asyncio.Future]) -> Tuple[asyncio.Future, bool]:
+        """Returns (awaitable, shared); exceptions raised by start() propagate to this caller only"""
+        future = self._calls.get(key)
+        if future is not None:
+            return asyncio.shield(future), True
+        future = start()
+        self._calls[key] = future
+        future.add_done_callback(lambda _future: self._calls.pop(key, None))
+        return asyncio.shield(future), False
+
+    def in_flight(self) -> int:
+        return len(self._calls)
@@ -0,0 +1,117 @@
+"""
+Typed outputs of the sentiment stages.
+
+Agents answer in free text, so each stage output is parsed into one of these models.
+Output that doesn't validate gets a single repair call in JSON mode (see models.complete_json)
+before the pipeline falls back to passing the raw text along.
+"""
+import json
+import re
+from typing import List, Literal, Optional
+
+from pydantic import BaseModel, Field, ValidationError, field_validator
+
+import metrics
+from models import complete_json
+
+SENTIMENTS = ("Positive", "Negative", "Neutral")
+
+
+class SentimentLabels(BaseModel):
+    sentiment: Literal["Positive", "Negative", "Neutral"]
+    emotion: str = Field(..., min_length=1)
+
+    @field_validator("sentiment", mode="before")
+    @classmethod
+    def _sentiment_case(cls, value):
+        # "positive", " POSITIVE " and the like are the same label
+        if isinstance(value, str):
+            return value.strip().capitalize()
+        return value
+
+    @field_validator("emotion", mode="before")
+    @classmethod
+    def _emotion_case(cls, value):
+        if isinstance(value, str):
+            return value.strip().lower()
+        return value
+
+
+class SentimentAnalysis(SentimentLabels):
+    review: Optional[str] = Field(None, description="Explanation of validation or adjustments")
+    confidence: Optional[float] = Field(None, description="Set by the local classifier")
+
+
+class BatchSentimentItem(SentimentAnalysis):
+    index: int
+
+
+class BatchSentiment(BaseModel):
+    items: List[BatchSentimentItem]
+
+
+class FastReply(SentimentLabels):
+    reply: str = Field(..., min_length=1)
+
+
+def parse_json_output(raw):
+    """Parse the JSON an agent returned, tolerating ```json fences and surrounding prose"""
+    text = re.sub(r"^```(?:json)?\s*|\s*```$", "", raw.strip())
+    try:
+        return json.loads(text)
+    except ValueError:
+        match = re.search(r"(\[.*\]|\{.*\})", text, re.DOTALL)
+        if match is None:
+            raise
+        return json.loads(match.group(1))
+
+
+def parse_stage_output(raw, model):
+    """Validate an agent's raw output as model; None if it isn't valid"""
+    try:
+        data = parse_json_output(raw)
+        if model is BatchSentiment and isinstance(data, list):
+            data = {"items": data}
+        return model.model_validate(data)
+    except (ValueError, TypeError, AttributeError, ValidationError):
+        return None
+
+
+def repair_prompt(raw, model):
+    return [
+        {
+            "role": "system",
+            "content": "You convert text into JSON that matches a JSON schema. Reply with the JSON object only.",
+        },
+        {
+            "role": "user",
+            "content": (
+                f"JSON schema:\n{json.dumps(model.model_json_schema())}\n\n"
+                f"Sentiment labels are exactly one of: {', '.join(SENTIMENTS)}.\n\n"
+                f"Text to convert:\n{raw}"
+            ),
+        },
+    ]
+
+
+def repair_stage_output(raw, model, llm, stage):
+    """One JSON-mode call to llm that rewrites raw as model; None if the result doesn't validate"""
+    try:
+        parsed = parse_stage_output(complete_json(llm, repair_prompt(raw, model)), model)
+    except Exception:
+        parsed = None
+    metrics.stage_output_total.inc(stage=stage, outcome="invalid" if parsed is None else "repaired")
+    return parsed
+
+
+def structured_output(candidates, model, llm, stage):
+    """
+    The first of the raw candidate outputs that validates as model. When none does, the
+    first candidate gets a single repair call; None if that fails too.
+    """
+    for raw in candidates:
+        parsed = parse_stage_output(raw, model)
+        if parsed is not None:
+            metrics.stage_output_total.inc(stage=stage, outcome="valid")
+            return parsed
+    return repair_stage_output(candidates[0], model, llm, stage)
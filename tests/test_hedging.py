@@ -0,0 +1,119 @@
+import threading
+import time
+
+import pytest
+
+from hedging import CircuitBreaker, HedgedCaller, LatencyWindow, is_rate_limited, parse_fallbacks
+
+
+class RateLimitError(Exception):
+    pass
+
+
+def test_latency_window_percentile():
+    window = LatencyWindow(size=10)
+    assert window.percentile(95) is None
+    for seconds in range(1, 21):
+        window.add(float(seconds))
+    # Only the last 10 samples are kept
+    assert window.percentile(0) == 11.0
+    assert window.percentile(95) == 20.0
+    assert window.percentile(50, min_samples=11) is None
+
+
+def test_breaker_opens_after_consecutive_failures_and_lets_one_trial_through():
+    breaker = CircuitBreaker(failure_threshold=2, reset_after=0.05)
+    breaker.record(False)
+    breaker.record(True)
+    breaker.record(False)
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.record(False)
+    assert breaker.state == "open" and not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert breaker.state == "half_open" and not breaker.allow()
+    # A failed trial opens it again straight away
+    breaker.record(False)
+    assert breaker.state == "open"
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record(True)
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_is_rate_limited():
+    assert is_rate_limited(RateLimitError())
+    error = Exception()
+    error.status_code = 429
+    assert is_rate_limited(error)
+    assert not is_rate_limited(ValueError())
+
+
+def test_parse_fallbacks():
+    assert parse_fallbacks("a=b|c, d=e") == {"a": ["b", "c"], "d": ["e"]}
+    assert parse_fallbacks("") == {}
+    with pytest.raises(ValueError):
+        parse_fallbacks("a")
+
+
+def test_failed_call_falls_back_along_the_chain():
+    caller = HedgedCaller(fallbacks={"a": ["b", "c"]}, percentile=0)
+    tried = []
+
+    def attempt(model):
+        tried.append(model)
+        if model != "c":
+            raise RateLimitError(model)
+        return f"answer from {model}"
+
+    assert caller.call("a", attempt) == "answer from c"
+    assert tried == ["a", "b", "c"]
+
+
+def test_last_error_is_raised_when_every_model_fails():
+    caller = HedgedCaller(fallbacks={"a": ["b"]}, percentile=0)
+
+    def attempt(model):
+        raise ValueError(model)
+
+    with pytest.raises(ValueError, match="b"):
+        caller.call("a", attempt)
+
+
+def test_open_breaker_skips_the_model():
+    caller = HedgedCaller(fallbacks={"a": ["b"]}, percentile=0, failure_threshold=1, reset_after=60)
+    caller.breaker("a").record(False)
+    tried = []
+
+    def attempt(model):
+        tried.append(model)
+        return model
+
+    assert caller.call("a", attempt) == "b"
+    assert tried == ["b"]
+    assert caller.breaker_states() == {"a": "open", "b": "closed"}
+
+
+def test_slow_call_is_hedged_and_the_faster_attempt_wins():
+    caller = HedgedCaller(percentile=50, min_samples=1, min_delay=0.01)
+    caller._window("a").add(0.02)
+    release = threading.Event()
+    calls = []
+
+    def attempt(model):
+        calls.append(model)
+        if len(calls) == 1:
+            # The first attempt stalls until the test ends
+            release.wait(5)
+            return "slow"
+        return "fast"
+
+    try:
+        started = time.monotonic()
+        assert caller.call("a", attempt) == "fast"
+        assert time.monotonic() - started < 1.0
+        assert calls == ["a", "a"]
+    finally:
+        release.set()
@@ -0,0 +1,110 @@
+import threading
+import time
+
+import job_worker
+from job_queue import DONE, FAILED, QUEUED, RUNNING, JobQueue
+
+
+def make_queue(tmp_path, **kwargs):
+    return JobQueue(str(tmp_path / "jobs.db"), **kwargs)
+
+
+def test_enqueue_claim_complete(tmp_path):
+    queue = make_queue(tmp_path)
+    ids = queue.enqueue([{"review": "a"}, {"review": "b"}])
+    assert queue.counts() == {QUEUED: 2}
+
+    jobs = queue.claim(5)
+    assert [job["id"] for job in jobs] == ids
+    assert jobs[0]["payload"] == {"review": "a"} and jobs[0]["attempts"] == 1
+    assert queue.claim(5) == []
+
+    assert queue.complete(ids[0], jobs[0]["lease"], {"reply": "hi"})
+    job = queue.get(ids[0])
+    assert job["status"] == DONE and job["result"] == {"reply": "hi"}
+    assert queue.get("unknown") is None
+    assert set(queue.get_many(ids + ["unknown"])) == set(ids)
+
+
+def test_expired_lease_is_claimed_again_and_the_old_lease_is_void(tmp_path):
+    queue = make_queue(tmp_path, visibility_timeout=0.05)
+    [job_id] = queue.enqueue([{}])
+    [first] = queue.claim()
+    time.sleep(0.1)
+    [second] = queue.claim()
+
+    assert second["id"] == job_id and second["attempts"] == 2
+    assert not queue.extend(job_id, first["lease"])
+    assert not queue.complete(job_id, first["lease"], {})
+    assert queue.complete(job_id, second["lease"], {})
+
+
+def test_extend_keeps_a_running_job_leased(tmp_path):
+    queue = make_queue(tmp_path, visibility_timeout=0.1)
+    [job_id] = queue.enqueue([{}])
+    [job] = queue.claim()
+    time.sleep(0.06)
+    assert queue.extend(job_id, job["lease"])
+    time.sleep(0.06)
+    assert queue.claim() == []
+    assert queue.get(job_id)["status"] == RUNNING
+
+
+def test_failures_are_retried_with_backoff_until_max_attempts(tmp_path):
+    queue = make_queue(tmp_path, max_attempts=2, retry_delay=0.05)
+    [job_id] = queue.enqueue([{}])
+    [job] = queue.claim()
+    assert queue.fail(job_id, job["lease"], "boom")
+    assert queue.get(job_id)["status"] == QUEUED
+    assert queue.claim() == []
+
+    time.sleep(0.06)
+    [job] = queue.claim()
+    queue.fail(job_id, job["lease"], "boom again")
+    job = queue.get(job_id)
+    assert job["status"] == FAILED and job["error"] == "boom again" and job["attempts"] == 2
+
+
+def test_lease_expiring_on_the_last_attempt_fails_the_job(tmp_path):
+    queue = make_queue(tmp_path, visibility_timeout=0.05, max_attempts=1)
+    [job_id] = queue.enqueue([{}])
+    queue.claim()
+    time.sleep(0.1)
+    assert queue.claim() == []
+    assert queue.get(job_id)["status"] == FAILED
+
+
+def test_purge_deletes_only_old_finished_jobs(tmp_path):
+    queue = make_queue(tmp_path)
+    done, waiting = queue.enqueue([{}, {}])
+    [job, _] = queue.claim(2)
+    queue.complete(done, job["lease"], {})
+    time.sleep(0.02)
+    assert queue.purge(older_than=0.01) == 1
+    assert queue.get(done) is None and queue.get(waiting) is not None
+
+
+def test_worker_keeps_leases_alive_while_draining(tmp_path, monkeypatch):
+    queue = make_queue(tmp_path, visibility_timeout=0.15)
+    [job_id] = queue.enqueue([{}])
+    claimed = threading.Event()
+
+    def slow_job(queue, job):
+        claimed.set()
+        # Outlives several leases, most of it after stop is set
+        time.sleep(0.6)
+        return queue.complete(job["id"], job["lease"], {"reply": "done"})
+
+    monkeypatch.setattr(job_worker, "run_job", slow_job)
+    stop = threading.Event()
+    worker = threading.Thread(target=job_worker.run_worker, args=(queue, 1, 0.01, stop))
+    worker.start()
+    assert claimed.wait(5)
+    stop.set()
+    time.sleep(0.3)
+    # Another worker finds nothing to take over
+    assert queue.claim() == []
+    worker.join(5)
+
+    job = queue.get(job_id)
+    assert job["status"] == DONE and job["attempts"] == 1
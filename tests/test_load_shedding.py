@@ -0,0 +1,54 @@
+import time
+
+from load_shedding import (CAPPED_ITERATIONS, DEFAULT_STAGE_SECONDS, LEVELS, LITE_MODEL, NO_REVIEWER,
+                           LoadShedder)
+
+STAGES = ["sentiment_task", "sentiment_review_task", "response_task", "reviewer_task"]
+
+
+def test_deadline_from_header_or_default():
+    shedder = LoadShedder(default_deadline=60.0)
+    now = time.monotonic()
+    assert abs(shedder.deadline("1500") - (now + 1.5)) < 0.1
+    assert abs(shedder.deadline(None) - (now + 60.0)) < 0.1
+    assert abs(shedder.deadline("soon") - (now + 60.0)) < 0.1
+
+
+def test_estimate_uses_defaults_then_observations():
+    shedder = LoadShedder(smoothing=0.5)
+    assert shedder.estimate(["response_task"], 0) == DEFAULT_STAGE_SECONDS["response_task"]
+    shedder.observe("response_task", 0, 2.0)
+    shedder.observe("response_task", 0, 4.0)
+    assert shedder.estimate(["response_task"], 0) == 3.0
+    # An unobserved level borrows the nearest lighter one
+    assert shedder.estimate(["response_task"], LITE_MODEL) == 3.0
+
+
+def test_no_reviewer_level_drops_the_reviewer_stage():
+    shedder = LoadShedder()
+    assert shedder.estimate(["reviewer_task"], NO_REVIEWER) == 0.0
+
+
+def test_choose_picks_the_lightest_level_that_fits():
+    shedder = LoadShedder(headroom=1.0)
+    for stage in STAGES:
+        shedder.observe(stage, 0, 10.0)
+        shedder.observe(stage, CAPPED_ITERATIONS, 5.0)
+        shedder.observe(stage, LITE_MODEL, 2.0)
+    now = time.monotonic()
+    assert shedder.choose(STAGES, None) == 0
+    assert shedder.choose(STAGES, now + 100) == 0
+    assert shedder.choose(STAGES, now + 25) == CAPPED_ITERATIONS
+    assert shedder.choose(STAGES, now + 10) == LITE_MODEL
+    assert shedder.choose(STAGES, now + 7) == NO_REVIEWER
+    # Nothing fits: the lightest level is still the best try
+    assert shedder.choose(STAGES, now + 0.1) == len(LEVELS) - 1
+    assert shedder.choose(STAGES, now + 100, minimum=LITE_MODEL) == LITE_MODEL
+
+
+def test_queue_pressure_shrinks_the_budget():
+    shedder = LoadShedder(default_deadline=60.0, pressure=lambda: (12, 4))
+    assert abs(shedder.budget(None) - 15.0) < 1e-9
+    assert shedder.budget(time.monotonic() + 5) <= 5.0
+    shedder.pressure = lambda: (0, 4)
+    assert shedder.budget(None) is None
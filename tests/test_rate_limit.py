@@ -0,0 +1,49 @@
+import time
+
+import pytest
+
+from rate_limit import RateLimiter, TokenBucket, parse_limits
+
+
+def test_bucket_allows_its_burst_at_once():
+    bucket = TokenBucket(rate=1.0, burst=3)
+    assert all(bucket.acquire(timeout=0) for _ in range(3))
+    assert not bucket.acquire(timeout=0)
+
+
+def test_bucket_refills_at_its_rate():
+    bucket = TokenBucket(rate=20.0, burst=1)
+    assert bucket.acquire()
+    started = time.monotonic()
+    assert bucket.acquire()
+    assert time.monotonic() - started >= 0.03
+
+
+def test_acquire_gives_up_when_the_wait_exceeds_the_timeout():
+    bucket = TokenBucket(rate=0.1, burst=1)
+    bucket.acquire()
+    started = time.monotonic()
+    assert not bucket.acquire(timeout=0.5)
+    # It knows up front that 10s is too long, rather than sleeping through the timeout
+    assert time.monotonic() - started < 0.1
+
+
+def test_limiter_holds_back_only_limited_models():
+    limiter = RateLimiter({"slow": 6})
+    assert limiter.limits() == {"slow": 6}
+    assert limiter.acquire("slow", timeout=0)
+    assert not limiter.acquire("slow", timeout=0)
+    assert all(limiter.acquire("unlimited", timeout=0) for _ in range(100))
+
+
+def test_set_limit_zero_removes_the_limit():
+    limiter = RateLimiter({"m": 6})
+    limiter.set_limit("m", 0)
+    assert limiter.limits() == {}
+
+
+def test_parse_limits():
+    assert parse_limits("gemini/a=1000, ollama/b:latest=60,") == {"gemini/a": 1000.0, "ollama/b:latest": 60.0}
+    assert parse_limits("") == {}
+    with pytest.raises(ValueError):
+        parse_limits("no-limit")
@@ -0,0 +1,84 @@
+import time
+
+from response_cache import DATE_MARKER, NAME_MARKER, ResponseCache, normalise
+
+REVIEW = {"product": "Kettle", "review": "Great  kettle!", "profile": "full", "cust_name": "Bob",
+          "purch_date": "2024-01-02"}
+
+
+def reply(text):
+    return {"response": text, "reviewed_response": text, "timings": {"response_task": 1.0}, "prompt_tokens": {}}
+
+
+def test_normalise_collapses_case_and_whitespace():
+    assert normalise("  Great \n KETTLE ") == "great kettle"
+
+
+def test_hit_is_readdressed_to_the_new_customer():
+    cache = ResponseCache("ns")
+    cache.put(REVIEW, reply("Hey Bob! Enjoy the kettle bought on 2024-01-02."))
+
+    hit = cache.get(dict(REVIEW, review="great kettle!", cust_name="Ann", purch_date="2024-03-04"))
+
+    assert hit["reviewed_response"] == "Hey Ann! Enjoy the kettle bought on 2024-03-04."
+    assert hit["name"] == "Ann" and hit["purchase_date"] == "2024-03-04"
+    assert "timings" not in hit
+    assert cache.stats() == {"hits": 1, "disk_hits": 0, "misses": 0, "entries": 1}
+
+
+def test_profiles_and_namespaces_never_share_entries():
+    cache = ResponseCache("ns")
+    cache.put(REVIEW, reply("Hey Bob!"))
+    assert cache.get(dict(REVIEW, profile="fast")) is None
+    assert ResponseCache("other").key(REVIEW) != cache.key(REVIEW)
+
+
+def test_name_in_fixed_wording_is_cached_for_that_customer_only():
+    cache = ResponseCache("ns", fixed_text="Includes contact details: Customer Service Contact")
+    text = "Hey Customer! Thanks.\nCustomer Service Contact"
+    cache.put(dict(REVIEW, cust_name="Customer"), reply(text))
+
+    assert cache.get(dict(REVIEW, cust_name="Bob")) is None
+    assert cache.get(dict(REVIEW, cust_name="Customer"))["response"] == text
+
+
+def test_name_outside_the_greeting_or_repeated_is_not_templated():
+    cache = ResponseCache("ns")
+    assert cache._template(reply("Hi there! Thanks, Bob."), REVIEW) is None
+    assert cache._template(reply("Hey Bob! Bob, thanks."), REVIEW) is None
+    template = cache._template(reply("Hey Bob! Bought on 2024-01-02."), REVIEW)
+    assert template["response"] == f"Hey {NAME_MARKER}! Bought on {DATE_MARKER}."
+
+
+def test_adapt_refuses_other_customers_when_not_templatable():
+    cache = ResponseCache("ns")
+    result = reply("Hi there! Thanks, Bob.")
+    assert cache.adapt(result, REVIEW, dict(REVIEW, cust_name="Ann")) is None
+    assert cache.adapt(result, REVIEW, REVIEW)["response"] == "Hi there! Thanks, Bob."
+
+
+def test_lru_evicts_the_least_recently_used():
+    cache = ResponseCache("ns", max_entries=2)
+    for review in ("a", "b"):
+        cache.put(dict(REVIEW, review=review), reply("Hey Bob!"))
+    assert cache.get(dict(REVIEW, review="a")) is not None
+    cache.put(dict(REVIEW, review="c"), reply("Hey Bob!"))
+
+    assert cache.get(dict(REVIEW, review="b")) is None
+    assert cache.get(dict(REVIEW, review="a")) is not None
+
+
+def test_entries_expire_after_ttl():
+    cache = ResponseCache("ns", ttl=0.05)
+    cache.put(REVIEW, reply("Hey Bob!"))
+    time.sleep(0.1)
+    assert cache.get(REVIEW) is None
+
+
+def test_sqlite_tier_survives_a_new_instance(tmp_path):
+    path = str(tmp_path / "cache.db")
+    ResponseCache("ns", db_path=path).put(REVIEW, reply("Hey Bob!"))
+
+    cache = ResponseCache("ns", db_path=path)
+    assert cache.get(dict(REVIEW, cust_name="Ann"))["response"] == "Hey Ann!"
+    assert cache.stats()["disk_hits"] == 1
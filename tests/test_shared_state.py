@@ -0,0 +1,89 @@
+import multiprocessing
+import time
+
+import shared_state
+from rate_limit import RateLimiter, SharedTokenBucket
+from shared_state import SharedState, shared_state_from_env
+
+
+def increment(path, times):
+    state = SharedState(path)
+    for _ in range(times):
+        state.update("counters", "n", lambda value: (value or 0) + 1)
+
+
+def test_get_set_delete_and_ttl(tmp_path):
+    state = SharedState(str(tmp_path / "state.db"))
+    assert state.get("ns", "k") is None
+    state.set("ns", "k", {"a": [1, 2]})
+    assert state.get("ns", "k") == {"a": [1, 2]}
+    assert state.get("other", "k") is None
+    state.delete("ns", "k")
+    assert state.get("ns", "k") is None
+
+    state.set("ns", "short", 1, ttl=0.05)
+    state.set("ns", "long", 2, ttl=60)
+    time.sleep(0.1)
+    assert state.get("ns", "short") is None
+    assert state.purge("ns") == 1
+    assert state.get("ns", "long") == 2
+
+
+def test_update_returning_none_deletes(tmp_path):
+    state = SharedState(str(tmp_path / "state.db"))
+    state.set("ns", "k", 1)
+    assert state.update("ns", "k", lambda value: None) is None
+    assert state.get("ns", "k") is None
+
+
+def test_update_is_atomic_across_processes(tmp_path):
+    path = str(tmp_path / "state.db")
+    SharedState(path)
+    processes = [multiprocessing.Process(target=increment, args=(path, 100)) for _ in range(3)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(60)
+    assert SharedState(path).get("counters", "n") == 300
+
+
+def test_trim_keeps_the_entries_written_last(tmp_path):
+    state = SharedState(str(tmp_path / "state.db"))
+    for key in "abcd":
+        state.set("sessions", key, {}, ttl=60)
+        time.sleep(0.01)
+    state.set("sessions", "a", {}, ttl=60)
+    state.set("other", "x", 1)
+
+    assert state.trim("sessions", 2) == 2
+    assert [key for key in "abcd" if state.get("sessions", key) is not None] == ["a", "d"]
+    assert state.get("other", "x") == 1
+
+
+def test_take_is_a_token_bucket(tmp_path):
+    state = SharedState(str(tmp_path / "state.db"))
+    assert state.take("m", rate=10.0, burst=2) == 0
+    assert state.take("m", rate=10.0, burst=2) == 0
+    wait = state.take("m", rate=10.0, burst=2)
+    assert 0 < wait <= 0.1
+    time.sleep(wait + 0.01)
+    assert state.take("m", rate=10.0, burst=2) == 0
+
+
+def test_limiter_buckets_are_shared_between_instances(tmp_path):
+    state = SharedState(str(tmp_path / "state.db"))
+    first, second = RateLimiter({"m": 6}, state), RateLimiter({"m": 6}, state)
+    assert isinstance(first._buckets["m"], SharedTokenBucket)
+    assert first.acquire("m", timeout=0)
+    # The other limiter, as in another process, finds the bucket already empty
+    assert not second.acquire("m", timeout=0)
+
+
+def test_from_env_follows_the_variable(tmp_path, monkeypatch):
+    monkeypatch.setattr(shared_state, "_shared_state", None)
+    monkeypatch.delenv("SHARED_STATE_DB", raising=False)
+    assert shared_state_from_env() is None
+    path = str(tmp_path / "state.db")
+    monkeypatch.setenv("SHARED_STATE_DB", path)
+    state = shared_state_from_env()
+    assert state.path == path and shared_state_from_env() is state
@@ -0,0 +1,85 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from single_flight import AsyncSingleFlight, SingleFlight
+
+
+def test_concurrent_callers_share_one_run():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def slow(value):
+        calls.append(value)
+        release.wait(5)
+        return value * 2
+
+    with ThreadPoolExecutor(4) as pool:
+        futures = [pool.submit(flight.run, "key", slow, 21) for _ in range(4)]
+        # Give the other three time to find the leader's run in progress
+        time.sleep(0.2)
+        release.set()
+        results = [future.result() for future in futures]
+
+    assert calls == [21]
+    assert [result for result, _ in results] == [42] * 4
+    assert sorted(shared for _, shared in results) == [False, True, True, True]
+    assert flight.in_flight() == 0
+
+
+def test_later_calls_run_again():
+    flight = SingleFlight()
+    assert flight.run("key", lambda: 1) == (1, False)
+    assert flight.run("key", lambda: 2) == (2, False)
+
+
+def test_errors_reach_every_waiter():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+
+    def failing():
+        started.set()
+        release.wait(5)
+        raise RuntimeError("boom")
+
+    with ThreadPoolExecutor(2) as pool:
+        leader = pool.submit(flight.run, "key", failing)
+        started.wait(5)
+        follower = pool.submit(flight.run, "key", failing)
+        time.sleep(0.2)
+        release.set()
+        for future in (leader, follower):
+            with pytest.raises(RuntimeError, match="boom"):
+                future.result()
+    assert flight.in_flight() == 0
+
+
+def test_async_join_shares_the_run_and_survives_cancellation():
+    async def scenario():
+        flight = AsyncSingleFlight()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        starts = []
+
+        def start():
+            starts.append(1)
+            return future
+
+        first, shared_first = flight.join("key", start)
+        second, shared_second = flight.join("key", start)
+        # A caller that gives up must not cancel the run the others wait for
+        first.cancel()
+        future.set_result("reply")
+        result = await second
+        await asyncio.sleep(0)
+        return starts, shared_first, shared_second, result, future.cancelled(), flight.in_flight()
+
+    starts, shared_first, shared_second, result, cancelled, in_flight = asyncio.run(scenario())
+    assert starts == [1]
+    assert (shared_first, shared_second) == (False, True)
+    assert result == "reply" and not cancelled
+    assert in_flight == 0
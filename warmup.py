@@ -0,0 +1,74 @@
+"""
+Background warm-up of the slow one-off work the server would otherwise do on the first
+reviews: importing crewai, creating the LLM clients, loading the local classifier.
+
+The app accepts connections straight away and serves / and /static while the steps run on
+a background thread; /health/ready answers 503 until they have all succeeded. Failed steps
+(an LLM endpoint that was briefly down at boot, say) are retried with growing delays.
+"""
+import threading
+import time
+from typing import Callable, Dict, List, Tuple
+
+
+class WarmUp:
+    """
+    Runs named steps in order on a daemon thread and records how long each took. Steps that
+    fail are run again after retry_delay seconds, doubled each time up to max_retry_delay.
+    """
+
+    def __init__(self, steps: List[Tuple[str, Callable[[], object]]], retry_delay: float = 1.0,
+                 max_retry_delay: float = 60.0):
+        self.steps = steps
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.state = "pending"  # pending, running, ready or failed
+        self.timings: Dict[str, float] = {}
+        self.errors: Dict[str, str] = {}
+        self._thread = None
+        self._done = threading.Event()
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name="warm-up", daemon=True)
+            self._thread.start()
+
+    def run(self):
+        self.state = "running"
+        pending = list(self.steps)
+        delay = self.retry_delay
+        while True:
+            pending = [(name, step) for name, step in pending if not self._run_step(name, step)]
+            # Requests that need a failed step meanwhile try it themselves
+            self.state = "failed" if pending else "ready"
+            self._done.set()
+            if not pending:
+                return
+            time.sleep(delay)
+            delay = min(delay * 2, self.max_retry_delay)
+
+    def _run_step(self, name: str, step: Callable[[], object]) -> bool:
+        started = time.monotonic()
+        try:
+            step()
+        except Exception as e:
+            self.errors[name] = f"{type(e).__name__}: {e}"
+            return False
+        finally:
+            self.timings[name] = round(time.monotonic() - started, 3)
+        self.errors.pop(name, None)
+        return True
+
+    def wait(self, timeout: float = None) -> bool:
+        """Block until the steps have run once; False on timeout"""
+        return self._done.wait(timeout)
+
+    def status(self) -> Dict:
+        status = {"state": self.state, "timings": dict(self.timings)}
+        if self.errors:
+            status["errors"] = dict(self.errors)
+        return status